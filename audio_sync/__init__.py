@@ -13,13 +13,25 @@
 #     limitations under the License.
 
 """Package to measure audio sync."""
-import wave
 
-from audio_sync import analyzer
-from audio_sync import wave_reader
+from audio_sync import analysis_settings
+from audio_sync import lazy_loader
+from audio_sync import profiling
 
+# The analysis modules import numpy, which takes longer than most runs of the
+# CLI that don't analyze anything, so they are imported when first used. Once
+# imported, the modules themselves replace these attributes.
+analyzer = lazy_loader.LazyLoader('analyzer', globals(), 'audio_sync.analyzer')
+cache = lazy_loader.LazyLoader('cache', globals(), 'audio_sync.cache')
+wave_reader = lazy_loader.LazyLoader('wave_reader', globals(),
+                                     'audio_sync.wave_reader')
 
-DEFAULT_TEST_AUDIO_SETTINGS = analyzer.AnalysisSettings(
+AnalysisSettings = analysis_settings.AnalysisSettings
+
+# Version of the package, results cached by other versions are not used
+__version__ = '1.1.0'
+
+DEFAULT_TEST_AUDIO_SETTINGS = AnalysisSettings(
     period_secs=0.1,
     pulse_duration_secs=0.002,
     dropout_threshold=0.5,
@@ -27,8 +39,14 @@ DEFAULT_TEST_AUDIO_SETTINGS = analyzer.AnalysisSettings(
     min_silence_len_secs=0.001)
 
 
+def _OpenWaveReader(wave_path, use_mmap):
+  """Opens a WaveReader, or a MmapWaveReader if |use_mmap| is True."""
+  return wave_reader.OpenWaveReader(wave_path, use_mmap)
+
+
 def AnalyzeAudios(ref_signal_path, act_signal_path,
-                  settings=DEFAULT_TEST_AUDIO_SETTINGS):
+                  settings=DEFAULT_TEST_AUDIO_SETTINGS, use_mmap=False,
+                  jobs=1, analysis_cache=None, instrumentation=None):
   """Get the latencies between the given files.
 
   Args:
@@ -36,6 +54,18 @@ def AnalyzeAudios(ref_signal_path, act_signal_path,
     act_signal_path: (string) absolute path to handcrafted actual file.
     settings: (AnalysisSettings) the properties of the audio
       played by the sources.
+    use_mmap: (bool) whether to read the files through memory maps (see
+      wave_reader.MmapWaveReader), which is faster for long recordings.
+    jobs: (int) number of processes analyzing chunks of the files in
+      parallel, or None to use every CPU.
+    analysis_cache: (cache.DirectoryCache) if given, the results are kept in
+      it, and returned without analysis the next time the same files are
+      analyzed with the same settings. The pulses located in the reference
+      file are kept too, and reused when it is analyzed with another actual
+      file.
+    instrumentation: (profiling.Instrumentation) if given, the time spent in
+      each stage of the analysis and counters of what was analyzed are
+      added to it.
 
   Returns:
     A 2-tuple:
@@ -44,12 +74,104 @@ def AnalyzeAudios(ref_signal_path, act_signal_path,
     - Element 1: (list of tuple(float, float)) detected dropouts with the
       format (<dropout_start_secs>, <dropout_end_secs>).
   """
-  ref_wave_reader = wave_reader.WaveReader(wave.open(ref_signal_path))
-  act_wave_reader = wave_reader.WaveReader(wave.open(act_signal_path))
+  ref_wave_reader = _OpenWaveReader(ref_signal_path, use_mmap)
+  act_wave_reader = _OpenWaveReader(act_signal_path, use_mmap)
+
+  try:
+    ref_pulse_index = None
+    if analysis_cache is not None:
+      results_name = cache.GetResultsName(ref_signal_path, act_signal_path,
+                                          settings)
+      results = cache.LoadResults(analysis_cache, results_name)
+      if results is not None:
+        if instrumentation is not None:
+          instrumentation.Count(profiling.COUNTER_CACHED_RESULTS)
+        return results
+
+      pulse_index_name = cache.GetPulseIndexName(
+          ref_signal_path, ref_wave_reader.GetSamplingRate(), settings)
+      ref_pulse_index = cache.LoadPulseIndex(analysis_cache,
+                                             pulse_index_name) or {}
+      num_cached_chunks = len(ref_pulse_index)
+
+    if jobs != 1:
+      results = analyzer.DetermineLatenciesAndDropoutsInParallel(
+          ref_signal_path, act_signal_path, settings, jobs=jobs,
+          use_mmap=use_mmap, ref_pulse_index=ref_pulse_index,
+          instrumentation=instrumentation)
+    else:
+      results = analyzer.DetermineLatenciesAndDropouts(
+          ref_wave_reader, act_wave_reader, settings,
+          ref_pulse_index=ref_pulse_index, instrumentation=instrumentation)
+
+    if (ref_pulse_index is not None and
+        len(ref_pulse_index) > num_cached_chunks):
+      cache.StorePulseIndex(analysis_cache, pulse_index_name, ref_pulse_index)
+    if analysis_cache is not None:
+      cache.StoreResults(analysis_cache, results_name, results)
+    return results
+  finally:
+    act_wave_reader.Close()
+    ref_wave_reader.Close()
+
+
+def IterAnalyzeAudios(ref_signal_path, act_signal_path,
+                      settings=DEFAULT_TEST_AUDIO_SETTINGS, use_mmap=False,
+                      instrumentation=None):
+  """Get the latencies between the given files as they are analyzed.
+
+  The files are analyzed chunk by chunk in this process, so the results of
+  the beginning of long recordings are available before the end is read.
+
+  Args:
+    ref_signal_path: (string) absolute path to handcrafted reference file.
+    act_signal_path: (string) absolute path to handcrafted actual file.
+    settings: (AnalysisSettings) the properties of the audio
+      played by the sources.
+    use_mmap: (bool) whether to read the files through memory maps (see
+      wave_reader.MmapWaveReader), which is faster for long recordings.
+    instrumentation: (profiling.Instrumentation) if given, the time spent in
+      each stage of the analysis and counters of what was analyzed are
+      added to it.
 
+  Yields:
+    A 2-tuple with the latencies and dropouts of each chunk, in the format
+    returned by AnalyzeAudios(), see analyzer.IterLatenciesAndDropouts().
+  """
+  ref_wave_reader = _OpenWaveReader(ref_signal_path, use_mmap)
+  act_wave_reader = _OpenWaveReader(act_signal_path, use_mmap)
   try:
-    return analyzer.DetermineLatenciesAndDropouts(
-        ref_wave_reader, act_wave_reader, settings)
+    for results in analyzer.IterLatenciesAndDropouts(
+        ref_wave_reader, act_wave_reader, settings,
+        instrumentation=instrumentation):
+      yield results
   finally:
     act_wave_reader.Close()
     ref_wave_reader.Close()
+
+
+def AnalyzeMultichannelAudio(signal_path, ref_channel, act_channels,
+                             settings=DEFAULT_TEST_AUDIO_SETTINGS,
+                             use_mmap=False):
+  """Get the latencies between channels of the given file.
+
+  Args:
+    signal_path: (string) absolute path to an interleaved multichannel file.
+    ref_channel: (int) index of the channel with the reference signal.
+    act_channels: (list of int) indexes of the channels with actual signals.
+    settings: (AnalysisSettings) the properties of the audio
+      played by the sources.
+    use_mmap: (bool) whether to read the file through a memory map (see
+      wave_reader.MmapWaveReader), which is faster for long recordings.
+
+  Returns:
+    (list of 2-tuple) for each of |act_channels|, the latencies and dropouts
+    in the format returned by AnalyzeAudios().
+  """
+  multichannel_wave_reader = _OpenWaveReader(signal_path, use_mmap)
+
+  try:
+    return analyzer.DetermineMultichannelLatenciesAndDropouts(
+        multichannel_wave_reader, ref_channel, act_channels, settings)
+  finally:
+    multichannel_wave_reader.Close()
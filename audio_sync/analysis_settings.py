@@ -0,0 +1,42 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Settings of the analysis, which can be used without importing it.
+
+They are also available from the analyzer module.
+"""
+
+import collections
+
+AnalysisSettings = collections.namedtuple(
+    'AnalysisSettings', ['period_secs', 'pulse_duration_secs',
+                         'dropout_threshold', 'silence_threshold',
+                         'min_silence_len_secs', 'pulse_search'])
+
+# Every sample is searched for the peaks.
+PULSE_SEARCH_FULL = 'full'
+# Only the samples of the blocks of a decimated envelope that reach the
+# dropout threshold are searched for the peaks (see _PulseCandidates in
+# analyzer). The results are the same as for PULSE_SEARCH_FULL. Finding the
+# blocks reads every sample, so the analysis is not faster.
+PULSE_SEARCH_DECIMATED = 'decimated'
+# Each pulse is predicted from the previous ones and the estimated drift of
+# the period, and only a guard band around the prediction is searched (see
+# _PulseTracker in analyzer). Every sample is searched again when the pulse
+# is not in the band.
+PULSE_SEARCH_TRACKED = 'tracked'
+PULSE_SEARCHES = (PULSE_SEARCH_FULL, PULSE_SEARCH_DECIMATED,
+                  PULSE_SEARCH_TRACKED)
+
+AnalysisSettings.__new__.__defaults__ = (PULSE_SEARCH_FULL,)
@@ -20,9 +20,18 @@ must have one peak every period and low volume noise or silence between
 the peaks. See README.md for a description of how the algorithm works.
 """
 
+import bisect
 import collections
 import math
+import multiprocessing
 
+import numpy
+
+from audio_sync import analysis_settings
+from audio_sync import interval_set
+from audio_sync import latency_series
+from audio_sync import latency_summary
+from audio_sync import profiling
 from audio_sync import wave_reader
 
 # One half as named constant
@@ -31,10 +40,28 @@ HALF = 0.5
 BITS_PER_BYTE = 8
 # How many windows shall be evaluated as one chunk
 WINDOWS_PER_CHUNK = 120
-# Timegap to be seen as no gap
+# Timegap to be seen as no gap, under which dropouts are merged (see
+# interval_set.IntervalSet)
 NO_GAP_TIME_SECS = 0.001
-
-# Holder for the latency measurement settings values.
+# Duration of the blocks of the envelope used by the decimated pulse search
+DECIMATION_BLOCK_SECS = 0.001
+# Half width of the band searched around each predicted pulse by the tracked
+# pulse search, in pulse durations
+TRACKING_GUARD_PULSES = 2
+# Parts per million
+PPM = 1e-6
+# How many ranges of chunks each process is given by
+# DetermineLatenciesAndDropoutsInParallel(), so that processes finishing early
+# can take over ranges of the others
+CHUNK_RANGES_PER_JOB = 4
+# How many windows StreamingAnalyzer keeps in memory
+STREAMING_WINDOWS_PER_BUFFER = 8
+# How many windows before the next pulse search StreamingAnalyzer keeps, as
+# they may still be needed for dropout detection
+STREAMING_WINDOWS_KEPT = 2
+
+# Holder for the latency measurement settings values, defined in the
+# analysis_settings module so that they can be used without importing numpy.
 #
 # period_secs: (float) distance in secs between two consecutive peaks.
 # pulse_duration_secs: (float) Duration of the sine pulse in seconds.
@@ -44,10 +71,14 @@ NO_GAP_TIME_SECS = 0.001
 #   silence.
 # min_silence_len_secs: (float) minimum length of silence, so that it is
 #   interpreted as such.
-AnalysisSettings = collections.namedtuple(
-    'AnalysisSettings', ['period_secs', 'pulse_duration_secs',
-                         'dropout_threshold', 'silence_threshold',
-                         'min_silence_len_secs'])
+# pulse_search: (str) how the pulses are located, one of PULSE_SEARCHES.
+#   Optional, defaults to PULSE_SEARCH_FULL.
+AnalysisSettings = analysis_settings.AnalysisSettings
+
+PULSE_SEARCH_FULL = analysis_settings.PULSE_SEARCH_FULL
+PULSE_SEARCH_DECIMATED = analysis_settings.PULSE_SEARCH_DECIMATED
+PULSE_SEARCH_TRACKED = analysis_settings.PULSE_SEARCH_TRACKED
+PULSE_SEARCHES = analysis_settings.PULSE_SEARCHES
 
 
 class InputSignalException(Exception):
@@ -55,38 +86,357 @@ class InputSignalException(Exception):
   pass
 
 
-def _GetValueAndIndexForMax(data_array):
-  """Helper function to get both max and argmax of a given array.
+def _FindValidWindows(data_array, samples_per_pulse, win_size,
+                      dropout_threshold, max_windows=None):
+  """Locates the pulses of all valid windows in a single vectorized pass.
+
+  |data_array| is split in windows of |win_size| samples starting every
+  half window (i.e., the same windows _GetNextWinStart walks through). The
+  maximum and minimum of all the windows are computed at once on a strided
+  view of the array, so no samples are copied. The validity rules are the
+  ones described in _GetNextWinStart.
 
   Args:
-    data_array: (list) array with the values.
+    data_array: (numpy.ndarray) containing the PCM samples from [-1, 1].
+    samples_per_pulse: (int) the max number of samples between min and max peak.
+    win_size: (int) number of samples of one period of the reference signal.
+    dropout_threshold: (float) Min peak value. All values below that will be
+      interpreted as dropout.
+    max_windows: (int) if given, only the first |max_windows| windows are
+      evaluated.
 
   Returns:
-    (tuple) containing max(data_array) and argmax(data_array).
+    (numpy.ndarray of int) for each valid window, in ascending order, the
+    start index of the window that has the pulse at its center.
+  """
+  num_samples = len(data_array)
+  half_win_size = int(math.floor(HALF * win_size))
+
+  num_windows = int(math.ceil(float(num_samples) / half_win_size))
+  if max_windows is not None:
+    num_windows = min(num_windows, max_windows)
+  if num_windows <= 0:
+    return numpy.zeros(0, dtype=int)
+
+  # Windows fully contained in the array are evaluated on a strided view,
+  # the (at most a couple of) truncated ones at the end one by one.
+  num_full_windows = 0
+  if num_samples >= win_size:
+    num_full_windows = min((num_samples - win_size) // half_win_size + 1,
+                           num_windows)
+  windows = numpy.lib.stride_tricks.as_strided(
+      data_array, shape=(num_full_windows, win_size),
+      strides=(half_win_size * data_array.strides[0], data_array.strides[0]))
+  rows = numpy.arange(num_full_windows)
+  ind_win_max = windows.argmax(axis=1)
+  ind_win_min = windows.argmin(axis=1)
+  value_win_max = windows[rows, ind_win_max]
+  value_win_min = windows[rows, ind_win_min]
+
+  if num_full_windows < num_windows:
+    tails = [data_array[ind_win_start:ind_win_start + win_size]
+             for ind_win_start in range(num_full_windows * half_win_size,
+                                        num_windows * half_win_size,
+                                        half_win_size)]
+    ind_tail_max = [tail.argmax() for tail in tails]
+    ind_tail_min = [tail.argmin() for tail in tails]
+    ind_win_max = numpy.append(ind_win_max, ind_tail_max)
+    ind_win_min = numpy.append(ind_win_min, ind_tail_min)
+    value_win_max = numpy.append(
+        value_win_max, [t[i] for t, i in zip(tails, ind_tail_max)])
+    value_win_min = numpy.append(
+        value_win_min, [t[i] for t, i in zip(tails, ind_tail_min)])
+
+  valid = ((ind_win_max != 0) &
+           (value_win_max >= dropout_threshold) &
+           (numpy.abs(value_win_min) >= dropout_threshold) &
+           (numpy.abs(ind_win_min - ind_win_max) <= samples_per_pulse))
+
+  win_starts = numpy.arange(num_windows) * half_win_size
+  return (win_starts + ind_win_max - half_win_size)[valid]
+
+
+class _PulseCandidates(object):
+  """Samples of a signal that can be the peaks of a pulse.
+
+  The signal is split in blocks of |block_size| samples, and the max-abs
+  value of each block gives a decimated envelope. Only the samples of the
+  blocks reaching |threshold| are candidates. Every sample whose absolute
+  value reaches |threshold| is a candidate, so whenever the max of the
+  candidates of a range of samples reaches the threshold, or their min is
+  at or below -threshold, it is the max (or min) of the whole range, and its
+  first candidate is its first sample.
+
+  The pulse search only looks at the candidates, which are a small fraction
+  of the samples since the pulses are short compared to the period.
+  Selecting them still reads every sample, which costs about as much as the
+  search it saves.
   """
-  value_max = max(data_array)
-  ind_max = data_array.index(value_max)
-
-  return (value_max, ind_max)
-
 
-def _GetValueAndIndexForMin(data_array):
-  """Helper function to get both min and argmin of a given array.
+  def __init__(self, signal, block_size, threshold):
+    """Computes the envelope of |signal| and selects the candidates.
+
+    Args:
+      signal: (numpy.ndarray) signal normalized to [-1, 1].
+      block_size: (int) number of samples of each block of the envelope.
+      threshold: (float) min max-abs value of the blocks with candidates.
+    """
+    num_samples = len(signal)
+    # The envelope of a block reaches the threshold if any of its samples
+    # does, which is faster to find than the envelope itself.
+    blocks = numpy.flatnonzero((signal >= threshold) |
+                               (signal <= -threshold)) // block_size
+    if len(blocks):
+      blocks = blocks[numpy.append(True, blocks[1:] != blocks[:-1])]
+
+    indexes = (blocks[:, numpy.newaxis] * block_size +
+               numpy.arange(block_size)).ravel()
+    self._num_samples = num_samples
+    self._indexes = indexes[indexes < num_samples]
+    self._values = signal[self._indexes]
+    # Searching a list with bisect is much faster than numpy.searchsorted()
+    # for the single windows the search mostly looks at.
+    self._index_list = self._indexes.tolist()
+
+  def __len__(self):
+    return self._num_samples
+
+  def _GetRange(self, start, end):
+    """Gets the positions of the candidates in [start, end)."""
+    ind_first = bisect.bisect_left(self._index_list, start)
+    return ind_first, bisect.bisect_left(self._index_list, end, ind_first)
+
+  def ArgMax(self, start, end):
+    """Gets the max of the samples in [start, end).
+
+    Args:
+      start: (int) first sample.
+      end: (int) sample after the last one.
+
+    Returns:
+      A 2-tuple with the index of the first max relative to |start|, and
+      its value. Both are exact if the value reaches the threshold. If there
+      are no candidates in the range, the value is -inf.
+    """
+    ind_first, ind_last = self._GetRange(start, end)
+    if ind_first == ind_last:
+      return 0, float('-inf')
+    ind_max = ind_first + int(self._values[ind_first:ind_last].argmax())
+    return int(self._indexes[ind_max]) - start, self._values[ind_max]
+
+  def FindValidWindows(self, start, samples_per_pulse, win_size,
+                       dropout_threshold, max_windows=None):
+    """Locates the pulses of all valid windows like _FindValidWindows().
+
+    Args:
+      start: (int) first sample of the data to search, as _FindValidWindows()
+        would be given signal[start:].
+      samples_per_pulse: (int) the max number of samples between min and max
+        peak.
+      win_size: (int) number of samples of one period of the reference signal.
+      dropout_threshold: (float) Min peak value, which must not be below the
+        threshold of the candidates.
+      max_windows: (int) if given, only the first |max_windows| windows are
+        evaluated.
+
+    Returns:
+      (numpy.ndarray of int) the same as _FindValidWindows(), relative to
+      |start|.
+    """
+    half_win_size = int(math.floor(HALF * win_size))
+
+    num_windows = int(math.ceil(float(self._num_samples - start) /
+                                half_win_size))
+    if max_windows is not None:
+      num_windows = min(num_windows, max_windows)
+    if num_windows <= 0:
+      return numpy.zeros(0, dtype=int)
+
+    ret = []
+    for win_start in range(start, start + num_windows * half_win_size,
+                           half_win_size):
+      win_end = min(win_start + win_size, self._num_samples)
+      ind_first, ind_last = self._GetRange(win_start, win_end)
+      if ind_first == ind_last:
+        continue
+      values = self._values[ind_first:ind_last]
+      ind_values_max = int(values.argmax())
+      ind_values_min = int(values.argmin())
+      value_min = values[ind_values_min]
+      # The samples which are not candidates are between -threshold and
+      # threshold, so unless every sample of the window is a candidate, only
+      # a min at or below -threshold is the min of the window.
+      if (value_min > -dropout_threshold and
+          ind_last - ind_first < win_end - win_start):
+        continue
+      ind_win_max = self._indexes[ind_first + ind_values_max] - win_start
+      ind_win_min = self._indexes[ind_first + ind_values_min] - win_start
+      if (ind_win_max != 0 and
+          values[ind_values_max] >= dropout_threshold and
+          abs(value_min) >= dropout_threshold and
+          abs(ind_win_min - ind_win_max) <= samples_per_pulse):
+        ret.append(win_start - start + ind_win_max - half_win_size)
+    return numpy.array(ret, dtype=int)
+
+
+def _CreatePulseCandidates(signal, samp_rate, settings):
+  """Creates the _PulseCandidates of |signal| if |settings| ask for them.
 
   Args:
-    data_array: (list) array with the values.
+    signal: (numpy.ndarray) signal normalized to [-1, 1].
+    samp_rate: (int) the sampling frequency of the signal in Hz.
+    settings: (AnalysisSettings) analysis settings.
 
   Returns:
-    (tuple) containing min(data_array) and argmin(data_array).
+    (_PulseCandidates) the candidates, or None if every sample is searched.
+
+  Raises:
+    ValueError: if the pulse search of |settings| is unknown.
+  """
+  if settings.pulse_search in (PULSE_SEARCH_FULL, PULSE_SEARCH_TRACKED):
+    return None
+  if settings.pulse_search == PULSE_SEARCH_DECIMATED:
+    return _PulseCandidates(
+        signal, max(int(samp_rate * DECIMATION_BLOCK_SECS), 1),
+        settings.dropout_threshold)
+  raise ValueError('Unknown pulse search %r, expected one of %s.' % (
+      settings.pulse_search, ', '.join(PULSE_SEARCHES)))
+
+
+class _PulseTracker(object):
+  """Predicts the pulses of a reference signal from the previous ones.
+
+  The pulses are located by their peak, as an absolute sample index in the
+  signal, so the tracker can follow them across chunks. The period is
+  estimated from the pulses located since the last time one was not where it
+  was predicted (the anchor), combined with the estimate from before that,
+  so that it converges on the actual period of the signal, which differs
+  from period_secs when the clocks of the generator and of the recorder
+  drift apart.
+
+  Only TRACKING_GUARD_PULSES pulse durations around each predicted peak are
+  searched. A band whose max and min don't make a valid window (see
+  _GetNextWinStart()), or whose max is on its border, means the lock was
+  lost, and the caller searches every sample again. On signals whose noise
+  stays below the pulses, the same pulses are located as with the full
+  search.
   """
-  value_min = min(data_array)
-  ind_min = data_array.index(value_min)
 
-  return (value_min, ind_min)
+  def __init__(self, samp_rate, settings,
+               instrumentation=profiling.NULL_INSTRUMENTATION):
+    """Initializer.
+
+    Args:
+      samp_rate: (int) the sampling frequency of the signal in Hz.
+      settings: (AnalysisSettings) analysis settings.
+      instrumentation: (profiling.Instrumentation) the tracked pulses, the
+        lost locks and the drift are recorded in it.
+    """
+    self._nominal_period = float(samp_rate * settings.period_secs)
+    self._samples_per_pulse = settings.pulse_duration_secs * samp_rate
+    self._guard = int(TRACKING_GUARD_PULSES * self._samples_per_pulse) + 1
+    self._dropout_threshold = settings.dropout_threshold
+    self._instrumentation = instrumentation
+    # Estimate of the period from before the anchor, and the number of
+    # periods it is based on.
+    self._prior_period = self._nominal_period
+    self._prior_periods = 0
+    self._period = self._nominal_period
+    # Peak of the anchor pulse, and number of periods from it to the last
+    # pulse.
+    self._anchor = None
+    self._anchor_periods = 0
+
+  @property
+  def drift_ppm(self):
+    """(float) drift of the generator clock in parts per million.
+
+    The drift is relative to the clock of the recording, in the same sense
+    as generator.Impairments.drift_ppm, or None until the period is measured.
+    """
+    if not self._prior_periods + self._anchor_periods:
+      return None
+    return (self._nominal_period / self._period - 1) / PPM
+
+  def Update(self, ind_peak):
+    """Updates the period estimate with the next located pulse.
+
+    Args:
+      ind_peak: (int) absolute index of the peak of the pulse.
+    """
+    if self._anchor is not None:
+      num_periods = int(round((ind_peak - self._anchor) / self._period))
+      if (abs(ind_peak - self._anchor - num_periods * self._period) <=
+          self._guard):
+        # Pulses in the overlap of two chunks are located twice.
+        if num_periods > self._anchor_periods:
+          self._anchor_periods = num_periods
+          total_periods = self._prior_periods + num_periods
+          self._period = (self._prior_period * self._prior_periods +
+                          ind_peak - self._anchor) / total_periods
+          self._instrumentation.SetValue(profiling.VALUE_DRIFT_PPM,
+                                         self.drift_ppm)
+        return
+    # The first pulse, or a pulse not on the grid of the anchor: the
+    # estimate so far is kept, and refined from this new anchor.
+    self._prior_period = self._period
+    self._prior_periods += self._anchor_periods
+    self._anchor = ind_peak
+    self._anchor_periods = 0
+
+  def FindNextWinStart(self, data_array, offset, ind_search_start,
+                       win_size):
+    """Locates the first predicted pulse after a given index.
+
+    Args:
+      data_array: (numpy.ndarray) containing the PCM samples from [-1, 1].
+      offset: (int) the absolute index of data_array[0].
+      ind_search_start: (int) index in |data_array| after which the pulse is
+        searched.
+      win_size: (int) number of samples of one period of the reference
+        signal.
+
+    Returns:
+      (int) the start index in |data_array| of the window that has the pulse
+      at its center, or None if there is no prediction yet, the guard band
+      is not inside |data_array|, or the pulse is not in it.
+    """
+    if self._anchor is None:
+      return None
+    ind_search_start += offset
+    num_periods = int(math.floor(
+        (ind_search_start - self._anchor) / self._period)) + 1
+    ind_predicted = int(round(self._anchor + num_periods * self._period -
+                              offset))
+    ind_band_start = ind_predicted - self._guard
+    ind_band_end = ind_predicted + self._guard + 1
+    if ind_band_start < 0 or ind_band_end > len(data_array):
+      return None
+
+    band = data_array[ind_band_start:ind_band_end]
+    ind_band_max = int(band.argmax())
+    ind_band_min = int(band.argmin())
+    if (ind_band_max in (0, len(band) - 1) or
+        band[ind_band_max] < self._dropout_threshold or
+        abs(band[ind_band_min]) < self._dropout_threshold or
+        abs(ind_band_min - ind_band_max) > self._samples_per_pulse):
+      self._instrumentation.Count(profiling.COUNTER_LOST_LOCKS)
+      return None
+    self._instrumentation.Count(profiling.COUNTER_TRACKED_PULSES)
+    return (ind_band_start + ind_band_max -
+            int(math.floor(HALF * win_size)))
+
+
+def _CreatePulseTracker(samp_rate, settings,
+                        instrumentation=profiling.NULL_INSTRUMENTATION):
+  """Creates a _PulseTracker if |settings| ask for one, or returns None."""
+  if settings.pulse_search == PULSE_SEARCH_TRACKED:
+    return _PulseTracker(samp_rate, settings, instrumentation)
+  return None
 
 
 def _GetNextWinStart(data_array, samples_per_pulse, win_size,
-                     dropout_threshold):
+                     dropout_threshold, candidates=None, offset=0):
   """Helper function to compute the start index of the next valid window.
 
   The start index will be computed in such way, that the maximum value of the
@@ -96,12 +446,19 @@ def _GetNextWinStart(data_array, samples_per_pulse, win_size,
     * the gap between maximum and minimum has to be less then
       samples_per_pulse samples.
 
+  The windows are evaluated with _FindValidWindows in batches that double in
+  size, so the common case (the pulse is in the first window) only looks at
+  one window while long invalid stretches are still scanned vectorized.
+
   Args:
-    data_array: (array of float) containing the PCM samples from [-1, 1].
+    data_array: (numpy.ndarray) containing the PCM samples from [-1, 1].
     samples_per_pulse: (int) the max number of samples between min and max peak.
     win_size: (int) number of samples of one period of the reference signal.
     dropout_threshold: (float) Min peak value. All values below that will be
       interpreted as dropout.
+    candidates: (_PulseCandidates) if given, the candidates of the signal
+      |data_array| is a part of, which are searched instead of |data_array|.
+    offset: (int) the index of data_array[0] in the signal of |candidates|.
 
   Returns:
     (int) index of the start of the window. There are three scenarios:
@@ -109,78 +466,177 @@ def _GetNextWinStart(data_array, samples_per_pulse, win_size,
     - Negative: If the pulse is located in data_array[0:win_size].
     - Positive: If the pulse is located in data_array[win_size:].
   """
-  num_samples = len(data_array)
+  half_win_size = int(math.floor(HALF * win_size))
 
   ind_win_start = 0
-  ind_win_max = None
+  num_windows = 1
 
-  while ind_win_start < num_samples:
-    ind_win_end = int(min(ind_win_start + win_size, num_samples))
+  while ind_win_start < len(data_array):
+    if candidates is None:
+      win_starts = _FindValidWindows(
+          data_array[ind_win_start:], samples_per_pulse, win_size,
+          dropout_threshold, max_windows=num_windows)
+    else:
+      win_starts = candidates.FindValidWindows(
+          offset + ind_win_start, samples_per_pulse, win_size,
+          dropout_threshold, max_windows=num_windows)
+    if len(win_starts):
+      return int(ind_win_start + win_starts[0])
+    ind_win_start += num_windows * half_win_size
+    num_windows *= 2
 
-    window = data_array[ind_win_start:ind_win_end]
+  return 0
 
-    (value_win_max, ind_win_max) = _GetValueAndIndexForMax(window)
-    (value_win_min, ind_win_min) = _GetValueAndIndexForMin(window)
 
-    dropout_detected = (value_win_max < dropout_threshold or
-                        abs(value_win_min) < dropout_threshold)
-    pulse_too_long = abs(ind_win_min - ind_win_max) > samples_per_pulse
+def _LocatePulseWindows(ref_signal, samples_per_pulse, win_size,
+                        dropout_threshold, ind_search_start=None,
+                        ref_candidates=None, pulse_tracker=None,
+                        signal_offset=0):
+  """Locates the windows of a chunk to be used for latency measurement.
 
-    if not ind_win_max or dropout_detected or pulse_too_long:
-      ind_win_start = int(ind_win_start + math.floor(HALF * win_size))
-    else:
-      return int(ind_win_start + ind_win_max - math.floor(HALF * win_size))
+  Starting at the first valid window, the search for the next one always
+  starts at the end of the current window. With a |pulse_tracker|, each
+  window is first looked for around the pulse it predicts.
 
-  return 0
+  Args:
+    ref_signal: (numpy.ndarray) reference signal normalized to [-1, 1].
+    samples_per_pulse: (int) the max number of samples between min and max peak.
+    win_size: (int) number of samples of one period of the reference signal.
+    dropout_threshold: (float) Min peak value. All values below that will be
+      interpreted as dropout.
+    ind_search_start: (int) if given, the index where a previous search
+      stopped (i.e., the end of its last window). The search then continues
+      from there instead of starting a new chunk.
+    ref_candidates: (_PulseCandidates) if given, the candidates of
+      |ref_signal| to search instead of all its samples.
+    pulse_tracker: (_PulseTracker) if given, predicts the pulses, and is
+      updated with the located ones.
+    signal_offset: (int) the absolute index of ref_signal[0], for the
+      |pulse_tracker|.
 
+  Returns:
+    (list of int) start index of each window. Only the first one can be
+    negative, meaning that the pulse is located in ref_signal[0:win_size].
+  """
+  ret = []
+  half_win_size = int(math.floor(HALF * win_size))
+
+  ind_win_start = None
+  if pulse_tracker is not None:
+    ind_win_start = pulse_tracker.FindNextWinStart(
+        ref_signal, signal_offset, ind_search_start or 0, win_size)
+  if ind_win_start is None and ind_search_start is None:
+    ind_win_start = _GetNextWinStart(
+        ref_signal, samples_per_pulse, win_size, dropout_threshold,
+        ref_candidates)
+  elif ind_win_start is None:
+    offset_win_next = _GetNextWinStart(
+        ref_signal[ind_search_start:], samples_per_pulse, win_size,
+        dropout_threshold, ref_candidates, ind_search_start)
+    if not offset_win_next:
+      return ret
+    ind_win_start = int(ind_search_start + offset_win_next)
+
+  while True:
+    ind_win_end = ind_win_start + win_size - 1
+
+    if ind_win_end >= len(ref_signal):
+      return ret
+
+    ret.append(ind_win_start)
+
+    if pulse_tracker is not None:
+      pulse_tracker.Update(signal_offset + ind_win_start + half_win_size)
+      ind_win_next = pulse_tracker.FindNextWinStart(
+          ref_signal, signal_offset, ind_win_end, win_size)
+      if ind_win_next is not None:
+        ind_win_start = ind_win_next
+        continue
+
+    offset_win_next = _GetNextWinStart(
+        ref_signal[ind_win_end:], samples_per_pulse, win_size,
+        dropout_threshold, ref_candidates, ind_win_end)
+
+    if not offset_win_next:
+      return ret
+    else:
+      ind_win_start = int(ind_win_end + offset_win_next)
 
-def _LookForDropoutsInWindow(data_array, samp_freq, window_offset,
-                             silence_threshold, min_silence_len_secs):
-  """Get silence periods inside the current window.
 
-  This function returns a list of periods, for which the wave file contains
-  silence. Only silence periods longer then MIN_SILENCE_LENGTH_MS are returned.
+def _FindSilenceRuns(data_array, silence_threshold):
+  """Run-length encodes the silence of a signal.
+
   All values in the range of +/- silence_threshold are interpreted as silence.
 
   Args:
-    data_array: the window with the values.
-    samp_freq: sampling frequency of the signal in Hz as integer.
-    window_offset: the number of samples from start of the wave file until the
-      beginning of the current window.
+    data_array: (numpy.ndarray) the signal normalized to [-1, 1].
     silence_threshold: (float) Lowest volume level which is not interpreted as
       silence.
+
+  Returns:
+    A 2-tuple:
+    - Element 0: (numpy.ndarray of int) index of the first sample of each run
+      of silent samples.
+    - Element 1: (numpy.ndarray of int) index of the first sample after each
+      run of silent samples.
+  """
+  silence_mask = numpy.abs(data_array) < silence_threshold
+  edges = numpy.flatnonzero(numpy.diff(
+      numpy.concatenate(([0], silence_mask.view(numpy.int8), [0]))))
+  return edges[0::2], edges[1::2]
+
+
+def _LookForDropoutsInWindows(silence_runs, win_starts, win_ends, samp_freq,
+                              chunk_offset, min_silence_len_secs):
+  """Get silence periods inside each of the given windows.
+
+  Every silence run is clipped to the windows it intersects. Only clipped
+  runs longer than min_silence_len_secs are returned. A silence extending
+  beyond the end of a window ends at the last sample of the window.
+
+  Args:
+    silence_runs: (tuple) silence runs of the chunk as returned by
+      _FindSilenceRuns().
+    win_starts: (list of int) index of the first sample of each window.
+    win_ends: (list of int) index of the first sample after each window.
+    samp_freq: sampling frequency of the signal in Hz as integer.
+    chunk_offset: the number of samples from start of the wave file until the
+      beginning of the chunk.
     min_silence_len_secs: (float) minimum length of silence, so that it is
       interpreted as such.
+
   Returns:
-    (list of tuple(float, float)) timestamp of beginning and end of silence.
+    (list of list of tuple(float, float)) for each window, the timestamp of
+    beginning and end of silence.
   """
-  ret = []
-  dropout_counter = -1
-  current_dropout = None
-
+  run_starts, run_ends = silence_runs
+  win_starts = numpy.asarray(win_starts, dtype=int)
+  win_ends = numpy.asarray(win_ends, dtype=int)
   dropout_min_samples = min_silence_len_secs * samp_freq
 
-  for index, value in enumerate(data_array):
-    if abs(value) < silence_threshold:
-      dropout_counter += 1
-      # Dropout detected
-      if dropout_counter > dropout_min_samples and not current_dropout:
-        timestamp = float(window_offset + index - dropout_counter) / samp_freq
-        current_dropout = timestamp
-    # Dropout ended
-    else:
-      dropout_counter = -1
-      if current_dropout:
-        timestamp = float(window_offset + index) / samp_freq
-        ret.append((current_dropout, timestamp))
-        dropout_counter = -1
-        current_dropout = None
-
-  # Special case: Dropout extends beyond window range
-  if current_dropout:
-    timestamp = float(window_offset + len(data_array) - 1) / samp_freq
-    ret.append((current_dropout, timestamp))
-
+  # Pair every window with the runs it intersects.
+  first_runs = numpy.searchsorted(run_ends, win_starts, side='right')
+  runs_per_window = numpy.maximum(
+      numpy.searchsorted(run_starts, win_ends, side='left') - first_runs, 0)
+  ind_win = numpy.repeat(numpy.arange(len(win_starts)), runs_per_window)
+  ind_run = (numpy.arange(runs_per_window.sum()) +
+             numpy.repeat(first_runs - numpy.cumsum(runs_per_window) +
+                          runs_per_window, runs_per_window))
+
+  starts = numpy.maximum(run_starts[ind_run], win_starts[ind_win])
+  ends = numpy.minimum(run_ends[ind_run], win_ends[ind_win])
+  # A silence starting at the very first sample of the file is not reported
+  # (as it has a timestamp of 0).
+  valid = ((ends - starts - 1 > dropout_min_samples) &
+           (chunk_offset + starts != 0))
+  ends = numpy.where(ends == win_ends[ind_win], ends - 1, ends)
+
+  timestamps = zip(((chunk_offset + starts[valid]) /
+                    float(samp_freq)).tolist(),
+                   ((chunk_offset + ends[valid]) / float(samp_freq)).tolist())
+  ret = [[] for _ in win_starts]
+  for index, timestamp in zip(ind_win[valid].tolist(), timestamps):
+    ret[index].append(timestamp)
   return ret
 
 
@@ -212,7 +668,7 @@ def _FindPeakOnActual(latency_value):
 
 def _LookForDropoutsInChunk(act_signal, win_size, samp_freq,
                             chunk_offset, latencies, silence_threshold,
-                            min_silence_len_secs):
+                            min_silence_len_secs, prev_latency=None):
   """Find dropouts in actual signal.
 
   By using the knowledge about the testfiles used for latency measurement
@@ -225,7 +681,7 @@ def _LookForDropoutsInChunk(act_signal, win_size, samp_freq,
    measurement'.
 
   Args:
-    act_signal: (list of float) actual signal normalized to [-1, 1].
+    act_signal: (numpy.ndarray) actual signal normalized to [-1, 1].
     win_size: (int) number of samples of one period of the reference signal.
     samp_freq: (int) the sampling frequency of the audio signal in Hz.
     chunk_offset: (int) offset of the chunk within the WAV file. Used to
@@ -236,18 +692,22 @@ def _LookForDropoutsInChunk(act_signal, win_size, samp_freq,
       silence.
     min_silence_len_secs: (float) minimum length of silence, so that it is
       interpreted as such.
+    prev_latency: (tuple(float, float)) the last valid latency before
+      |latencies|, if any. Used to locate the start of a dropout that
+      spans the start of the chunk.
 
   Returns:
     (list of tuple(float, float)) timestamp of beginning and end of silence.
   """
-  ret = []
+  long_dropouts = collections.defaultdict(list)
+  win_starts = []
+  win_ends = []
   long_dropout_start = None
   half_window_time = win_size * HALF / samp_freq
 
   # Initialize iterator
   latency_iterator = iter(latencies)
   curr_latency = next(latency_iterator, None)
-  prev_latency = None
   end_reached = curr_latency is None
 
   # Iterate over latency values
@@ -273,8 +733,9 @@ def _LookForDropoutsInChunk(act_signal, win_size, samp_freq,
       # Special case: Handle long dropout until end of chunk
       if long_dropout_start is not None:
         long_dropout_end = float(chunk_offset + len(act_signal)) / samp_freq
-        ret.append((long_dropout_start, long_dropout_end))
-      return ret
+        long_dropouts[len(win_starts)].append(
+            (long_dropout_start, long_dropout_end))
+      break
 
     # We now have a valid window. Evaluate latency to determine where the
     #   corresponding window is supposed to be on actual
@@ -283,58 +744,127 @@ def _LookForDropoutsInChunk(act_signal, win_size, samp_freq,
     # Handle end of long dropout using the beginning of the valid window
     if long_dropout_start is not None:
       long_dropout_end = peak_on_act - half_window_time
-      ret.append((long_dropout_start, long_dropout_end))
+      long_dropouts[len(win_starts)].append(
+          (long_dropout_start, long_dropout_end))
       long_dropout_start = None
 
     # Type2: Short dropouts inside an otherwise valid window
-    exp_act_win_start = int(peak_on_act * samp_freq - win_size * HALF)
+    exp_act_win_start = (int(peak_on_act * samp_freq - win_size * HALF) -
+                         chunk_offset)
     exp_act_win_end = min(exp_act_win_start + win_size, len(act_signal))
 
     # Special case: Handle chunk underflow
     if exp_act_win_start < 0:
       exp_act_win_start = 0
 
-    ret += _LookForDropoutsInWindow(
-        act_signal[exp_act_win_start:exp_act_win_end],
-        samp_freq, chunk_offset + exp_act_win_start,
-        silence_threshold, min_silence_len_secs)
+    win_starts.append(exp_act_win_start)
+    win_ends.append(exp_act_win_end)
 
     # Move to next latency value
     prev_latency = curr_latency
     curr_latency = next(latency_iterator, None)
     end_reached = curr_latency is None
 
-  return ret
+  window_dropouts = []
+  if win_starts:
+    window_dropouts = _LookForDropoutsInWindows(
+        _FindSilenceRuns(act_signal, silence_threshold),
+        win_starts, win_ends, samp_freq, chunk_offset, min_silence_len_secs)
 
+  # Merge both types keeping the order in which they were found.
+  ret = []
+  for index, dropouts in enumerate(window_dropouts):
+    ret += long_dropouts[index]
+    ret += dropouts
+  ret += long_dropouts[len(window_dropouts)]
+  return ret
 
-def _CollapseTimestampList(period_list):
-  """Collapses a list of (begin, end) timestamps.
 
-  This method will unify two consecutive items if begin of the first and end
-  of the second (begin, end) tuple are similar enough. Similarity threshold is
-  determined by NO_GAP_TIME_SECS constant.
+def _FindRefPeaks(ref_signal, win_starts, win_size, ref_candidates=None):
+  """Finds the peak of the reference signal in each of the given windows.
 
   Args:
-    period_list: (list of tuple(float, float)) list of timestamp tuples (begin,
-      end) as float. Expected unit is seconds. The list has to be sorted
-      smallest to biggest (i.e. earliest to latest).
+    ref_signal: (numpy.ndarray) reference signal normalized to [-1, 1].
+    win_starts: (list of int) start index of each window, as returned by
+      _LocatePulseWindows().
+    win_size: (int) number of samples of one period of the reference signal.
+    ref_candidates: (_PulseCandidates) if given, the candidates of
+      |ref_signal| to search instead of all its samples.
 
   Returns:
-    Nothing
-
-  Sideeffects:
-    period_list may change if two timestamp-tuples are united to a single one.
+    (list of tuple(int, float)) for each window, the index of the peak
+    relative to the window start (or to 0, if the window starts before the
+    signal) and its value.
   """
-  index = 1
-
-  while index < len(period_list):
-    time_diff = period_list[index][0] - period_list[index - 1][1]
-    if time_diff < NO_GAP_TIME_SECS:
-      unified = (period_list[index - 1][0], period_list[index][1])
-      period_list[index - 1] = unified
-      del period_list[index]
+  ret = []
+  for ind_win_start in win_starts:
+    ind_win_end = ind_win_start + win_size - 1
+    ind_win_start = max(ind_win_start, 0)
+    if ref_candidates is None:
+      ref_window = ref_signal[ind_win_start:ind_win_end]
+      ind_ref_max = int(ref_window.argmax())
+      ret.append((ind_ref_max, ref_window[ind_ref_max]))
     else:
-      index += 1
+      ret.append(ref_candidates.ArgMax(ind_win_start, ind_win_end))
+  return ret
+
+
+def _ComputeLatencies(ref_signal, act_signal, win_starts, win_size,
+                      samp_freq, chunk_offset, dropout_threshold,
+                      ref_candidates=None, ref_peaks=None):
+  """Computes the latency of each of the given windows.
+
+  Args:
+    ref_signal: (numpy.ndarray) reference signal normalized to [-1, 1].
+    act_signal: (numpy.ndarray) actual signal normalized to [-1, 1].
+    win_starts: (list of int) start index of each window, as returned by
+      _LocatePulseWindows().
+    win_size: (int) number of samples of one period of the reference signal.
+    samp_freq: (int) the sampling frequency of the audio signal in Hz.
+    chunk_offset: (int) offset of the chunk within the WAV file. Used to
+      determine the timestamp of each measurement point.
+    dropout_threshold: (float) Min peak value. All values below that will be
+      interpreted as dropout.
+    ref_candidates: (_PulseCandidates) if given, the candidates of
+      |ref_signal| to search instead of all its samples. The windows of
+      |act_signal| are always searched at full rate, since a single pass of
+      argmax over them is cheaper than finding their candidates.
+    ref_peaks: (list of tuple(int, float)) if given, the peaks of the
+      reference signal as returned by _FindRefPeaks(), in which case
+      |ref_signal| and |ref_candidates| are not used.
+
+  Returns:
+    (list of tuple(float, float)) as described in _ComputeLatencyInChunk().
+  """
+  if ref_peaks is None:
+    ref_peaks = _FindRefPeaks(ref_signal, win_starts, win_size, ref_candidates)
+
+  ret = []
+
+  # calculates the latency time per "win_size" samples
+  for index, (ind_win_start, (ind_ref_max, value_ref_max)) in enumerate(
+      zip(win_starts, ref_peaks)):
+    win_start_neg = index == 0 and ind_win_start < 0
+    ind_win_end = ind_win_start + win_size - 1
+    ind_win_start = max(ind_win_start, 0)
+
+    act_window = act_signal[ind_win_start:ind_win_end]
+    ind_act_max = int(act_window.argmax())
+    value_act_max = act_window[ind_act_max]
+
+    timestamp = (float(chunk_offset + ind_win_start + ind_ref_max) /
+                 samp_freq)
+
+    # See if we found something to compare with
+    if value_ref_max > dropout_threshold:
+      current_delay = float(ind_ref_max - ind_act_max) / samp_freq
+
+      if value_act_max > dropout_threshold:
+        ret.append((timestamp, current_delay))
+      elif not win_start_neg:
+        ret.append((timestamp, float('nan')))
+
+  return ret
 
 
 def _ComputeLatencyInChunk(ref_signal, act_signal, win_size,
@@ -346,8 +876,8 @@ def _ComputeLatencyInChunk(ref_signal, act_signal, win_size,
   (i.e. win_size) greater then 2 times the maximum expected latency.
 
   Args:
-    ref_signal: (list of float) reference signal normalized to [-1, 1]..
-    act_signal: (list of float) actual signal normalized to [-1, 1].
+    ref_signal: (numpy.ndarray) reference signal normalized to [-1, 1].
+    act_signal: (numpy.ndarray) actual signal normalized to [-1, 1].
     win_size: (int) number of samples of one period of the reference signal.
     samp_freq: (int) the sampling frequency of the audio signal in Hz.
     chunk_offset: (int) offset of the chunk within the WAV file. Used to
@@ -365,53 +895,296 @@ def _ComputeLatencyInChunk(ref_signal, act_signal, win_size,
       NaN value is added for this window. Dropouts within ref signal are
       ignored.
   """
-  ret = []
-  win_start_neg = False
-
   samples_per_pulse = pulse_duration_secs * samp_freq
-  ind_win_start = _GetNextWinStart(
+  win_starts = _LocatePulseWindows(
       ref_signal, samples_per_pulse, win_size, dropout_threshold)
 
-  if ind_win_start < 0:
-    win_start_neg = True
+  return _ComputeLatencies(ref_signal, act_signal, win_starts, win_size,
+                           samp_freq, chunk_offset, dropout_threshold)
 
-  # calculates the latency time per "win_size" samples
-  while True:
-    ind_win_end = ind_win_start + win_size - 1
-    ind_win_start = max(ind_win_start, 0)
 
-    if ind_win_end >= len(ref_signal):
-      return ret
+def _CheckSamplingRates(ref_wave_reader, act_wave_reader):
+  """Checks both signals have the same sampling rate and returns it.
 
-    (value_ref_max, ind_ref_max) = _GetValueAndIndexForMax(
-        ref_signal[ind_win_start:ind_win_end])
-    (value_act_max, ind_act_max) = _GetValueAndIndexForMax(
-        act_signal[ind_win_start:ind_win_end])
+  Raises:
+    InputSignalException: if the sampling rates are different.
+  """
+  samp_rate = ref_wave_reader.GetSamplingRate()
+  if samp_rate != act_wave_reader.GetSamplingRate():
+    raise InputSignalException('The samplerates of reference and actual '
+                               'have to  be the same!\nCurrently I see '
+                               'ref: %i, act: %i' % (
+                                   samp_rate,
+                                   act_wave_reader.GetSamplingRate()))
+  return samp_rate
 
-    timestamp = (float(chunk_offset + ind_win_start + ind_ref_max) /
-                 samp_freq)
 
-    # See if we found something to compare with
-    if value_ref_max > dropout_threshold:
-      current_delay = float(ind_ref_max - ind_act_max) / samp_freq
+def _GetSamplesPerChunk(samp_rate, settings):
+  """Gets the number of samples evaluated as one chunk."""
+  return WINDOWS_PER_CHUNK * int(samp_rate * settings.period_secs)
 
-      if value_act_max > dropout_threshold:
-        ret.append((timestamp, current_delay))
-      elif not win_start_neg:
-        ret.append((timestamp, float('nan')))
 
-    win_start_neg = False
-    offset_win_next = _GetNextWinStart(
-        ref_signal[ind_win_end:], samples_per_pulse, win_size,
-        dropout_threshold)
+def _GetChunkPositions(num_samples, samp_rate, settings):
+  """Gets the first sample of each chunk.
 
-    if not offset_win_next:
-      return ret
+  Consecutive chunks overlap by half a window, so that pulses at the end of a
+  chunk are also found at the start of the next one.
+
+  Args:
+    num_samples: (int) number of samples of the reference signal.
+    samp_rate: (int) the sampling frequency of the signals in Hz.
+    settings: (AnalysisSettings) analysis settings.
+
+  Returns:
+    (list of int) the positions of the chunks.
+  """
+  samples_per_window = int(samp_rate * settings.period_secs)
+  chunk_offset = int(HALF * samples_per_window - 1)
+  return list(range(0, num_samples,
+                    _GetSamplesPerChunk(samp_rate, settings) - chunk_offset))
+
+
+def _AnalyzeChunksAt(ref_wave_reader, act_wave_reader, positions, settings,
+                     ref_pulse_index=None,
+                     instrumentation=profiling.NULL_INSTRUMENTATION):
+  """Analyzes the chunks starting at each of |positions|.
+
+  Args:
+    ref_wave_reader: (WaveReader) reference signal.
+    act_wave_reader: (WaveReader) actual signal.
+    positions: (list of int) positions of the chunks, see
+      _GetChunkPositions().
+    settings: (AnalysisSettings) analysis settings.
+    ref_pulse_index: (dict) if given, the pulses of the reference signal by
+      chunk position, see DetermineLatenciesAndDropouts(). The samples of
+      the reference chunks in it are not read, and the pulses of the others
+      are added to it.
+    instrumentation: (profiling.Instrumentation) the stages are timed and
+      counted in it.
+
+  Yields:
+    (2-tuple) the latencies and dropouts of each chunk in order, see
+    _AnalyzeChunk().
+  """
+  samp_rate = ref_wave_reader.GetSamplingRate()
+  samples_per_chunk = _GetSamplesPerChunk(samp_rate, settings)
+  # The files may have different sample formats.
+  ref_sample_scaler = ref_wave_reader.GetSampleScaler()
+  act_sample_scaler = act_wave_reader.GetSampleScaler()
+  pulse_tracker = _CreatePulseTracker(samp_rate, settings, instrumentation)
+
+  for position in positions:
+    instrumentation.Count(profiling.COUNTER_CHUNKS)
+    ref_pulses = None
+    if ref_pulse_index is not None:
+      ref_pulses = ref_pulse_index.get(position)
+    if ref_pulses is None:
+      with instrumentation.Time(profiling.STAGE_READ):
+        ref_wave_data = ref_wave_reader.ReadSamplesArray(position,
+                                                         samples_per_chunk)
+      with instrumentation.Time(profiling.STAGE_DECODE):
+        ref_chunk = wave_reader.Pcm2Float(ref_wave_data, ref_sample_scaler)
+      with instrumentation.Time(profiling.STAGE_PULSE_SEARCH):
+        ref_pulses = _LocateRefPulses(ref_chunk, samp_rate, settings,
+                                      pulse_tracker, position)
+      instrumentation.Count(profiling.COUNTER_BYTES_READ, ref_wave_data.nbytes)
+      instrumentation.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES,
+                                 ref_wave_data.nbytes)
+      instrumentation.RecordPeak(profiling.PEAK_SIGNAL_BUFFER_BYTES,
+                                 ref_chunk.nbytes)
+      if ref_pulse_index is not None:
+        ref_pulse_index[position] = ref_pulses
     else:
-      ind_win_start = int(ind_win_end + offset_win_next)
+      instrumentation.Count(profiling.COUNTER_CACHED_CHUNKS)
+
+    with instrumentation.Time(profiling.STAGE_READ):
+      act_wave_data = act_wave_reader.ReadSamplesArray(position,
+                                                       samples_per_chunk)
+    with instrumentation.Time(profiling.STAGE_DECODE):
+      act_chunk = wave_reader.Pcm2Float(act_wave_data, act_sample_scaler)
+    instrumentation.Count(profiling.COUNTER_BYTES_READ, act_wave_data.nbytes)
+    instrumentation.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES,
+                               act_wave_data.nbytes)
+    instrumentation.RecordPeak(profiling.PEAK_SIGNAL_BUFFER_BYTES,
+                               act_chunk.nbytes)
+
+    chunk_results, = _AnalyzeChunk(
+        ref_pulses, [act_chunk], samp_rate, position, settings,
+        instrumentation)
+    yield chunk_results
+
+
+def _AnalyzeChunkRange(task):
+  """Analyzes a range of chunks in a worker process.
+
+  Args:
+    task: (tuple) the paths to the reference and actual signals, whether to
+      use memory maps, the positions of the chunks, the AnalysisSettings, the
+      reference pulse index of the chunks (or None) and whether to
+      instrument the analysis.
+
+  Returns:
+    A 3-tuple with the results of _AnalyzeChunksAt(), the reference pulse
+    index of the chunks (or None) and the profiling.Instrumentation of the
+    analysis (or profiling.NULL_INSTRUMENTATION).
+  """
+  (ref_wave_path, act_wave_path, use_mmap, positions, settings,
+   ref_pulse_index, instrumented) = task
+  instrumentation = profiling.NULL_INSTRUMENTATION
+  if instrumented:
+    instrumentation = profiling.Instrumentation()
+  ref_wave_reader = wave_reader.CreateWaveReader(ref_wave_path, use_mmap)
+  act_wave_reader = wave_reader.CreateWaveReader(act_wave_path, use_mmap)
+  try:
+    return (list(_AnalyzeChunksAt(ref_wave_reader, act_wave_reader,
+                                  positions, settings, ref_pulse_index,
+                                  instrumentation)),
+            ref_pulse_index, instrumentation)
+  finally:
+    act_wave_reader.Close()
+    ref_wave_reader.Close()
+
+
+class _ChunkResultsMerger(object):
+  """Merges the results of consecutive chunks as they are analyzed.
+
+  A pulse in the overlap of two chunks is measured in both of them, with the
+  same timestamp. Only the first of those measurements is kept. The last
+  dropout of a chunk may continue in the next one, so it is only returned
+  once the next chunk is added, or by Finish().
+  """
+
+  def __init__(self):
+    self._last_timestamp = float('-inf')
+    self._pending_dropouts = interval_set.IntervalSet(
+        min_gap_secs=NO_GAP_TIME_SECS)
+
+  def Add(self, chunk_latencies, chunk_dropouts):
+    """Adds the results of the next chunk.
+
+    Args:
+      chunk_latencies: (list of 2-tuple) the latencies of the chunk.
+      chunk_dropouts: (list of 2-tuple) the dropouts of the chunk, not
+        collapsed.
+
+    Returns:
+      A 2-tuple with the latencies of the chunk which were not measured in
+      the previous ones (LatencySeries) and the dropouts which can't change
+      anymore (list of 2-tuple).
+    """
+    chunk_latencies = latency_series.LatencySeries.FromPairs(chunk_latencies)
+    chunk_latencies = chunk_latencies[chunk_latencies.times.searchsorted(
+        self._last_timestamp, side='right'):]
+    if len(chunk_latencies):
+      self._last_timestamp = chunk_latencies.times[-1]
+
+    self._pending_dropouts.Extend(chunk_dropouts)
+    dropouts = self._pending_dropouts[:-1].ToList()
+    self._pending_dropouts = self._pending_dropouts[-1:]
+    return chunk_latencies, dropouts
 
+  def Finish(self):
+    """Returns the dropouts which were still pending (list of 2-tuple)."""
+    return self._pending_dropouts.PopEndingBy(float('inf'))
 
-def DetermineLatenciesAndDropouts(ref_wave_reader, act_wave_reader, settings):
+
+def _MergeChunkResults(chunk_results):
+  """Merges the results of consecutive chunks.
+
+  Args:
+    chunk_results: (iterable of 2-tuple) the latencies and dropouts of each
+      chunk in order.
+
+  Returns:
+    The same 2-tuple as DetermineLatenciesAndDropouts().
+  """
+  merger = _ChunkResultsMerger()
+  latencies = []
+  dropouts = []
+  for chunk_latencies, chunk_dropouts in chunk_results:
+    chunk_latencies, chunk_dropouts = merger.Add(chunk_latencies,
+                                                 chunk_dropouts)
+    latencies.append(chunk_latencies)
+    dropouts += chunk_dropouts
+  dropouts += merger.Finish()
+  return latency_series.LatencySeries.Concatenate(latencies), dropouts
+
+
+def _LocateRefPulses(ref_chunk, samp_rate, settings, pulse_tracker=None,
+                     chunk_offset=0):
+  """Locates the pulses of a reference chunk.
+
+  Args:
+    ref_chunk: (numpy.ndarray) reference signal normalized to [-1, 1].
+    samp_rate: (int) the sampling frequency of the signal in Hz.
+    settings: (AnalysisSettings) analysis settings.
+    pulse_tracker: (_PulseTracker) if given, predicts the pulses, and is
+      updated with the located ones.
+    chunk_offset: (int) offset of the chunk within the WAV file.
+
+  Returns:
+    A 2-tuple with the window starts as returned by _LocatePulseWindows()
+    and the peaks as returned by _FindRefPeaks().
+  """
+  window_size_latency = int(0.9 * int(samp_rate * settings.period_secs))
+  ref_candidates = _CreatePulseCandidates(ref_chunk, samp_rate, settings)
+  win_starts = _LocatePulseWindows(
+      ref_chunk, settings.pulse_duration_secs * samp_rate,
+      window_size_latency, settings.dropout_threshold,
+      ref_candidates=ref_candidates, pulse_tracker=pulse_tracker,
+      signal_offset=chunk_offset)
+  return win_starts, _FindRefPeaks(ref_chunk, win_starts, window_size_latency,
+                                   ref_candidates)
+
+
+def _AnalyzeChunk(ref_pulses, act_chunks, samp_rate, chunk_offset, settings,
+                  instrumentation=profiling.NULL_INSTRUMENTATION):
+  """Determines the latencies and dropouts of one chunk.
+
+  The pulses of the reference chunk are located once and shared by all the
+  actual chunks.
+
+  Args:
+    ref_pulses: (2-tuple) the pulses of the reference chunk, as returned by
+      _LocateRefPulses().
+    act_chunks: (list of numpy.ndarray) actual signals normalized to [-1, 1].
+    samp_rate: (int) the sampling frequency of the signals in Hz.
+    chunk_offset: (int) offset of the chunk within the WAV file.
+    settings: (AnalysisSettings) analysis settings.
+    instrumentation: (profiling.Instrumentation) the stages are timed and
+      counted in it.
+
+  Returns:
+    (list of 2-tuple) for each of |act_chunks|, the latencies as returned by
+    _ComputeLatencyInChunk() and the (not collapsed) dropouts as returned by
+    _LookForDropoutsInChunk().
+  """
+  samples_per_window = int(samp_rate * settings.period_secs)
+  window_size_latency = int(0.9 * samples_per_window)
+  win_starts, ref_peaks = ref_pulses
+
+  ret = []
+  for act_chunk in act_chunks:
+    with instrumentation.Time(profiling.STAGE_LATENCY):
+      chunk_latencies = _ComputeLatencies(
+          None, act_chunk, win_starts, window_size_latency, samp_rate,
+          chunk_offset, settings.dropout_threshold, ref_peaks=ref_peaks)
+    with instrumentation.Time(profiling.STAGE_DROPOUT):
+      chunk_dropouts = _LookForDropoutsInChunk(
+          act_chunk, samples_per_window, samp_rate, chunk_offset,
+          chunk_latencies, settings.silence_threshold,
+          settings.min_silence_len_secs)
+    if instrumentation:
+      instrumentation.Count(profiling.COUNTER_WINDOWS, len(chunk_latencies))
+      instrumentation.Count(
+          profiling.COUNTER_INVALID_WINDOWS,
+          sum(1 for latency in chunk_latencies if _IsInvalidWindow(latency)))
+    ret.append((chunk_latencies, chunk_dropouts))
+  return ret
+
+
+def DetermineLatenciesAndDropouts(ref_wave_reader, act_wave_reader, settings,
+                                  ref_pulse_index=None, instrumentation=None):
   """Determines the delay between act and ref wave signal and dropouts on act.
 
   The WAV files are evaluated not as a whole, but in chunks (see
@@ -423,6 +1196,15 @@ def DetermineLatenciesAndDropouts(ref_wave_reader, act_wave_reader, settings):
     ref_wave_reader: (WaveReader) reference signal.
     act_wave_reader: (WaveReader) actual signal
     settings: (AnalysisSettings) analysis settings.
+    ref_pulse_index: (dict) if given, maps the position of the chunks to
+      the pulses located in the reference signal, which only depend on the
+      reference signal, its sampling rate, and the period_secs,
+      pulse_duration_secs and dropout_threshold settings. The reference
+      samples of the chunks in it are not read, and the pulses of the other
+      chunks are added to it, so it can be reused for another actual signal.
+    instrumentation: (profiling.Instrumentation) if given, the time spent in
+      each stage of the analysis and counters of what was analyzed are
+      added to it.
 
   Returns:
     A 2-tuple:
@@ -447,49 +1229,405 @@ def DetermineLatenciesAndDropouts(ref_wave_reader, act_wave_reader, settings):
     This includes:
       * different sampling rate for the two signals.
   """
-  # Samplerates must match
-  samp_rate = ref_wave_reader.GetSamplingRate()
-  if samp_rate != act_wave_reader.GetSamplingRate():
-    raise InputSignalException('The samplerates of reference and actual '
-                               'have to  be the same!\nCurrently I see '
-                               'ref: %i, act: %i' % (
-                                   samp_rate,
-                                   act_wave_reader.GetSamplingRate()))
+  samp_rate = _CheckSamplingRates(ref_wave_reader, act_wave_reader)
+  positions = _GetChunkPositions(ref_wave_reader.GetNumberOfSamples(),
+                                 samp_rate, settings)
+  return _MergeChunkResults(_AnalyzeChunksAt(
+      ref_wave_reader, act_wave_reader, positions, settings, ref_pulse_index,
+      instrumentation or profiling.NULL_INSTRUMENTATION))
 
-  position_frames_start = 0
-  latencies = []
-  dropouts = []
 
-  samples_per_window = int(samp_rate * settings.period_secs)
-  samples_per_chunk = WINDOWS_PER_CHUNK * samples_per_window
-  chunk_offset = int(HALF * samples_per_window - 1)
-  window_size_latency = int(0.9 * samples_per_window)
-  sample_scaler = 2 ** (BITS_PER_BYTE * ref_wave_reader.GetSampleWidth() - 1)
+def IterLatenciesAndDropouts(ref_wave_reader, act_wave_reader, settings,
+                             ref_pulse_index=None, instrumentation=None):
+  """Determines the delay and dropouts as each chunk is analyzed.
 
-  while position_frames_start < ref_wave_reader.GetNumberOfSamples():
-    ref_wave_data = ref_wave_reader.ReadSamples(position_frames_start,
-                                                samples_per_chunk)
-    act_wave_data = act_wave_reader.ReadSamples(position_frames_start,
-                                                samples_per_chunk)
+  The results are the same as DetermineLatenciesAndDropouts(), but are
+  returned chunk by chunk.
 
-    ref_chunk = wave_reader.Pcm2Float(ref_wave_data, sample_scaler).tolist()
-    act_chunk = wave_reader.Pcm2Float(act_wave_data, sample_scaler).tolist()
+  Args:
+    ref_wave_reader: (WaveReader) reference signal.
+    act_wave_reader: (WaveReader) actual signal
+    settings: (AnalysisSettings) analysis settings.
+    ref_pulse_index: (dict) the pulses of the reference signal by chunk
+      position, see DetermineLatenciesAndDropouts().
+    instrumentation: (profiling.Instrumentation) if given, the time spent in
+      each stage of the analysis and counters of what was analyzed are
+      added to it.
+
+  Yields:
+    A 2-tuple with the latencies measured in each chunk (LatencySeries) and
+    the dropouts which are over (list of tuple(float, float)). Concatenated,
+    they are the results of DetermineLatenciesAndDropouts(). A dropout which
+    may continue in the next chunk is only yielded with the next chunk, so
+    the last tuple only has dropouts.
 
-    chunk_latencies = _ComputeLatencyInChunk(
-        ref_chunk, act_chunk, window_size_latency,
-        samp_rate, position_frames_start,
-        settings.pulse_duration_secs,
-        settings.dropout_threshold)
+  Raises:
+    InputSignalException: if the signals given to the function are not valid.
+  """
+  samp_rate = _CheckSamplingRates(ref_wave_reader, act_wave_reader)
+  positions = _GetChunkPositions(ref_wave_reader.GetNumberOfSamples(),
+                                 samp_rate, settings)
+  merger = _ChunkResultsMerger()
+  for chunk_latencies, chunk_dropouts in _AnalyzeChunksAt(
+      ref_wave_reader, act_wave_reader, positions, settings, ref_pulse_index,
+      instrumentation or profiling.NULL_INSTRUMENTATION):
+    yield merger.Add(chunk_latencies, chunk_dropouts)
+  yield latency_series.LatencySeries(), merger.Finish()
+
+
+def DetermineLatenciesAndDropoutsInParallel(ref_wave_path, act_wave_path,
+                                            settings, jobs=None,
+                                            use_mmap=False,
+                                            ref_pulse_index=None,
+                                            instrumentation=None):
+  """Determines the delay and dropouts like DetermineLatenciesAndDropouts().
+
+  The chunks are split into contiguous ranges which are analyzed by a pool of
+  |jobs| processes. Each process reads the samples of its ranges through its
+  own wave readers, so only the results are sent back.
 
-    dropouts += _LookForDropoutsInChunk(
-        act_chunk, samples_per_window, samp_rate,
-        position_frames_start, chunk_latencies,
-        settings.silence_threshold,
-        settings.min_silence_len_secs)
+  Args:
+    ref_wave_path: (string) path to the reference signal.
+    act_wave_path: (string) path to the actual signal.
+    settings: (AnalysisSettings) analysis settings.
+    jobs: (int) number of processes, or None to use every CPU.
+    use_mmap: (bool) whether the processes read the files through memory maps
+      (see wave_reader.MmapWaveReader).
+    ref_pulse_index: (dict) the pulses of the reference signal by chunk
+      position, see DetermineLatenciesAndDropouts().
+    instrumentation: (profiling.Instrumentation) if given, the
+      instrumentation of every process is added to it.
+
+  Returns:
+    The same 2-tuple as DetermineLatenciesAndDropouts().
 
-    latencies += chunk_latencies
+  Raises:
+    InputSignalException: if the signals given to the function are not valid.
+  """
+  ref_wave_reader = wave_reader.CreateWaveReader(ref_wave_path, use_mmap)
+  act_wave_reader = wave_reader.CreateWaveReader(act_wave_path, use_mmap)
+  try:
+    samp_rate = _CheckSamplingRates(ref_wave_reader, act_wave_reader)
+    positions = _GetChunkPositions(ref_wave_reader.GetNumberOfSamples(),
+                                   samp_rate, settings)
+    if jobs == 1 or len(positions) <= 1:
+      return _MergeChunkResults(_AnalyzeChunksAt(
+          ref_wave_reader, act_wave_reader, positions, settings,
+          ref_pulse_index, instrumentation or profiling.NULL_INSTRUMENTATION))
+  finally:
+    act_wave_reader.Close()
+    ref_wave_reader.Close()
+
+  jobs = jobs or multiprocessing.cpu_count()
+  num_ranges = min(len(positions), jobs * CHUNK_RANGES_PER_JOB)
+  tasks = []
+  for range_positions in numpy.array_split(positions, num_ranges):
+    range_positions = range_positions.tolist()
+    range_pulse_index = None
+    if ref_pulse_index is not None:
+      range_pulse_index = dict(
+          (position, ref_pulse_index[position]) for position in range_positions
+          if position in ref_pulse_index)
+    tasks.append((ref_wave_path, act_wave_path, use_mmap, range_positions,
+                  settings, range_pulse_index, instrumentation is not None))
+
+  pool = multiprocessing.Pool(min(jobs, num_ranges))
+  try:
+    range_results = pool.map(_AnalyzeChunkRange, tasks)
+  finally:
+    pool.close()
+    pool.join()
+
+  chunk_results = []
+  for (range_chunk_results, range_pulse_index,
+       range_instrumentation) in range_results:
+    chunk_results += range_chunk_results
+    if ref_pulse_index is not None:
+      ref_pulse_index.update(range_pulse_index)
+    if instrumentation is not None:
+      instrumentation.Merge(range_instrumentation)
+  return _MergeChunkResults(chunk_results)
+
+
+def DetermineMultichannelLatenciesAndDropouts(multichannel_wave_reader,
+                                              ref_channel, act_channels,
+                                              settings):
+  """Determines the delay and dropouts of several channels of a recording.
+
+  Like DetermineLatenciesAndDropouts(), but the reference and the actual
+  signals are channels of a single interleaved recording. Each chunk is read
+  once and the pulses of the reference channel are located once for all the
+  actual channels.
 
-    position_frames_start += samples_per_chunk - chunk_offset
+  Args:
+    multichannel_wave_reader: (WaveReader) interleaved recording.
+    ref_channel: (int) index of the reference channel.
+    act_channels: (list of int) indexes of the actual channels.
+    settings: (AnalysisSettings) analysis settings.
+
+  Returns:
+    (list of 2-tuple) for each of |act_channels|, the latencies and dropouts
+    in the format returned by DetermineLatenciesAndDropouts().
+
+  Raises:
+    InputSignalException: if any of the channels is not in the recording.
+  """
+  num_channels = multichannel_wave_reader.GetNumberOfChannels()
+  for channel in [ref_channel] + list(act_channels):
+    if not 0 <= channel < num_channels:
+      raise InputSignalException('Channel %d is not in the recording, which '
+                                 'has %d channels.' % (channel, num_channels))
+
+  samp_rate = multichannel_wave_reader.GetSamplingRate()
+  samples_per_chunk = _GetSamplesPerChunk(samp_rate, settings)
+  sample_scaler = multichannel_wave_reader.GetSampleScaler()
+  pulse_tracker = _CreatePulseTracker(samp_rate, settings)
+
+  chunk_results = []
+  for position in _GetChunkPositions(
+      multichannel_wave_reader.GetNumberOfSamples(), samp_rate, settings):
+    frames = multichannel_wave_reader.ReadSamplesArray(
+        position, samples_per_chunk).reshape(-1, num_channels)
+
+    ref_chunk = wave_reader.Pcm2Float(frames[:, ref_channel], sample_scaler)
+    act_chunks = [wave_reader.Pcm2Float(frames[:, channel], sample_scaler)
+                  for channel in act_channels]
+
+    chunk_results.append(_AnalyzeChunk(
+        _LocateRefPulses(ref_chunk, samp_rate, settings, pulse_tracker,
+                         position),
+        act_chunks, samp_rate, position, settings))
+
+  return [_MergeChunkResults([results[index] for results in chunk_results])
+          for index in range(len(act_channels))]
+
+
+class StreamingAnalyzer(object):
+  """Determines latencies and dropouts of signals that are still recording.
+
+  Unlike DetermineLatenciesAndDropouts(), which needs complete recordings,
+  blocks of samples of any size can be given to Feed() as they are
+  captured. The latencies are returned as soon as the windows they belong to
+  are complete. Dropouts are returned once they can no longer be merged with
+  later ones (see NO_GAP_TIME_SECS), which for a dropout spanning
+  several windows means once the actual signal is back.
+
+  Only the samples needed to continue the analysis are kept, so memory is
+  bounded by STREAMING_WINDOWS_PER_BUFFER periods. The stats and percentiles
+  of the latencies returned so far are kept in a LatencySummary, see
+  latency_summary.
+  """
 
-  _CollapseTimestampList(dropouts)
-  return latencies, dropouts
+  def __init__(self, samp_rate, settings):
+    """Initializer.
+
+    Args:
+      samp_rate: (int) the sampling frequency of both signals in Hz.
+      settings: (AnalysisSettings) analysis settings.
+    """
+    self._samp_rate = samp_rate
+    self._settings = settings
+    self._samples_per_window = int(samp_rate * settings.period_secs)
+    self._window_size_latency = int(0.9 * self._samples_per_window)
+    self._samples_per_pulse = settings.pulse_duration_secs * samp_rate
+    self._half_window_time = self._samples_per_window * HALF / samp_rate
+
+    buffer_size = STREAMING_WINDOWS_PER_BUFFER * self._samples_per_window
+    self._ref_buffer = numpy.zeros(buffer_size)
+    self._act_buffer = numpy.zeros(buffer_size)
+    # Number of samples in the buffers.
+    self._buffer_len = 0
+    # Number of samples from the start of the signals to the buffers start.
+    self._buffer_offset = 0
+    # Value of _buffer_len after the last analysis.
+    self._analyzed_len = 0
+    # Where the next pulse search starts. None until the first analysis.
+    self._ind_search_start = None
+    self._pulse_tracker = _CreatePulseTracker(samp_rate, settings)
+    self._latency_summary = latency_summary.LatencySummary()
+
+    # Last valid latency used for dropout detection, latencies not used yet
+    # and dropouts that may still be merged with later ones.
+    self._prev_latency = None
+    self._unsettled_latencies = []
+    self._pending_dropouts = interval_set.IntervalSet(
+        min_gap_secs=NO_GAP_TIME_SECS)
+
+  def Feed(self, ref_block, act_block):
+    """Analyzes the next block of samples of the signals.
+
+    Args:
+      ref_block: (array_like) next samples of the reference signal
+        normalized to [-1, 1] (see wave_reader.Pcm2Float()).
+      act_block: (array_like) next samples of the actual signal normalized
+        to [-1, 1]. Must have as many samples as ref_block.
+
+    Returns:
+      A 2-tuple with the latencies and dropouts that were completed by the
+      block, in the format returned by DetermineLatenciesAndDropouts().
+
+    Raises:
+      InputSignalException: if the blocks have different lengths.
+    """
+    if len(ref_block) != len(act_block):
+      raise InputSignalException('The blocks of reference and actual have '
+                                 'to be the same length!\nCurrently I see '
+                                 'ref: %i, act: %i' % (len(ref_block),
+                                                       len(act_block)))
+    latencies = []
+    dropouts = []
+
+    position = 0
+    while position < len(ref_block):
+      num_samples = min(len(ref_block) - position,
+                        len(self._ref_buffer) - self._buffer_len)
+      buffer_end = self._buffer_len + num_samples
+      self._ref_buffer[self._buffer_len:buffer_end] = (
+          ref_block[position:position + num_samples])
+      self._act_buffer[self._buffer_len:buffer_end] = (
+          act_block[position:position + num_samples])
+      self._buffer_len = buffer_end
+      position += num_samples
+
+      if self._IsAnalysisDue():
+        block_latencies, block_dropouts = self._Analyze()
+        latencies += block_latencies
+        dropouts += block_dropouts
+
+    self._latency_summary.Add(latencies)
+    return latencies, dropouts
+
+  @property
+  def drift_ppm(self):
+    """(float) current estimate of the drift of the reference signal.
+
+    See _PulseTracker.drift_ppm. None if the pulse search doesn't track the
+    pulses or the period is not measured yet.
+    """
+    if self._pulse_tracker is None:
+      return None
+    return self._pulse_tracker.drift_ppm
+
+  @property
+  def latency_summary(self):
+    """(latency_summary.LatencySummary) the latencies returned so far."""
+    return self._latency_summary
+
+  def Flush(self):
+    """Analyzes the remaining samples, as the signals have ended.
+
+    Returns:
+      A 2-tuple with the remaining latencies and dropouts, in the format
+      returned by DetermineLatenciesAndDropouts().
+    """
+    latencies, dropouts = self._Analyze(final=True)
+    self._latency_summary.Add(latencies)
+    return latencies, dropouts
+
+  def _IsAnalysisDue(self):
+    """Tells if enough samples were fed since the last analysis."""
+    if self._buffer_len == len(self._ref_buffer):
+      return True
+    # The first analysis waits for a full buffer, like a file chunk would.
+    return (self._ind_search_start is not None and
+            self._buffer_len - self._analyzed_len >= self._samples_per_window)
+
+  def _GetActWindowEnd(self, latency):
+    """Gets the end (in the buffer) of the actual window of a latency."""
+    return (int(_FindPeakOnActual(latency) * self._samp_rate -
+                self._samples_per_window * HALF) -
+            self._buffer_offset + self._samples_per_window)
+
+  def _Analyze(self, final=False):
+    """Analyzes the buffered samples and drops the ones no longer needed.
+
+    Args:
+      final: (bool) whether no more samples will be fed.
+
+    Returns:
+      A 2-tuple with the new latencies and the finished dropouts.
+    """
+    settings = self._settings
+    ref_signal = self._ref_buffer[:self._buffer_len]
+    act_signal = self._act_buffer[:self._buffer_len]
+
+    ref_candidates = _CreatePulseCandidates(ref_signal, self._samp_rate,
+                                            settings)
+    win_starts = _LocatePulseWindows(
+        ref_signal, self._samples_per_pulse, self._window_size_latency,
+        settings.dropout_threshold, self._ind_search_start, ref_candidates,
+        self._pulse_tracker, self._buffer_offset)
+    latencies = _ComputeLatencies(
+        ref_signal, act_signal, win_starts, self._window_size_latency,
+        self._samp_rate, self._buffer_offset, settings.dropout_threshold,
+        ref_candidates)
+
+    # The dropouts around a latency are located once the whole window of
+    # the actual signal it refers to is available and, if invalid, once the
+    # next valid latency is known.
+    window_latencies = self._unsettled_latencies + latencies
+    num_settled = len(window_latencies) if final else 0
+    for index, latency in enumerate(window_latencies):
+      if (not final and not _IsInvalidWindow(latency) and
+          self._GetActWindowEnd(latency) <= self._buffer_len):
+        num_settled = index + 1
+    settled_latencies = window_latencies[:num_settled]
+    # Consecutive invalid latencies are equivalent to the first one.
+    self._unsettled_latencies = [
+        l for i, l in enumerate(window_latencies)
+        if i >= num_settled and not (
+            i > num_settled and _IsInvalidWindow(l) and
+            _IsInvalidWindow(window_latencies[i - 1]))]
+
+    if settled_latencies:
+      self._pending_dropouts.Extend(_LookForDropoutsInChunk(
+          act_signal, self._samples_per_window, self._samp_rate,
+          self._buffer_offset, settled_latencies, settings.silence_threshold,
+          settings.min_silence_len_secs, self._prev_latency))
+      valid_latencies = [l for l in settled_latencies
+                         if not _IsInvalidWindow(l)]
+      if valid_latencies:
+        self._prev_latency = valid_latencies[-1]
+
+    # Continue the search after the last window. If there are no windows,
+    # search again once more samples are available, unless the buffer is
+    # full.
+    if win_starts:
+      self._ind_search_start = win_starts[-1] + self._window_size_latency - 1
+    elif self._buffer_len == len(self._ref_buffer):
+      self._ind_search_start = max(
+          self._ind_search_start or 0,
+          self._buffer_len - self._window_size_latency)
+
+    if final:
+      return latencies, self._pending_dropouts.PopEndingBy(float('inf'))
+
+    # Samples before the next search will still be needed for the dropout
+    # detection of the next windows.
+    ind_keep_start = max(
+        self._ind_search_start -
+        STREAMING_WINDOWS_KEPT * self._samples_per_window, 0)
+    num_kept = self._buffer_len - ind_keep_start
+    self._ref_buffer[:num_kept] = self._ref_buffer[ind_keep_start:
+                                                   self._buffer_len]
+    self._act_buffer[:num_kept] = self._act_buffer[ind_keep_start:
+                                                   self._buffer_len]
+    self._buffer_offset += ind_keep_start
+    self._buffer_len = num_kept
+    self._analyzed_len = num_kept
+    self._ind_search_start -= ind_keep_start
+
+    # New dropouts start after the kept samples, except the one of the next
+    # invalid windows, which starts after the last valid window.
+    earliest_start = float(self._buffer_offset) / self._samp_rate
+    if self._prev_latency is not None:
+      earliest_start = min(earliest_start,
+                           _FindPeakOnActual(self._prev_latency) +
+                           self._half_window_time)
+    elif self._unsettled_latencies:
+      earliest_start = min(earliest_start,
+                           self._unsettled_latencies[0][0] -
+                           self._half_window_time)
+    dropouts = self._pending_dropouts.PopEndingBy(
+        earliest_start - NO_GAP_TIME_SECS)
+    return latencies, dropouts
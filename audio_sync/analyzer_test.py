@@ -16,12 +16,19 @@
 
 import math
 import os
+import shutil
+import tempfile
 import unittest
 import wave
 
+import numpy
+
+import audio_sync
 from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import latency_series
+from audio_sync import profiling
 from audio_sync import wave_reader
-import numpy
 
 # Absolute path to the folder containing the handcrafted (ref, act) filepairs
 TEST_DATA_DIR_ABS_PATH = os.path.join(
@@ -81,12 +88,15 @@ SILENCE_TRESHOLD = 0.05
 MIN_SILENCE_LENGTH_SEC = 0.005
 
 
-def _GetLatencies(ref_signal_path, act_signal_path):
+def _GetLatencies(ref_signal_path, act_signal_path,
+                  pulse_search=analyzer.PULSE_SEARCH_FULL):
   """Get the latencies between the given files.
 
   Args:
     ref_signal_path: (string) absolute path to handcrafted reference file.
     act_signal_path: (string) absolute path to handcrafted actual file.
+    pulse_search: (str) how the pulses are located, see
+      analyzer.PULSE_SEARCHES.
 
   Returns:
     (list of tuple(float, float)) latency values with timestamps.
@@ -97,7 +107,7 @@ def _GetLatencies(ref_signal_path, act_signal_path):
   try:
     settings = analyzer.AnalysisSettings(
         TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC, DROPOUT_TRESHOLD,
-        SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC)
+        SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC, pulse_search)
     return analyzer.DetermineLatenciesAndDropouts(
         ref_wave_reader, act_wave_reader, settings)
   finally:
@@ -274,6 +284,16 @@ class DropoutDetectionTest(unittest.TestCase):
     self._CompareHandcraftedDropoutFiles(ref_signal_path, act_signal_path,
                                          EXPECTED_DROPOUTS_2)
 
+  def testDropoutDetectionInLaterChunk(self):
+    """Checks short dropouts are found in chunks other than the first one."""
+    act_signal = numpy.ones(400) * 0.5
+    act_signal[200:260] = 0
+    latencies = [(10.15, 0.0)]
+    dropouts = analyzer._LookForDropoutsInChunk(
+        act_signal, 300, 1000, 10000, latencies, SILENCE_TRESHOLD,
+        MIN_SILENCE_LENGTH_SEC)
+    self.assertEqual([(10.2, 10.26)], dropouts)
+
   def testDropoutDetectionOnSilentLeader(self):
     """Cornercase: leader is silent, yet follower is playing.
 
@@ -298,5 +318,549 @@ class DropoutDetectionTest(unittest.TestCase):
 
     self._CompareHandcraftedDropoutFiles(ref_signal_path, act_signal_path, [])
 
+
+class PulseSearchTest(unittest.TestCase):
+  """Tests for the pulse search of the latency_measurement module."""
+
+  WIN_SIZE = 90
+  SAMPLES_PER_PULSE = 4
+
+  def _GetPulseTrain(self, num_samples, pulse_positions, pulse_length=2):
+    """Gets a silent signal with one pulse at each of |pulse_positions|."""
+    signal = numpy.zeros(num_samples)
+    for position in pulse_positions:
+      signal[position] = 0.8
+      signal[position + pulse_length] = -0.8
+    return signal
+
+  def testFindValidWindows(self):
+    """Checks every valid window is found and centered on its pulse.
+
+    The window starting at 630 is not valid, since its max is at index 0.
+    """
+    signal = self._GetPulseTrain(1000, [30, 130, 230, 630])
+    win_starts = analyzer._FindValidWindows(
+        signal, self.SAMPLES_PER_PULSE, self.WIN_SIZE, DROPOUT_TRESHOLD)
+    self.assertEqual([30 - 45, 130 - 45, 130 - 45, 230 - 45, 230 - 45,
+                      630 - 45], win_starts.tolist())
+
+  def testFindValidWindowsDiscardsLongPulses(self):
+    """Checks windows with too many samples between min and max are invalid."""
+    signal = self._GetPulseTrain(1000, [130], pulse_length=10)
+    win_starts = analyzer._FindValidWindows(
+        signal, self.SAMPLES_PER_PULSE, self.WIN_SIZE, DROPOUT_TRESHOLD)
+    self.assertEqual(0, len(win_starts))
+
+  def testGetNextWinStart(self):
+    """Checks the first valid window is returned after a silent stretch."""
+    signal = self._GetPulseTrain(10000, [9000])
+    self.assertEqual(9000 - 45, analyzer._GetNextWinStart(
+        signal, self.SAMPLES_PER_PULSE, self.WIN_SIZE, DROPOUT_TRESHOLD))
+
+  def testGetNextWinStartOnSilence(self):
+    """Checks 0 is returned if there are no valid windows."""
+    self.assertEqual(0, analyzer._GetNextWinStart(
+        numpy.zeros(10000), self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+        DROPOUT_TRESHOLD))
+
+
+class DecimatedPulseSearchTest(unittest.TestCase):
+  """Tests for the search of pulses on a decimated envelope."""
+
+  WIN_SIZE = 90
+  SAMPLES_PER_PULSE = 4
+  BLOCK_SIZE = 8
+
+  def _GetNoisySignal(self, seed, noise_amplitude):
+    """Gets noise with pulses, and positive only bursts, at random positions.
+
+    The bursts are as long as the pulses, so windows often end or start in
+    the middle of their blocks.
+    """
+    random_state = numpy.random.RandomState(seed)
+    signal = random_state.uniform(-noise_amplitude, noise_amplitude, 3000)
+    for position in random_state.randint(0, 2990, 20):
+      signal[position:position + 3] = [0.9, 0, -0.9]
+    for position in random_state.randint(0, 2990, 20):
+      signal[position:position + 3] = [0.7, 0.8, 0.9]
+    return signal
+
+  def testFindValidWindows(self):
+    """Checks the same windows are found as on the full signal."""
+    for seed in range(20):
+      # Noise reaching the threshold, and quiet noise.
+      for noise_amplitude in (0.7, 0.1):
+        signal = self._GetNoisySignal(seed, noise_amplitude)
+        candidates = analyzer._PulseCandidates(signal, self.BLOCK_SIZE,
+                                               DROPOUT_TRESHOLD)
+        for start in (0, 17, 1500):
+          self.assertEqual(
+              analyzer._FindValidWindows(
+                  signal[start:], self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+                  DROPOUT_TRESHOLD).tolist(),
+              candidates.FindValidWindows(
+                  start, self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+                  DROPOUT_TRESHOLD).tolist())
+          self.assertEqual(
+              analyzer._GetNextWinStart(
+                  signal[start:], self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+                  DROPOUT_TRESHOLD),
+              analyzer._GetNextWinStart(
+                  signal[start:], self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+                  DROPOUT_TRESHOLD, candidates, start))
+
+  def testFindValidWindowsOnPositiveTail(self):
+    """Checks a window with only the positive tail of a block is invalid."""
+    signal = numpy.zeros(300)
+    signal[45:48] = [0.7, 0.8, 0.9]
+    candidates = analyzer._PulseCandidates(signal, self.BLOCK_SIZE,
+                                           DROPOUT_TRESHOLD)
+    self.assertEqual([], analyzer._FindValidWindows(
+        signal, self.SAMPLES_PER_PULSE, self.WIN_SIZE,
+        DROPOUT_TRESHOLD).tolist())
+    self.assertEqual([], candidates.FindValidWindows(
+        0, self.SAMPLES_PER_PULSE, self.WIN_SIZE, DROPOUT_TRESHOLD).tolist())
+    self.assertEqual(0, analyzer._GetNextWinStart(
+        signal, self.SAMPLES_PER_PULSE, self.WIN_SIZE, DROPOUT_TRESHOLD,
+        candidates))
+
+  def testArgMax(self):
+    """Checks maxima reaching the threshold are exact, others below it."""
+    signal = numpy.zeros(100)
+    signal[[20, 30, 60]] = [0.8, 0.9, 0.9]
+    signal[80] = 0.5
+    candidates = analyzer._PulseCandidates(signal, self.BLOCK_SIZE,
+                                           DROPOUT_TRESHOLD)
+    self.assertEqual((10, 0.9), candidates.ArgMax(20, 100))
+    self.assertEqual((0, 0.8), candidates.ArgMax(20, 30))
+    _, value_max = candidates.ArgMax(70, 100)
+    self.assertLess(value_max, DROPOUT_TRESHOLD)
+
+  def testSameResultsAsFullSearch(self):
+    """Checks the results of the test files are the same as for full search."""
+    for ref_wav, act_wav in ((REF_WAV_0, ACT_WAV_0), (REF_WAV_1, ACT_WAV_1),
+                             (REF_WAV_2, ACT_WAV_2), (REF_WAV_3, ACT_WAV_3),
+                             (REF_WAV_4, ACT_WAV_4), (REF_WAV_5, ACT_WAV_5),
+                             (REF_WAV_6, ACT_WAV_6)):
+      ref_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, ref_wav)
+      act_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, act_wav)
+      self.assertEqual(
+          repr(_GetLatencies(ref_signal_path, act_signal_path)),
+          repr(_GetLatencies(ref_signal_path, act_signal_path,
+                             analyzer.PULSE_SEARCH_DECIMATED)))
+
+  def testExceptionOnUnknownPulseSearch(self):
+    """Checks unknown pulse searches are rejected."""
+    with self.assertRaises(ValueError):
+      _GetLatencies(os.path.join(TEST_DATA_DIR_ABS_PATH, REF_WAV_0),
+                    os.path.join(TEST_DATA_DIR_ABS_PATH, ACT_WAV_0),
+                    'unknown')
+
+
+class TrackedPulseSearchTest(unittest.TestCase):
+  """Tests for the search of pulses around their predicted position."""
+
+  SAMP_RATE = 8000
+  SETTINGS = analyzer.AnalysisSettings(
+      0.1, 0.002, 0.5, 0.05, 0.005, analyzer.PULSE_SEARCH_TRACKED)
+
+  def _GetPulses(self, peaks):
+    """Gets a signal with a one cycle pulse peaking at each of |peaks|.
+
+    Each pulse ends before the next one.
+    """
+    signal = numpy.zeros(peaks[-1] + 400)
+    for peak in peaks:
+      signal[peak - 2:peak + 7] = [0.5, 0.7, 0.9, 0.5, 0, -0.5, -0.9, -0.5, 0]
+    return signal
+
+  def testPredictsDriftingPulses(self):
+    """Checks the pulses are tracked and the drift is measured."""
+    instrumentation = profiling.Instrumentation()
+    tracker = analyzer._PulseTracker(self.SAMP_RATE, self.SETTINGS,
+                                     instrumentation)
+    # The period is 799 samples instead of 800.
+    peaks = [100 + 799 * index for index in range(20)]
+    signal = self._GetPulses(peaks)
+    win_size = 720
+
+    win_starts = analyzer._LocatePulseWindows(
+        signal, 16, win_size, 0.5, pulse_tracker=tracker)
+    self.assertEqual([peak - win_size // 2 for peak in peaks], win_starts)
+    self.assertAlmostEqual((800 / 799.0 - 1) * 1e6, tracker.drift_ppm,
+                           places=6)
+    report = instrumentation.GetReport()
+    self.assertEqual(19, report['counters'][profiling.COUNTER_TRACKED_PULSES])
+    self.assertNotIn(profiling.COUNTER_LOST_LOCKS, report['counters'])
+    self.assertEqual(tracker.drift_ppm,
+                     report['values'][profiling.VALUE_DRIFT_PPM])
+
+  def testFallsBackToFullSearch(self):
+    """Checks missing and shifted pulses are found by the full search."""
+    instrumentation = profiling.Instrumentation()
+    tracker = analyzer._PulseTracker(self.SAMP_RATE, self.SETTINGS,
+                                     instrumentation)
+    # The 4th pulse is missing, and the ones from the 6th are shifted.
+    peaks = [100, 900, 1700, 3300, 4100, 5000, 5800]
+    win_starts = analyzer._LocatePulseWindows(
+        self._GetPulses(peaks), 16, 720, 0.5, pulse_tracker=tracker)
+    self.assertEqual([peak - 360 for peak in peaks], win_starts)
+    self.assertEqual(
+        2, instrumentation.GetReport()['counters'][
+            profiling.COUNTER_LOST_LOCKS])
+    self.assertAlmostEqual(0, tracker.drift_ppm)
+
+  def testSameResultsAsFullSearch(self):
+    """Checks the results of the test files are the same as for full search."""
+    for ref_wav, act_wav in ((REF_WAV_0, ACT_WAV_0), (REF_WAV_1, ACT_WAV_1),
+                             (REF_WAV_2, ACT_WAV_2), (REF_WAV_3, ACT_WAV_3),
+                             (REF_WAV_4, ACT_WAV_4), (REF_WAV_5, ACT_WAV_5),
+                             (REF_WAV_6, ACT_WAV_6)):
+      ref_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, ref_wav)
+      act_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, act_wav)
+      self.assertEqual(
+          repr(_GetLatencies(ref_signal_path, act_signal_path)),
+          repr(_GetLatencies(ref_signal_path, act_signal_path,
+                             analyzer.PULSE_SEARCH_TRACKED)))
+
+  def testDriftOfGeneratedRecording(self):
+    """Checks the drift is tracked across chunks, with the same results."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      ref_path = os.path.join(temp_dir, 'ref.wav')
+      act_path = os.path.join(temp_dir, 'act.wav')
+      generator_settings = generator.DEFAULT_GENERATOR_SETTINGS._replace(
+          samp_rate=self.SAMP_RATE)
+      generator.WriteTestAudio(ref_path, 40, generator_settings, [
+          generator.Impairments(drift_ppm=-300, dropouts=[(10.0, 10.35)])])
+      generator.WriteTestAudio(act_path, 40, generator_settings, [
+          generator.Impairments(latency_secs=0.001, drift_ppm=-300,
+                                dropouts=[(20.0, 21.0)])], seed=1)
+      results = {}
+      for pulse_search in (analyzer.PULSE_SEARCH_FULL,
+                           analyzer.PULSE_SEARCH_TRACKED):
+        instrumentation = profiling.Instrumentation()
+        results[pulse_search] = repr(audio_sync.AnalyzeAudios(
+            ref_path, act_path, self.SETTINGS._replace(
+                pulse_search=pulse_search),
+            instrumentation=instrumentation))
+    finally:
+      shutil.rmtree(temp_dir)
+
+    self.assertEqual(results[analyzer.PULSE_SEARCH_FULL],
+                     results[analyzer.PULSE_SEARCH_TRACKED])
+    report = instrumentation.GetReport()
+    self.assertAlmostEqual(-300, report['values'][profiling.VALUE_DRIFT_PPM],
+                           delta=5)
+    self.assertGreater(report['counters'][profiling.COUNTER_TRACKED_PULSES],
+                       report['counters'][profiling.COUNTER_LOST_LOCKS])
+
+
+class SilenceRunsTest(unittest.TestCase):
+  """Tests for the run-length silence detection."""
+
+  def testFindSilenceRuns(self):
+    """Checks runs are found at the borders and in the middle of a signal."""
+    signal = numpy.array([0.0, 0.0, 0.5, 0.01, -0.01, 0.0, -0.7, 0.0])
+    run_starts, run_ends = analyzer._FindSilenceRuns(signal, SILENCE_TRESHOLD)
+    self.assertEqual([0, 3, 7], run_starts.tolist())
+    self.assertEqual([2, 6, 8], run_ends.tolist())
+
+  def testLookForDropoutsInWindows(self):
+    """Checks silence runs are clipped to the windows they intersect."""
+    silence_runs = (numpy.array([10, 50]), numpy.array([30, 100]))
+    dropouts = analyzer._LookForDropoutsInWindows(
+        silence_runs, [0, 20, 60], [40, 60, 70], 10, 0, 0.5)
+    self.assertEqual([[(1.0, 3.0)], [(2.0, 3.0), (5.0, 5.9)], [(6.0, 6.9)]],
+                     dropouts)
+
+  def testLookForDropoutsInWindowsIgnoresShortSilence(self):
+    """Checks silence runs shorter than the minimum length are ignored."""
+    silence_runs = (numpy.array([10]), numpy.array([15]))
+    dropouts = analyzer._LookForDropoutsInWindows(
+        silence_runs, [0], [40], 10, 0, 0.5)
+    self.assertEqual([[]], dropouts)
+
+
+class StreamingAnalyzerTest(unittest.TestCase):
+  """Tests for the StreamingAnalyzer class."""
+
+  def _ReadSignal(self, wave_path):
+    reader = wave_reader.WaveReader(wave.open(wave_path))
+    try:
+      scaler = 2 ** (analyzer.BITS_PER_BYTE * reader.GetSampleWidth() - 1)
+      return (reader.GetSamplingRate(),
+              wave_reader.Pcm2Float(reader.ReadSamplesArray(), scaler))
+    finally:
+      reader.Close()
+
+  def _AssertSameResults(self, expected, actual):
+    self.assertEqual(len(expected), len(actual))
+    for expected_value, actual_value in zip(expected, actual):
+      self.assertEqual(expected_value[0], actual_value[0])
+      if math.isnan(expected_value[1]):
+        self.assertTrue(math.isnan(actual_value[1]))
+      else:
+        self.assertEqual(expected_value[1], actual_value[1])
+
+  def _CheckSameResultsAsFiles(self, ref_wav, act_wav, block_size,
+                               pulse_search=analyzer.PULSE_SEARCH_FULL):
+    ref_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, ref_wav)
+    act_signal_path = os.path.join(TEST_DATA_DIR_ABS_PATH, act_wav)
+    expected_latencies, expected_dropouts = _GetLatencies(ref_signal_path,
+                                                          act_signal_path)
+
+    samp_rate, ref_signal = self._ReadSignal(ref_signal_path)
+    _, act_signal = self._ReadSignal(act_signal_path)
+    streaming_analyzer = analyzer.StreamingAnalyzer(
+        samp_rate, analyzer.AnalysisSettings(
+            TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC,
+            DROPOUT_TRESHOLD, SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC,
+            pulse_search))
+    latencies = []
+    dropouts = []
+    for position in range(0, len(ref_signal), block_size):
+      block_latencies, block_dropouts = streaming_analyzer.Feed(
+          ref_signal[position:position + block_size],
+          act_signal[position:position + block_size])
+      latencies += block_latencies
+      dropouts += block_dropouts
+    block_latencies, block_dropouts = streaming_analyzer.Flush()
+    latencies += block_latencies
+    dropouts += block_dropouts
+
+    self._AssertSameResults(expected_latencies, latencies)
+    self._AssertSameResults(expected_dropouts, dropouts)
+    self.assertEqual(len(latencies),
+                     streaming_analyzer.latency_summary.num_latencies)
+    self.assertEqual(
+        latency_series.LatencySeries.FromPairs(latencies).GetStats()[:2],
+        streaming_analyzer.latency_summary.GetStats()[:2])
+    return streaming_analyzer
+
+  def testLatencies(self):
+    """Checks latencies are the same as for the whole files."""
+    for block_size in (100, 1234, 100000):
+      self._CheckSameResultsAsFiles(REF_WAV_0, ACT_WAV_0, block_size)
+      self._CheckSameResultsAsFiles(REF_WAV_1, ACT_WAV_1, block_size)
+
+  def testDropouts(self):
+    """Checks dropouts are the same as for the whole files."""
+    for block_size in (100, 1234, 100000):
+      self._CheckSameResultsAsFiles(REF_WAV_2, ACT_WAV_2, block_size)
+      self._CheckSameResultsAsFiles(REF_WAV_3, ACT_WAV_3, block_size)
+      self._CheckSameResultsAsFiles(REF_WAV_4, ACT_WAV_4, block_size)
+
+  def testTrackedPulses(self):
+    """Checks tracked pulses give the same results, and the drift."""
+    for block_size in (100, 1234, 100000):
+      for ref_wav, act_wav in ((REF_WAV_0, ACT_WAV_0), (REF_WAV_2, ACT_WAV_2),
+                               (REF_WAV_4, ACT_WAV_4)):
+        streaming_analyzer = self._CheckSameResultsAsFiles(
+            ref_wav, act_wav, block_size, analyzer.PULSE_SEARCH_TRACKED)
+        self.assertEqual(0, streaming_analyzer.drift_ppm)
+    self.assertIsNone(self._CheckSameResultsAsFiles(
+        REF_WAV_0, ACT_WAV_0, 1234).drift_ppm)
+
+  def testResultsAreReturnedWhileFeeding(self):
+    """Checks results are returned before the signals end."""
+    samp_rate, ref_signal = self._ReadSignal(
+        os.path.join(TEST_DATA_DIR_ABS_PATH, REF_WAV_2))
+    _, act_signal = self._ReadSignal(
+        os.path.join(TEST_DATA_DIR_ABS_PATH, ACT_WAV_2))
+    streaming_analyzer = analyzer.StreamingAnalyzer(
+        samp_rate, analyzer.AnalysisSettings(
+            TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC,
+            DROPOUT_TRESHOLD, SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC))
+    latencies, dropouts = streaming_analyzer.Feed(ref_signal, act_signal)
+    self.assertTrue(latencies)
+    self.assertTrue(dropouts)
+
+  def testExceptionOnDifferentBlockLengths(self):
+    """Checks blocks of different lengths are rejected."""
+    streaming_analyzer = analyzer.StreamingAnalyzer(
+        8000, analyzer.AnalysisSettings(
+            TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC,
+            DROPOUT_TRESHOLD, SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC))
+    with self.assertRaises(analyzer.InputSignalException):
+      streaming_analyzer.Feed(numpy.zeros(10), numpy.zeros(20))
+
+
+class MultichannelAnalysisTest(unittest.TestCase):
+  """Tests for the analysis of channels of a single recording."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._settings = analyzer.AnalysisSettings(
+        TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC,
+        DROPOUT_TRESHOLD, SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _WriteInterleaved(self, wave_names):
+    """Interleaves mono files with the same format into a multichannel file."""
+    channels = []
+    for wave_name in wave_names:
+      reader = wave_reader.WaveReader(
+          wave.open(os.path.join(TEST_DATA_DIR_ABS_PATH, wave_name)))
+      try:
+        samp_rate = reader.GetSamplingRate()
+        samp_width = reader.GetSampleWidth()
+        channels.append(reader.ReadSamplesArray())
+      finally:
+        reader.Close()
+
+    wave_path = os.path.join(self._temp_dir, 'multichannel.wav')
+    wave_file = wave.open(wave_path, 'wb')
+    try:
+      wave_file.setnchannels(len(channels))
+      wave_file.setsampwidth(samp_width)
+      wave_file.setframerate(samp_rate)
+      wave_file.writeframes(numpy.column_stack(channels).tobytes())
+    finally:
+      wave_file.close()
+    return wave_path
+
+  def _AssertSameResults(self, expected, actual):
+    self.assertEqual(len(expected), len(actual))
+    for expected_value, actual_value in zip(expected, actual):
+      self.assertEqual(expected_value[0], actual_value[0])
+      if math.isnan(expected_value[1]):
+        self.assertTrue(math.isnan(actual_value[1]))
+      else:
+        self.assertEqual(expected_value[1], actual_value[1])
+
+  def testSameResultsAsMonoFiles(self):
+    """Checks every channel gives the same results as the mono files."""
+    wave_path = self._WriteInterleaved([ACT_WAV_2, REF_WAV_2, ACT_WAV_3])
+    for use_mmap in (False, True):
+      reader = wave_reader.CreateWaveReader(wave_path, use_mmap)
+      try:
+        results = analyzer.DetermineMultichannelLatenciesAndDropouts(
+            reader, 1, [0, 2], self._settings)
+      finally:
+        reader.Close()
+
+      self.assertEqual(2, len(results))
+      for act_wav, (latencies, dropouts) in zip([ACT_WAV_2, ACT_WAV_3],
+                                                results):
+        expected_latencies, expected_dropouts = _GetLatencies(
+            os.path.join(TEST_DATA_DIR_ABS_PATH, REF_WAV_2),
+            os.path.join(TEST_DATA_DIR_ABS_PATH, act_wav))
+        self._AssertSameResults(expected_latencies, latencies)
+        self._AssertSameResults(expected_dropouts, dropouts)
+
+  def testExceptionOnMissingChannel(self):
+    """Checks channels that are not in the recording are rejected."""
+    wave_path = self._WriteInterleaved([REF_WAV_2, ACT_WAV_2])
+    reader = wave_reader.CreateWaveReader(wave_path)
+    try:
+      with self.assertRaises(analyzer.InputSignalException):
+        analyzer.DetermineMultichannelLatenciesAndDropouts(
+            reader, 0, [2], self._settings)
+    finally:
+      reader.Close()
+
+
+class ParallelAnalysisTest(unittest.TestCase):
+  """Tests for the analysis of chunks in a process pool."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._settings = analyzer.AnalysisSettings(
+        TESTFILE_FUND_PERIOD_SEC, TESTFILE_PULSE_DURATION_SEC,
+        DROPOUT_TRESHOLD, SILENCE_TRESHOLD, MIN_SILENCE_LENGTH_SEC)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _WriteRepeated(self, wave_name, repetitions, lead_samples=0):
+    """Writes a file repeating |wave_name|, long enough for several chunks.
+
+    The repetitions are preceded by |lead_samples| samples of silence.
+    """
+    reader = wave_reader.WaveReader(
+        wave.open(os.path.join(TEST_DATA_DIR_ABS_PATH, wave_name)))
+    try:
+      samp_rate = reader.GetSamplingRate()
+      samp_width = reader.GetSampleWidth()
+      samples = reader.ReadSamplesArray()
+    finally:
+      reader.Close()
+
+    wave_path = os.path.join(self._temp_dir, wave_name)
+    wave_file = wave.open(wave_path, 'wb')
+    try:
+      wave_file.setnchannels(1)
+      wave_file.setsampwidth(samp_width)
+      wave_file.setframerate(samp_rate)
+      wave_file.writeframes(numpy.concatenate((
+          numpy.zeros(lead_samples, samples.dtype),
+          numpy.tile(samples, repetitions))).tobytes())
+    finally:
+      wave_file.close()
+    return wave_path
+
+  def testSameResultsAsSequentialAnalysis(self):
+    """Checks the process pool gives the results of the sequential analysis."""
+    ref_signal_path = self._WriteRepeated(REF_WAV_0, 30)
+    act_signal_path = self._WriteRepeated(ACT_WAV_0, 30)
+    expected = _GetLatencies(ref_signal_path, act_signal_path)
+
+    for use_mmap in (False, True):
+      latencies, dropouts = analyzer.DetermineLatenciesAndDropoutsInParallel(
+          ref_signal_path, act_signal_path, self._settings, jobs=2,
+          use_mmap=use_mmap)
+      self.assertEqual(repr(expected[0]), repr(latencies))
+      self.assertEqual(repr(expected[1]), repr(dropouts))
+
+  def testNoDuplicatesAtChunkSeams(self):
+    """Checks pulses in the overlap of two chunks are measured once.
+
+    The silence at the start moves a pulse into the overlap of the first two
+    chunks.
+    """
+    ref_signal_path = self._WriteRepeated(REF_WAV_0, 30, lead_samples=100)
+    act_signal_path = self._WriteRepeated(ACT_WAV_0, 30, lead_samples=100)
+    latencies, _ = _GetLatencies(ref_signal_path, act_signal_path)
+    timestamps = [timestamp for timestamp, _ in latencies]
+    self.assertEqual(sorted(set(timestamps)), timestamps)
+    self.assertEqual(len(EXPECTED_LATENCIES_0) * 30, len(latencies))
+
+  def testMergeChunkResults(self):
+    """Checks latencies measured in two chunks are only kept once."""
+    latencies, dropouts = analyzer._MergeChunkResults([
+        ([(1.0, 0.0), (1.3, 0.1)], [(1.4, 1.5)]),
+        ([(1.3, 0.1), (1.6, float('nan'))], [(1.5, 1.7)])])
+    self.assertEqual([(1.0, 0.0), (1.3, 0.1)], latencies[:2])
+    self.assertEqual(3, len(latencies))
+    self.assertTrue(math.isnan(latencies[2][1]))
+    self.assertEqual([(1.4, 1.7)], dropouts)
+
+  def testIterLatenciesAndDropouts(self):
+    """Checks the results of each chunk add up to the whole analysis."""
+    ref_signal_path = self._WriteRepeated(REF_WAV_2, 30)
+    act_signal_path = self._WriteRepeated(ACT_WAV_3, 30)
+    expected = _GetLatencies(ref_signal_path, act_signal_path)
+
+    ref_wave_reader = wave_reader.CreateWaveReader(ref_signal_path)
+    act_wave_reader = wave_reader.CreateWaveReader(act_signal_path)
+    try:
+      chunk_results = list(analyzer.IterLatenciesAndDropouts(
+          ref_wave_reader, act_wave_reader, self._settings))
+    finally:
+      act_wave_reader.Close()
+      ref_wave_reader.Close()
+    self.assertGreater(len(chunk_results), 2)
+    latencies = []
+    dropouts = []
+    for chunk_latencies, chunk_dropouts in chunk_results:
+      latencies += chunk_latencies
+      dropouts += chunk_dropouts
+    self.assertEqual(repr(list(expected[0])), repr(latencies))
+    self.assertEqual(repr(expected[1]), repr(dropouts))
+
+
 if __name__ == '__main__':
   unittest.main()
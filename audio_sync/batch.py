@@ -0,0 +1,173 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Analysis of many (ref, act) pairs listed in a manifest.
+
+A manifest is either a CSV file with a header row, or a JSONL file with one
+JSON object per line. Each row has the fields 'ref_wav_path' and
+'act_wav_path', and optionally any of SETTINGS_FIELDS to override the
+analysis settings for that pair. Other fields are kept as they are, so they
+can be used to identify the pairs in the results.
+"""
+
+import csv
+import json
+import os
+
+import audio_sync
+from audio_sync import analysis_settings
+from audio_sync import lazy_loader
+
+# Only needed to analyze manifests, not to read them.
+multiprocessing = lazy_loader.LazyLoader('multiprocessing', globals(),
+                                         'multiprocessing')
+
+
+# Fields of a manifest row holding numeric analysis settings, named after the
+# CLI flags
+NUMERIC_SETTINGS_FIELDS = ('period', 'pulse_length', 'dropout_threshold',
+                           'silence_threshold', 'min_silence_length',
+                           'latency_threshold')
+# Fields of a manifest row holding the analysis settings
+SETTINGS_FIELDS = NUMERIC_SETTINGS_FIELDS + ('pulse_search',)
+# Fields every manifest row must have
+REQUIRED_FIELDS = ('ref_wav_path', 'act_wav_path')
+# Extensions of manifests in JSONL format, all others are read as CSV
+JSONL_EXTENSIONS = ('.json', '.jsonl')
+
+
+class ManifestException(Exception):
+  """Exception for manifests that can't be read."""
+
+
+def _ReadJsonLines(manifest_file):
+  """Reads the rows of a JSONL manifest."""
+  rows = []
+  for line_number, line in enumerate(manifest_file, 1):
+    if not line.strip():
+      continue
+    try:
+      row = json.loads(line)
+    except ValueError as e:
+      raise ManifestException('Line %d is not valid JSON: %s' % (
+          line_number, e))
+    if not isinstance(row, dict):
+      raise ManifestException('Line %d is not a JSON object.' % line_number)
+    rows.append(row)
+  return rows
+
+
+def _ReadCsv(manifest_file):
+  """Reads the rows of a CSV manifest, ignoring empty cells."""
+  return [dict((key, value) for key, value in row.items() if value)
+          for row in csv.DictReader(manifest_file)]
+
+
+def ReadManifest(manifest_path):
+  """Reads the pairs to analyze from a manifest.
+
+  Args:
+    manifest_path: (string) path to a CSV or JSONL manifest.
+
+  Returns:
+    (list of dict) one dict per pair, with the numeric settings fields
+    converted to float.
+
+  Raises:
+    ManifestException: if a row is not valid.
+  """
+  with open(manifest_path) as manifest_file:
+    if os.path.splitext(manifest_path)[1].lower() in JSONL_EXTENSIONS:
+      rows = _ReadJsonLines(manifest_file)
+    else:
+      rows = _ReadCsv(manifest_file)
+
+  for index, row in enumerate(rows):
+    for field in REQUIRED_FIELDS:
+      if field not in row:
+        raise ManifestException('Row %d has no %s.' % (index + 1, field))
+    for field in NUMERIC_SETTINGS_FIELDS:
+      if field in row:
+        try:
+          row[field] = float(row[field])
+        except (TypeError, ValueError):
+          raise ManifestException('Row %d has an invalid %s: %r' % (
+              index + 1, field, row[field]))
+  return rows
+
+
+def AnalyzeRow(task):
+  """Analyzes the pair of one manifest row.
+
+  Args:
+    task: (tuple) the row, the default settings, whether to use memory
+      maps and the cache.DirectoryCache to use, if any.
+
+  Returns:
+    (dict) the row with the settings used, and either the 'latencies' and
+    'dropouts' or the 'error' that prevented the analysis.
+  """
+  row, default_settings, use_mmap, analysis_cache = task
+  record = dict(default_settings)
+  record.update(row)
+  try:
+    settings = analysis_settings.AnalysisSettings(
+        record['period'], record['pulse_length'], record['dropout_threshold'],
+        record['silence_threshold'], record['min_silence_length'],
+        record['pulse_search'])
+    latencies, dropouts = audio_sync.AnalyzeAudios(
+        record['ref_wav_path'], record['act_wav_path'], settings,
+        use_mmap=use_mmap, analysis_cache=analysis_cache)
+  except Exception as e:  # pylint: disable=broad-except
+    record['error'] = '%s: %s' % (type(e).__name__, e)
+  else:
+    record['latencies'] = list(latencies)
+    record['dropouts'] = dropouts
+  return record
+
+
+def AnalyzeManifest(rows, default_settings, jobs=1, use_mmap=False,
+                    analysis_cache=None):
+  """Analyzes the pairs of a manifest in a pool of processes.
+
+  A failure to analyze a pair doesn't stop the analysis of the others, but is
+  reported in the record of the pair.
+
+  Args:
+    rows: (list of dict) the rows returned by ReadManifest().
+    default_settings: (dict) value of each of SETTINGS_FIELDS for rows
+      without it.
+    jobs: (int) number of processes, or None to use every CPU.
+    use_mmap: (bool) whether to read the files through memory maps (see
+      wave_reader.MmapWaveReader).
+    analysis_cache: (cache.DirectoryCache) cache shared by the processes, see
+      audio_sync.AnalyzeAudios().
+
+  Yields:
+    (dict) the record of each row, in the order of |rows|, see AnalyzeRow().
+  """
+  tasks = [(row, default_settings, use_mmap, analysis_cache) for row in rows]
+  if jobs == 1 or len(tasks) <= 1:
+    for task in tasks:
+      yield AnalyzeRow(task)
+    return
+
+  pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(),
+                                  len(tasks)))
+  try:
+    for record in pool.imap(AnalyzeRow, tasks):
+      yield record
+  finally:
+    pool.close()
+    pool.join()
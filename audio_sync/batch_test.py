@@ -0,0 +1,108 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the batch module."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from audio_sync import batch
+
+# Absolute path to the folder containing the handcrafted (ref, act) filepairs
+TEST_DATA_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'test_data')
+
+REF_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_ref_2.wav')
+ACT_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_act_2.wav')
+MISSING_WAV_PATH = os.path.join(TEST_DATA_DIR, 'missing.wav')
+
+DEFAULT_SETTINGS = {
+    'period': 0.3,
+    'pulse_length': 0.002,
+    'dropout_threshold': 0.3,
+    'silence_threshold': 0.05,
+    'min_silence_length': 0.005,
+    'latency_threshold': 0.001,
+    'pulse_search': 'full',
+}
+
+
+class BatchTest(unittest.TestCase):
+  """Tests for reading and analyzing manifests."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _WriteManifest(self, name, content):
+    manifest_path = os.path.join(self._temp_dir, name)
+    with open(manifest_path, 'w') as manifest_file:
+      manifest_file.write(content)
+    return manifest_path
+
+  def testReadCsvManifest(self):
+    """Checks settings are converted and empty cells are left out."""
+    manifest_path = self._WriteManifest(
+        'manifest.csv',
+        'id,ref_wav_path,act_wav_path,period\n'
+        'a,ref.wav,act.wav,0.3\n'
+        'b,ref.wav,act.wav,\n')
+    rows = batch.ReadManifest(manifest_path)
+    self.assertEqual([{'id': 'a', 'ref_wav_path': 'ref.wav',
+                       'act_wav_path': 'act.wav', 'period': 0.3},
+                      {'id': 'b', 'ref_wav_path': 'ref.wav',
+                       'act_wav_path': 'act.wav'}], rows)
+
+  def testReadJsonLinesManifest(self):
+    """Checks each line of a JSONL manifest is a row."""
+    manifest_path = self._WriteManifest(
+        'manifest.jsonl',
+        json.dumps({'ref_wav_path': 'ref.wav', 'act_wav_path': 'act.wav',
+                    'latency_threshold': 1}) + '\n\n')
+    rows = batch.ReadManifest(manifest_path)
+    self.assertEqual([{'ref_wav_path': 'ref.wav', 'act_wav_path': 'act.wav',
+                       'latency_threshold': 1.0}], rows)
+
+  def testExceptionOnInvalidRows(self):
+    """Checks rows without paths or with invalid settings are rejected."""
+    for content in ('ref_wav_path\nref.wav\n',
+                    'ref_wav_path,act_wav_path,period\nref.wav,act.wav,x\n'):
+      manifest_path = self._WriteManifest('manifest.csv', content)
+      with self.assertRaises(batch.ManifestException):
+        batch.ReadManifest(manifest_path)
+
+  def testAnalyzeManifest(self):
+    """Checks a pair that can't be analyzed doesn't stop the others."""
+    rows = [{'ref_wav_path': REF_WAV_PATH, 'act_wav_path': ACT_WAV_PATH},
+            {'ref_wav_path': MISSING_WAV_PATH, 'act_wav_path': ACT_WAV_PATH},
+            {'ref_wav_path': REF_WAV_PATH, 'act_wav_path': REF_WAV_PATH,
+             'period': 0.1}]
+    for jobs in (1, 2):
+      records = list(batch.AnalyzeManifest(rows, DEFAULT_SETTINGS, jobs=jobs))
+      self.assertEqual(3, len(records))
+      self.assertTrue(records[0]['latencies'])
+      self.assertEqual(0.3, records[0]['period'])
+      self.assertIn('error', records[1])
+      self.assertNotIn('latencies', records[1])
+      self.assertEqual(0.1, records[2]['period'])
+      self.assertEqual(REF_WAV_PATH, records[2]['act_wav_path'])
+
+
+if __name__ == '__main__':
+  unittest.main()
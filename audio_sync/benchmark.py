@@ -0,0 +1,496 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Benchmarks of the stages of the analysis on synthetic recordings.
+
+Each stage is timed separately on generated (ref, act) pairs of the given
+durations and sampling rates, and its speed is reported in samples per
+second, so that the results of two commits can be compared on one machine:
+
+  python -m audio_sync.benchmark --output before.json
+  python -m audio_sync.benchmark --baseline before.json
+
+The stages working on a chunk at a time only run on the first
+--stage_chunks chunks of each recording, AnalyzeAudios runs on all of it.
+
+The time to import the modules of IMPORT_BUDGETS_SECS in a new interpreter,
+which most runs of the CLI spend more time on than on the analysis, is
+measured too, and the benchmark fails if one goes over its budget.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+import wave
+
+import numpy
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import interval_set
+from audio_sync import wave_reader
+
+
+EXIT_CODE_SUCCESS = 0
+EXIT_CODE_ARGS_PARSE_ERROR = 127
+EXIT_CODE_SLOWDOWN_DETECTED = 1
+
+# Settings of the generated recordings
+SETTINGS = analyzer.AnalysisSettings(
+    period_secs=0.1,
+    pulse_duration_secs=0.002,
+    dropout_threshold=0.5,
+    silence_threshold=0.05,
+    min_silence_len_secs=0.005)
+# Delay of the pulses of the generated actual recordings
+LATENCY_SECS = 0.001
+# Every this many periods, the generated actual recordings have a dropout
+# of one period
+PERIODS_PER_DROPOUT = 100
+# Width of the samples of the generated recordings in bytes
+SAMPLE_WIDTH = 2
+
+# Names of the benchmarked stages, in the order they are run
+STAGES = ('WaveReader.ReadSamples', 'Pcm2Float', '_GetNextWinStart',
+          '_ComputeLatencyInChunk', '_LookForDropoutsInChunk',
+          'IntervalSet', 'AnalyzeAudios')
+
+# Max time to import each module in a new interpreter (secs). None of them
+# imports numpy, which takes longer than these budgets on its own.
+IMPORT_BUDGETS_SECS = collections.OrderedDict([
+    ('audio_sync', 0.05),
+    ('audio_sync.cli', 0.1),
+])
+# Script printing the time to import a module and whether numpy was imported
+_IMPORT_SCRIPT = '''
+import sys
+import timeit
+start = timeit.default_timer()
+import %s
+print(timeit.default_timer() - start)
+print('numpy' in sys.modules)
+'''
+# Modules which importing the modules of IMPORT_BUDGETS_SECS must not import,
+# as they import numpy or only serve the analysis
+DEFERRED_MODULES = ('numpy', 'audio_sync.analyzer', 'audio_sync.cache',
+                    'audio_sync.latency_series', 'audio_sync.latency_summary',
+                    'audio_sync.pcm_stream', 'audio_sync.plot',
+                    'audio_sync.wave_reader')
+# Script printing which of a list of modules are imported with a module
+_IMPORTED_MODULES_SCRIPT = '''
+import sys
+import %s
+print(' '.join(name for name in %r if name in sys.modules))
+'''
+# Directory holding the audio_sync package, added to the path of the new
+# interpreters
+_PACKAGE_PARENT_DIR = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))
+
+
+def ParseArgs(args):
+  """Parses the command line arguments.
+
+  Args:
+    args: (list of str) arguments passed to the benchmark.
+
+  Returns:
+    (argparse.Namespace) the parsed arguments.
+  """
+  parser = argparse.ArgumentParser(
+      description=('Measure the speed of each stage of the analysis on '
+                   'synthetic recordings.'))
+  parser.add_argument('--durations', type=float, nargs='+',
+                      default=[60, 600, 3600],
+                      help='Durations of the generated recordings (secs).')
+  parser.add_argument('--rates', type=int, nargs='+',
+                      default=[16000, 48000, 96000],
+                      help='Sampling rates of the generated recordings (Hz).')
+  parser.add_argument('--stages', nargs='+', default=list(STAGES),
+                      choices=STAGES, help='Stages to benchmark.')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help=('Number of times each stage is run. The fastest '
+                            'run is reported.'))
+  parser.add_argument('--stage_chunks', type=int, default=10,
+                      help=('Number of chunks of each recording the stages '
+                            'working on a chunk at a time run on.'))
+  parser.add_argument('--output',
+                      help=('Path of the JSON file the results are written '
+                            'to. Defaults to standard output.'))
+  parser.add_argument('--baseline',
+                      help=('Path of the JSON results of a previous run to '
+                            'compare with.'))
+  parser.add_argument('--max_slowdown', type=float, default=0.2,
+                      help=('Max relative slowdown of a stage compared with '
+                            'the baseline before the benchmark fails.'))
+  parser.add_argument('--imports_only', default=False, action='store_true',
+                      help=('Only measure the time to import the modules, '
+                            'not the stages of the analysis.'))
+  return parser.parse_args(args)
+
+
+def _WriteRecording(wave_path, duration_secs, samp_rate, impaired=False):
+  """Writes a generated recording.
+
+  Args:
+    wave_path: (string) path of the WAV file to write.
+    duration_secs: (float) duration of the recording.
+    samp_rate: (int) the sampling frequency in Hz.
+    impaired: (bool) whether the pulses are delayed by LATENCY_SECS, and one
+      period every PERIODS_PER_DROPOUT periods is silent.
+  """
+  settings = generator.DEFAULT_GENERATOR_SETTINGS._replace(
+      period_secs=SETTINGS.period_secs,
+      pulse_duration_secs=SETTINGS.pulse_duration_secs, samp_rate=samp_rate,
+      sample_width=SAMPLE_WIDTH)
+  impairments = generator.NO_IMPAIRMENTS
+  if impaired:
+    dropout_starts = SETTINGS.period_secs * numpy.arange(
+        PERIODS_PER_DROPOUT - 1, duration_secs / SETTINGS.period_secs,
+        PERIODS_PER_DROPOUT)
+    impairments = generator.Impairments(
+        latency_secs=LATENCY_SECS,
+        dropouts=numpy.column_stack((dropout_starts,
+                                     dropout_starts + SETTINGS.period_secs)))
+  generator.WriteTestAudio(wave_path, duration_secs, settings, [impairments],
+                           seed=int(impaired))
+
+
+def _Time(function, repeat):
+  """Gets the shortest time to run |function| out of |repeat| runs."""
+  return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def _BenchmarkChunkStages(ref_path, act_path, stages, repeat, max_chunks):
+  """Times the stages working on a chunk at a time.
+
+  Args:
+    ref_path: (string) path to the reference recording.
+    act_path: (string) path to the actual recording.
+    stages: (list of string) the stages to time.
+    repeat: (int) number of times each stage is run.
+    max_chunks: (int) number of chunks the stages run on.
+
+  Returns:
+    (dict) the time and number of processed samples, by stage.
+  """
+  # pylint: disable=protected-access
+  ref_reader = wave_reader.WaveReader(wave.open(ref_path))
+  act_reader = wave_reader.WaveReader(wave.open(act_path))
+  try:
+    samp_rate = ref_reader.GetSamplingRate()
+    positions = analyzer._GetChunkPositions(
+        ref_reader.GetNumberOfSamples(), samp_rate, SETTINGS)[:max_chunks]
+    samples_per_chunk = analyzer._GetSamplesPerChunk(samp_rate, SETTINGS)
+    sample_scaler = 2 ** (analyzer.BITS_PER_BYTE * SAMPLE_WIDTH - 1)
+    samples_per_window = int(samp_rate * SETTINGS.period_secs)
+    window_size_latency = int(0.9 * samples_per_window)
+    samples_per_pulse = SETTINGS.pulse_duration_secs * samp_rate
+
+    ref_data = [ref_reader.ReadSamplesArray(position, samples_per_chunk)
+                for position in positions]
+    act_data = [act_reader.ReadSamplesArray(position, samples_per_chunk)
+                for position in positions]
+    ref_chunks = [wave_reader.Pcm2Float(data, sample_scaler)
+                  for data in ref_data]
+    act_chunks = [wave_reader.Pcm2Float(data, sample_scaler)
+                  for data in act_data]
+    num_samples = sum(len(chunk) for chunk in ref_chunks)
+    latencies = [
+        analyzer._ComputeLatencyInChunk(
+            ref_chunk, act_chunk, window_size_latency, samp_rate, position,
+            SETTINGS.pulse_duration_secs, SETTINGS.dropout_threshold)
+        for ref_chunk, act_chunk, position in zip(ref_chunks, act_chunks,
+                                                  positions)]
+    # One period per window of the recording, each adjacent to the previous
+    # one every other time, so that half of them are merged.
+    num_windows = num_samples // samples_per_window
+    period_starts = numpy.arange(num_windows) * SETTINGS.period_secs
+    period_starts[1::2] -= analyzer.NO_GAP_TIME_SECS
+    periods = list(zip(period_starts.tolist(),
+                       (period_starts + SETTINGS.period_secs).tolist()))
+
+    def ReadSamples():
+      for position in positions:
+        ref_reader.ReadSamples(position, samples_per_chunk)
+
+    def ConvertToFloat():
+      for data in ref_data:
+        wave_reader.Pcm2Float(data, sample_scaler)
+
+    def LocatePulseWindows():
+      for ref_chunk in ref_chunks:
+        analyzer._LocatePulseWindows(
+            ref_chunk, samples_per_pulse, window_size_latency,
+            SETTINGS.dropout_threshold)
+
+    def ComputeLatencies():
+      for ref_chunk, act_chunk, position in zip(ref_chunks, act_chunks,
+                                                positions):
+        analyzer._ComputeLatencyInChunk(
+            ref_chunk, act_chunk, window_size_latency, samp_rate, position,
+            SETTINGS.pulse_duration_secs, SETTINGS.dropout_threshold)
+
+    def LookForDropouts():
+      for act_chunk, position, chunk_latencies in zip(act_chunks, positions,
+                                                      latencies):
+        analyzer._LookForDropoutsInChunk(
+            act_chunk, samples_per_window, samp_rate, position,
+            chunk_latencies, SETTINGS.silence_threshold,
+            SETTINGS.min_silence_len_secs)
+
+    def MergeDropouts():
+      interval_set.IntervalSet(periods, analyzer.NO_GAP_TIME_SECS)
+
+    functions = {
+        'WaveReader.ReadSamples': ReadSamples,
+        'Pcm2Float': ConvertToFloat,
+        # _GetNextWinStart() is called for each window by
+        # _LocatePulseWindows().
+        '_GetNextWinStart': LocatePulseWindows,
+        '_ComputeLatencyInChunk': ComputeLatencies,
+        '_LookForDropoutsInChunk': LookForDropouts,
+        'IntervalSet': MergeDropouts,
+    }
+    return dict((stage, (_Time(functions[stage], repeat), num_samples))
+                for stage in stages if stage in functions)
+  finally:
+    act_reader.Close()
+    ref_reader.Close()
+
+
+def RunBenchmarks(durations, rates, stages=STAGES, repeat=3, stage_chunks=10):
+  """Benchmarks the stages on recordings of each duration and rate.
+
+  Args:
+    durations: (list of float) durations of the recordings (secs).
+    rates: (list of int) sampling rates of the recordings (Hz).
+    stages: (list of string) the stages to benchmark, see STAGES.
+    repeat: (int) number of times each stage is run.
+    stage_chunks: (int) number of chunks of each recording the stages working
+      on a chunk at a time run on.
+
+  Returns:
+    (list of dict) one result per stage, duration and rate, with the fields
+    'stage', 'duration_secs', 'samp_rate', 'samples', 'secs' and
+    'samples_per_sec'.
+  """
+  results = []
+  temp_dir = tempfile.mkdtemp()
+  try:
+    ref_path = os.path.join(temp_dir, 'ref.wav')
+    act_path = os.path.join(temp_dir, 'act.wav')
+    for samp_rate in rates:
+      for duration_secs in durations:
+        _WriteRecording(ref_path, duration_secs, samp_rate)
+        _WriteRecording(act_path, duration_secs, samp_rate, impaired=True)
+
+        timings = _BenchmarkChunkStages(ref_path, act_path, stages, repeat,
+                                        stage_chunks)
+        if 'AnalyzeAudios' in stages:
+          num_samples = int(duration_secs * samp_rate)
+          timings['AnalyzeAudios'] = (_Time(
+              lambda: audio_sync.AnalyzeAudios(ref_path, act_path, SETTINGS),
+              repeat), num_samples)
+
+        for stage in STAGES:
+          if stage in timings:
+            secs, num_samples = timings[stage]
+            results.append({
+                'stage': stage,
+                'duration_secs': duration_secs,
+                'samp_rate': samp_rate,
+                'samples': num_samples,
+                'secs': secs,
+                'samples_per_sec': num_samples / secs if secs else None,
+            })
+  finally:
+    shutil.rmtree(temp_dir)
+  return results
+
+
+def _GetImportEnv():
+  """Gets the environment of the interpreters importing modules."""
+  env = dict(os.environ)
+  env['PYTHONPATH'] = os.pathsep.join(
+      [_PACKAGE_PARENT_DIR] + [path for path in [env.get('PYTHONPATH')]
+                               if path])
+  return env
+
+
+def MeasureImport(module, repeat=3):
+  """Times the import of a module in new interpreters.
+
+  Args:
+    module: (string) full name of the module.
+    repeat: (int) number of interpreters the module is imported in.
+
+  Returns:
+    A 2-tuple with the shortest time to import the module (secs), and
+    whether numpy was imported with it.
+  """
+  env = _GetImportEnv()
+  times = []
+  for _ in range(repeat):
+    output = subprocess.check_output(
+        [sys.executable, '-c', _IMPORT_SCRIPT % module], env=env)
+    secs, imported_numpy = output.decode('utf-8').split()
+    times.append(float(secs))
+  return min(times), imported_numpy == 'True'
+
+
+def GetImportedModules(module, names=DEFERRED_MODULES):
+  """Gets which modules are imported with a module in a new interpreter.
+
+  Args:
+    module: (string) full name of the module.
+    names: (sequence of string) full names of the modules to look for.
+
+  Returns:
+    (list of string) the modules of |names| which were imported.
+  """
+  output = subprocess.check_output(
+      [sys.executable, '-c', _IMPORTED_MODULES_SCRIPT % (module, tuple(names))],
+      env=_GetImportEnv())
+  return output.decode('utf-8').split()
+
+
+def RunImportBenchmarks(budgets=None, repeat=3):
+  """Times the import of each module with a budget.
+
+  Args:
+    budgets: (dict) max import time of each module (secs), by default
+      IMPORT_BUDGETS_SECS.
+    repeat: (int) number of times each module is imported.
+
+  Returns:
+    (list of dict) one result per module, with the fields 'module', 'secs',
+    'budget_secs' and 'imports_numpy'.
+  """
+  if budgets is None:
+    budgets = IMPORT_BUDGETS_SECS
+  results = []
+  for module, budget_secs in budgets.items():
+    secs, imported_numpy = MeasureImport(module, repeat)
+    results.append({
+        'module': module,
+        'secs': secs,
+        'budget_secs': budget_secs,
+        'imports_numpy': imported_numpy,
+    })
+  return results
+
+
+def FindImportsOverBudget(import_results):
+  """Gets the results of RunImportBenchmarks() over their budget."""
+  return [result for result in import_results
+          if result['secs'] > result['budget_secs']]
+
+
+def FindSlowdowns(results, baseline_results, max_slowdown):
+  """Finds the stages slower than in a baseline.
+
+  Args:
+    results: (list of dict) results returned by RunBenchmarks().
+    baseline_results: (list of dict) results of a previous run.
+    max_slowdown: (float) max relative slowdown which is not reported.
+
+  Returns:
+    (list of tuple(dict, float)) each result slower than in the baseline,
+    with its relative slowdown, e.g. 0.5 if it is 1.5 times slower.
+  """
+  baseline_speeds = dict(
+      ((result['stage'], result['duration_secs'], result['samp_rate']),
+       result['samples_per_sec']) for result in baseline_results)
+  slowdowns = []
+  for result in results:
+    baseline_speed = baseline_speeds.get(
+        (result['stage'], result['duration_secs'], result['samp_rate']))
+    if not baseline_speed or not result['samples_per_sec']:
+      continue
+    slowdown = baseline_speed / result['samples_per_sec'] - 1
+    if slowdown > max_slowdown:
+      slowdowns.append((result, slowdown))
+  return slowdowns
+
+
+def _GetEnvironment():
+  """Gets what the results depend on besides the code."""
+  return {
+      'audio_sync': audio_sync.__version__,
+      'python': platform.python_version(),
+      'numpy': numpy.__version__,
+      'platform': platform.platform(),
+      'machine': platform.machine(),
+  }
+
+
+def _Main(args):
+  """Parses options, runs the benchmarks and writes the results."""
+  try:
+    args = ParseArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  import_results = RunImportBenchmarks(repeat=args.repeat)
+  results = []
+  if not args.imports_only:
+    results = RunBenchmarks(args.durations, args.rates, stages=args.stages,
+                            repeat=args.repeat,
+                            stage_chunks=args.stage_chunks)
+  output = json.dumps({'environment': _GetEnvironment(), 'results': results,
+                       'imports': import_results},
+                      indent=2, sort_keys=True)
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      output_file.write(output + '\n')
+  else:
+    print(output)
+
+  imports_over_budget = FindImportsOverBudget(import_results)
+  for result in imports_over_budget:
+    print('Importing %s takes %.3f secs, more than its budget of %.3f secs.'
+          % (result['module'], result['secs'], result['budget_secs']),
+          file=sys.stderr)
+
+  slowdowns = []
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      baseline_results = json.load(baseline_file)['results']
+    slowdowns = FindSlowdowns(results, baseline_results, args.max_slowdown)
+    for result, slowdown in slowdowns:
+      print('%s is %.0f%% slower at %d Hz for %g secs.' % (
+          result['stage'], 100 * slowdown, result['samp_rate'],
+          result['duration_secs']), file=sys.stderr)
+  if imports_over_budget or slowdowns:
+    sys.exit(EXIT_CODE_SLOWDOWN_DETECTED)
+  sys.exit(EXIT_CODE_SUCCESS)
+
+
+def main():
+  _Main(sys.argv[1:])
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,101 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the benchmark module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import audio_sync
+from audio_sync import benchmark
+
+
+class BenchmarkTest(unittest.TestCase):
+  """Tests for the benchmarks of the analysis stages."""
+
+  def testGeneratedRecordingsAreAnalyzed(self):
+    """Checks the generated latency and dropouts are measured."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      ref_path = os.path.join(temp_dir, 'ref.wav')
+      act_path = os.path.join(temp_dir, 'act.wav')
+      benchmark._WriteRecording(ref_path, 20, 8000)
+      benchmark._WriteRecording(act_path, 20, 8000, impaired=True)
+      latencies, dropouts = audio_sync.AnalyzeAudios(ref_path, act_path,
+                                                     benchmark.SETTINGS)
+    finally:
+      shutil.rmtree(temp_dir)
+
+    measured_latencies = set(latency for _, latency in latencies
+                             if latency == latency)
+    # The pulses of the actual recording are late.
+    self.assertEqual(set([-benchmark.LATENCY_SECS]), measured_latencies)
+    self.assertEqual(2, len(dropouts))
+
+  def testRunBenchmarks(self):
+    results = benchmark.RunBenchmarks([2, 3], [8000], repeat=1,
+                                      stage_chunks=1)
+    self.assertEqual(2 * len(benchmark.STAGES), len(results))
+    self.assertEqual(list(benchmark.STAGES),
+                     [result['stage'] for result in results[:7]])
+    for result in results:
+      self.assertEqual(8000, result['samp_rate'])
+      self.assertGreater(result['samples'], 0)
+      self.assertGreater(result['samples_per_sec'], 0)
+
+  def testFindSlowdowns(self):
+    baseline_results = [
+        {'stage': 'Pcm2Float', 'duration_secs': 60, 'samp_rate': 16000,
+         'samples_per_sec': 100.0},
+        {'stage': 'Pcm2Float', 'duration_secs': 60, 'samp_rate': 48000,
+         'samples_per_sec': 100.0},
+    ]
+    results = [
+        {'stage': 'Pcm2Float', 'duration_secs': 60, 'samp_rate': 16000,
+         'samples_per_sec': 90.0},
+        {'stage': 'Pcm2Float', 'duration_secs': 60, 'samp_rate': 48000,
+         'samples_per_sec': 50.0},
+        {'stage': 'Pcm2Float', 'duration_secs': 60, 'samp_rate': 96000,
+         'samples_per_sec': 10.0},
+    ]
+    slowdowns = benchmark.FindSlowdowns(results, baseline_results, 0.2)
+    self.assertEqual([(results[1], 1.0)], slowdowns)
+
+  def testRunImportBenchmarks(self):
+    results = benchmark.RunImportBenchmarks(repeat=1)
+    self.assertEqual(list(benchmark.IMPORT_BUDGETS_SECS),
+                     [result['module'] for result in results])
+    for result in results:
+      self.assertFalse(result['imports_numpy'], result['module'])
+
+  def testImportsDeferAnalysisModules(self):
+    # The import times are only checked against their budgets by the
+    # benchmark itself, as they depend on the machine.
+    for module in benchmark.IMPORT_BUDGETS_SECS:
+      self.assertEqual([], benchmark.GetImportedModules(module), module)
+    self.assertEqual(['numpy'], benchmark.GetImportedModules(
+        'audio_sync.analyzer', ['numpy', 'audio_sync.cli']))
+
+  def testFindImportsOverBudget(self):
+    results = [
+        {'module': 'audio_sync', 'secs': 0.02, 'budget_secs': 0.05},
+        {'module': 'audio_sync.cli', 'secs': 0.2, 'budget_secs': 0.1},
+    ]
+    self.assertEqual(results[1:], benchmark.FindImportsOverBudget(results))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,306 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""On-disk cache of analysis data that can be reused between runs.
+
+The results of the analysis of a pair of recordings are kept, keyed by the
+content of both files, the settings and the version of the package, so that
+analyzing the same pair again only takes the time to hash the files.
+
+The pulses located in a reference recording only depend on its content and a
+few settings, so they are kept in a compact index and reused when the same
+reference is compared with other actual recordings.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import numpy
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import latency_series
+
+
+# Default max size of the files in a cache directory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Prefix of the files being written to a cache directory
+TEMP_PREFIX = '.tmp-'
+# Size of the blocks files are hashed in
+HASH_BLOCK_BYTES = 1024 * 1024
+# Version of the format of the pulse indexes, to be increased whenever they
+# change, so that older ones are not used
+PULSE_INDEX_VERSION = 2
+# Prefix of the names of pulse index files
+PULSE_INDEX_PREFIX = 'pulses-'
+# Prefix of the names of results files
+RESULTS_PREFIX = 'results-'
+
+# Hashes of the files already hashed by this process, by path, size and
+# modification time.
+_file_hashes = {}
+
+
+class DirectoryCache(object):
+  """Cache keeping each entry in a file of a directory.
+
+  Entries are written atomically, so several processes can share the
+  directory. Once the files take more than |max_bytes|, the least recently
+  used ones are deleted.
+  """
+
+  def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """Creates the cache, and its directory if it doesn't exist.
+
+    Args:
+      cache_dir: (string) path to the directory of the cache.
+      max_bytes: (int) max size of the files of the cache.
+    """
+    self._cache_dir = cache_dir
+    self._max_bytes = max_bytes
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+
+  def __repr__(self):
+    return 'DirectoryCache(%r, max_bytes=%d)' % (self._cache_dir,
+                                                 self._max_bytes)
+
+  def _GetPath(self, name):
+    return os.path.join(self._cache_dir, name)
+
+  def Read(self, name):
+    """Reads an entry and marks it as recently used.
+
+    Args:
+      name: (string) file name of the entry.
+
+    Returns:
+      (bytes) the content of the entry, or None if there is no such entry.
+    """
+    path = self._GetPath(name)
+    try:
+      with open(path, 'rb') as entry_file:
+        data = entry_file.read()
+      os.utime(path, None)
+    except (IOError, OSError):
+      return None
+    return data
+
+  def Write(self, name, data):
+    """Writes an entry, then evicts entries if the cache is too big.
+
+    Args:
+      name: (string) file name of the entry.
+      data: (bytes) content of the entry.
+    """
+    temp_fd, temp_path = tempfile.mkstemp(dir=self._cache_dir,
+                                          prefix=TEMP_PREFIX)
+    try:
+      with os.fdopen(temp_fd, 'wb') as temp_file:
+        temp_file.write(data)
+      os.rename(temp_path, self._GetPath(name))
+    finally:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+    self._Evict()
+
+  def _Evict(self):
+    """Deletes the least recently used entries until the cache fits."""
+    entries = []
+    total_bytes = 0
+    for name in os.listdir(self._cache_dir):
+      if name.startswith(TEMP_PREFIX):
+        continue
+      try:
+        stat = os.stat(self._GetPath(name))
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, name))
+      total_bytes += stat.st_size
+
+    entries.sort()
+    for _, size, name in entries:
+      if total_bytes <= self._max_bytes:
+        break
+      try:
+        os.remove(self._GetPath(name))
+      except OSError:
+        pass
+      total_bytes -= size
+
+
+def HashFile(path):
+  """Gets the SHA-1 hex digest of the content of a file.
+
+  The hashes are remembered for as long as the size and modification time of
+  the file don't change, so each file is only read once per process.
+
+  Args:
+    path: (string) path to the file.
+
+  Returns:
+    (string) the hex digest.
+  """
+  stat = os.stat(path)
+  memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+  if memo_key not in _file_hashes:
+    file_hash = hashlib.sha1()
+    with open(path, 'rb') as hashed_file:
+      for block in iter(lambda: hashed_file.read(HASH_BLOCK_BYTES), b''):
+        file_hash.update(block)
+    _file_hashes[memo_key] = file_hash.hexdigest()
+  return _file_hashes[memo_key]
+
+
+def _GetName(prefix, key, extension):
+  """Gets the file name of the entry of a JSON serializable key."""
+  key_hash = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+  return prefix + key_hash + extension
+
+
+def GetResultsName(ref_wave_path, act_wave_path, settings):
+  """Gets the name of the results of the analysis of a pair of recordings.
+
+  Args:
+    ref_wave_path: (string) path to the reference recording.
+    act_wave_path: (string) path to the actual recording.
+    settings: (AnalysisSettings) analysis settings.
+
+  Returns:
+    (string) the file name of the results in a DirectoryCache.
+  """
+  return _GetName(RESULTS_PREFIX,
+                  [audio_sync.__version__, HashFile(ref_wave_path),
+                   HashFile(act_wave_path), list(settings)], '.json')
+
+
+def LoadResults(cache, name):
+  """Loads the results of an analysis.
+
+  Args:
+    cache: (DirectoryCache) the cache.
+    name: (string) the name of the results, see GetResultsName().
+
+  Returns:
+    (2-tuple) the latencies and dropouts in the format returned by
+    audio_sync.AnalyzeAudios(), or None if they are not in the cache or can't
+    be read.
+  """
+  data = cache.Read(name)
+  if data is None:
+    return None
+  try:
+    latencies, dropouts = json.loads(data.decode('utf-8'))
+    return (latency_series.LatencySeries.FromPairs(latencies),
+            [(float(start), float(end)) for start, end in dropouts])
+  except (TypeError, ValueError):
+    return None
+
+
+def StoreResults(cache, name, results):
+  """Stores the results of an analysis.
+
+  Args:
+    cache: (DirectoryCache) the cache.
+    name: (string) the name of the results, see GetResultsName().
+    results: (2-tuple) the latencies and dropouts returned by
+      audio_sync.AnalyzeAudios().
+  """
+  latencies, dropouts = results
+  cache.Write(name, json.dumps([list(latencies), dropouts]).encode('utf-8'))
+
+
+def GetPulseIndexName(ref_wave_path, samp_rate, settings):
+  """Gets the name of the pulse index of a reference recording.
+
+  Args:
+    ref_wave_path: (string) path to the reference recording.
+    samp_rate: (int) the sampling frequency of the recording in Hz.
+    settings: (AnalysisSettings) analysis settings.
+
+  Returns:
+    (string) the file name of the index in a DirectoryCache.
+  """
+  return _GetName(PULSE_INDEX_PREFIX,
+                  [PULSE_INDEX_VERSION, analyzer.WINDOWS_PER_CHUNK,
+                   HashFile(ref_wave_path), samp_rate, settings.period_secs,
+                   settings.pulse_duration_secs, settings.dropout_threshold,
+                   settings.pulse_search],
+                  '.npz')
+
+
+def LoadPulseIndex(cache, name):
+  """Loads a pulse index.
+
+  Args:
+    cache: (DirectoryCache) the cache.
+    name: (string) the name of the index, see GetPulseIndexName().
+
+  Returns:
+    (dict) the pulse index, see analyzer.DetermineLatenciesAndDropouts(), or
+    None if it is not in the cache or can't be read.
+  """
+  data = cache.Read(name)
+  if data is None:
+    return None
+  try:
+    arrays = numpy.load(io.BytesIO(data))
+    positions = arrays['positions'].tolist()
+    splits = numpy.cumsum(arrays['counts'])[:-1]
+    win_starts = numpy.split(arrays['win_starts'], splits)
+    peak_indexes = numpy.split(arrays['peak_indexes'], splits)
+    peak_values = numpy.split(arrays['peak_values'], splits)
+  except Exception:  # pylint: disable=broad-except
+    # A damaged index is analyzed again, and then overwritten.
+    return None
+
+  return dict(
+      (position, (chunk_win_starts.tolist(),
+                  list(zip(chunk_peak_indexes.tolist(), chunk_peak_values))))
+      for position, chunk_win_starts, chunk_peak_indexes, chunk_peak_values
+      in zip(positions, win_starts, peak_indexes, peak_values))
+
+
+def StorePulseIndex(cache, name, ref_pulse_index):
+  """Stores a pulse index.
+
+  Args:
+    cache: (DirectoryCache) the cache.
+    name: (string) the name of the index, see GetPulseIndexName().
+    ref_pulse_index: (dict) the pulse index, see
+      analyzer.DetermineLatenciesAndDropouts().
+  """
+  positions = sorted(ref_pulse_index)
+  win_starts = []
+  peaks = []
+  for position in positions:
+    chunk_win_starts, chunk_peaks = ref_pulse_index[position]
+    win_starts += chunk_win_starts
+    peaks += chunk_peaks
+
+  data = io.BytesIO()
+  numpy.savez_compressed(
+      data,
+      positions=numpy.array(positions, dtype=numpy.int64),
+      counts=numpy.array([len(ref_pulse_index[position][0])
+                          for position in positions], dtype=numpy.int64),
+      win_starts=numpy.array(win_starts, dtype=numpy.int64),
+      peak_indexes=numpy.array([index for index, _ in peaks],
+                               dtype=numpy.int64),
+      peak_values=numpy.array([value for _, value in peaks],
+                              dtype=numpy.float64))
+  cache.Write(name, data.getvalue())
@@ -0,0 +1,202 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the cache module."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import cache
+from audio_sync import wave_reader
+
+# Absolute path to the folder containing the handcrafted (ref, act) filepairs
+TEST_DATA_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'test_data')
+
+REF_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_ref_2.wav')
+ACT_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_act_2.wav')
+
+SETTINGS = analyzer.AnalysisSettings(0.3, 0.002, 0.3, 0.05, 0.005)
+
+
+class _UnreadableWaveReader(object):
+  """WaveReader whose samples can't be read."""
+
+  def __init__(self, wave_reader_to_wrap):
+    self._wave_reader = wave_reader_to_wrap
+
+  def ReadSamplesArray(self, *_):
+    raise AssertionError('The samples should not be read.')
+
+  def GetSamplingRate(self):
+    return self._wave_reader.GetSamplingRate()
+
+  def GetNumberOfSamples(self):
+    return self._wave_reader.GetNumberOfSamples()
+
+  def GetSampleWidth(self):
+    return self._wave_reader.GetSampleWidth()
+
+  def GetSampleScaler(self):
+    return self._wave_reader.GetSampleScaler()
+
+
+class DirectoryCacheTest(unittest.TestCase):
+  """Tests for the DirectoryCache class."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._cache_dir = os.path.join(self._temp_dir, 'cache')
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testReadWrite(self):
+    directory_cache = cache.DirectoryCache(self._cache_dir)
+    self.assertIsNone(directory_cache.Read('entry'))
+    directory_cache.Write('entry', b'data')
+    self.assertEqual(b'data', directory_cache.Read('entry'))
+    self.assertEqual(['entry'], os.listdir(self._cache_dir))
+
+  def testEvictsLeastRecentlyUsed(self):
+    directory_cache = cache.DirectoryCache(self._cache_dir, max_bytes=20)
+    directory_cache.Write('first', b'x' * 8)
+    directory_cache.Write('second', b'x' * 8)
+    past_time = time.time() - 60
+    os.utime(os.path.join(self._cache_dir, 'first'), (past_time, past_time))
+    os.utime(os.path.join(self._cache_dir, 'second'), (past_time, past_time))
+    self.assertIsNotNone(directory_cache.Read('first'))
+
+    directory_cache.Write('third', b'x' * 8)
+    self.assertEqual(['first', 'third'], sorted(os.listdir(self._cache_dir)))
+
+
+class ResultsTest(unittest.TestCase):
+  """Tests for the caching of analysis results."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._cache = cache.DirectoryCache(self._temp_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testStoreLoad(self):
+    results = ([(0.1, 0.002), (0.2, float('nan'))], [(0.3, 0.5)])
+    cache.StoreResults(self._cache, 'results', results)
+    latencies, dropouts = cache.LoadResults(self._cache, 'results')
+    self.assertEqual(repr(results), repr((list(latencies), dropouts)))
+
+  def testCachedResultsAreReturned(self):
+    expected_results = audio_sync.AnalyzeAudios(REF_WAV_PATH, ACT_WAV_PATH,
+                                                SETTINGS)
+    self.assertEqual(expected_results, audio_sync.AnalyzeAudios(
+        REF_WAV_PATH, ACT_WAV_PATH, SETTINGS, analysis_cache=self._cache))
+
+    name = cache.GetResultsName(REF_WAV_PATH, ACT_WAV_PATH, SETTINGS)
+    self.assertEqual(expected_results, cache.LoadResults(self._cache, name))
+    cached_results = ([(1.0, 0.5)], [])
+    cache.StoreResults(self._cache, name, cached_results)
+    self.assertEqual(cached_results, audio_sync.AnalyzeAudios(
+        REF_WAV_PATH, ACT_WAV_PATH, SETTINGS, analysis_cache=self._cache))
+
+  def testNameDependsOnFilesSettingsAndVersion(self):
+    name = cache.GetResultsName(REF_WAV_PATH, ACT_WAV_PATH, SETTINGS)
+    self.assertEqual(name, cache.GetResultsName(REF_WAV_PATH, ACT_WAV_PATH,
+                                                SETTINGS))
+    self.assertNotEqual(name, cache.GetResultsName(ACT_WAV_PATH, REF_WAV_PATH,
+                                                   SETTINGS))
+    self.assertNotEqual(name, cache.GetResultsName(
+        REF_WAV_PATH, ACT_WAV_PATH, SETTINGS._replace(silence_threshold=0.1)))
+
+    version = audio_sync.__version__
+    try:
+      audio_sync.__version__ = version + '.dev'
+      self.assertNotEqual(name, cache.GetResultsName(
+          REF_WAV_PATH, ACT_WAV_PATH, SETTINGS))
+    finally:
+      audio_sync.__version__ = version
+
+  def testDamagedResults(self):
+    self._cache.Write('results', b'[1, 2, 3]')
+    self.assertIsNone(cache.LoadResults(self._cache, 'results'))
+
+
+class PulseIndexTest(unittest.TestCase):
+  """Tests for the caching of the pulses of reference files."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._cache = cache.DirectoryCache(self._temp_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testStoreLoad(self):
+    ref_wave_reader = wave_reader.CreateWaveReader(REF_WAV_PATH)
+    act_wave_reader = wave_reader.CreateWaveReader(ACT_WAV_PATH)
+    ref_pulse_index = {}
+    analyzer.DetermineLatenciesAndDropouts(ref_wave_reader, act_wave_reader,
+                                           SETTINGS, ref_pulse_index)
+    self.assertTrue(ref_pulse_index)
+
+    cache.StorePulseIndex(self._cache, 'index', ref_pulse_index)
+    self.assertEqual(ref_pulse_index, cache.LoadPulseIndex(self._cache,
+                                                           'index'))
+
+  def testCachedPulsesAreNotRead(self):
+    """Checks the results are the same without reading the reference."""
+    expected_results = audio_sync.AnalyzeAudios(REF_WAV_PATH, ACT_WAV_PATH,
+                                                SETTINGS)
+    self.assertEqual(expected_results, audio_sync.AnalyzeAudios(
+        REF_WAV_PATH, ACT_WAV_PATH, SETTINGS, analysis_cache=self._cache))
+    self.assertEqual(2, len(os.listdir(self._temp_dir)))
+
+    ref_wave_reader = wave_reader.CreateWaveReader(REF_WAV_PATH)
+    name = cache.GetPulseIndexName(
+        REF_WAV_PATH, ref_wave_reader.GetSamplingRate(), SETTINGS)
+    ref_pulse_index = cache.LoadPulseIndex(self._cache, name)
+    results = analyzer.DetermineLatenciesAndDropouts(
+        _UnreadableWaveReader(ref_wave_reader),
+        wave_reader.CreateWaveReader(ACT_WAV_PATH), SETTINGS, ref_pulse_index)
+    self.assertEqual(expected_results, results)
+    self.assertEqual(expected_results, audio_sync.AnalyzeAudios(
+        REF_WAV_PATH, ACT_WAV_PATH, SETTINGS, analysis_cache=self._cache))
+
+  def testNameDependsOnSettings(self):
+    name = cache.GetPulseIndexName(REF_WAV_PATH, 44100, SETTINGS)
+    self.assertEqual(name, cache.GetPulseIndexName(
+        REF_WAV_PATH, 44100, SETTINGS._replace(silence_threshold=0.1)))
+    self.assertNotEqual(name, cache.GetPulseIndexName(
+        REF_WAV_PATH, 44100, SETTINGS._replace(dropout_threshold=0.5)))
+    self.assertNotEqual(name, cache.GetPulseIndexName(
+        REF_WAV_PATH, 44100,
+        SETTINGS._replace(pulse_search=analyzer.PULSE_SEARCH_TRACKED)))
+    self.assertNotEqual(name, cache.GetPulseIndexName(
+        REF_WAV_PATH, 48000, SETTINGS))
+    self.assertNotEqual(name, cache.GetPulseIndexName(
+        ACT_WAV_PATH, 44100, SETTINGS))
+
+  def testDamagedIndex(self):
+    self._cache.Write('index', b'not an index')
+    self.assertIsNone(cache.LoadPulseIndex(self._cache, 'index'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -17,17 +17,39 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
-import datetime
+import io
 import json
 import logging
 import math
+import os
 import sys
-import wave
 
 import audio_sync
-from audio_sync import analyzer
-from audio_sync import plot
-import numpy
+from audio_sync import analysis_settings
+from audio_sync import export
+from audio_sync import lazy_loader
+from audio_sync import profiling
+
+# The modules only needed by some subcommands or flags are imported when
+# first used, so that the runs which don't need numpy don't import it, e.g.
+# the ones sending the files to a server.
+batch = lazy_loader.LazyLoader('batch', globals(), 'audio_sync.batch')
+cache = lazy_loader.LazyLoader('cache', globals(), 'audio_sync.cache')
+client = lazy_loader.LazyLoader('client', globals(), 'audio_sync.client')
+datetime = lazy_loader.LazyLoader('datetime', globals(), 'datetime')
+generator = lazy_loader.LazyLoader('generator', globals(),
+                                   'audio_sync.generator')
+interval_set = lazy_loader.LazyLoader('interval_set', globals(),
+                                      'audio_sync.interval_set')
+latency_series = lazy_loader.LazyLoader('latency_series', globals(),
+                                        'audio_sync.latency_series')
+numpy = lazy_loader.LazyLoader('numpy', globals(), 'numpy')
+pcm_stream = lazy_loader.LazyLoader('pcm_stream', globals(),
+                                    'audio_sync.pcm_stream')
+plot = lazy_loader.LazyLoader('plot', globals(), 'audio_sync.plot')
+server = lazy_loader.LazyLoader('server', globals(), 'audio_sync.server')
+wave_reader = lazy_loader.LazyLoader('wave_reader', globals(),
+                                     'audio_sync.wave_reader')
 
 
 EXIT_CODE_UNKNOWN_ERROR = 255
@@ -35,6 +57,23 @@ EXIT_CODE_ARGS_PARSE_ERROR = 127
 EXIT_CODE_SUCCESS = 0
 EXIT_CODE_LATENCIES_ABOVE_THRESHOLD = 1
 EXIT_CODE_DROPOUTS_DETECTED = 2
+# Exit codes of the pairs of a batch, from the one reported first
+EXIT_CODES_BY_SEVERITY = (EXIT_CODE_UNKNOWN_ERROR,
+                          EXIT_CODE_LATENCIES_ABOVE_THRESHOLD,
+                          EXIT_CODE_DROPOUTS_DETECTED)
+
+# First argument selecting the analysis of a manifest of pairs
+BATCH_COMMAND = 'batch'
+# First argument selecting the generation of test audio
+GENERATE_COMMAND = 'generate'
+# First argument selecting the analysis of a stream, like the output of arecord
+STREAM_COMMAND = 'stream'
+# Input path of the stream command reading standard input
+STDIN_PATH = '-'
+# First argument selecting the live monitoring of several streams
+MONITOR_COMMAND = 'monitor'
+# First argument selecting the analysis server
+SERVE_COMMAND = 'serve'
 
 VERY_LARGE_LATENCY_USEC = 10000
 
@@ -55,9 +94,346 @@ def ParseArgs(args):
   parser.add_argument('--debug', default=False, action='store_true',
                       help='Enable debug output.')
   parser.add_argument('ref_wav_path',
-                      help='Path to the reference .wav file.')
-  parser.add_argument('act_wav_path',
+                      help=('Path to the reference .wav file, or to the '
+                            'multichannel .wav file of --act_channels.'))
+  parser.add_argument('act_wav_path', nargs='?',
                       help='Path to the actual .wav file.')
+  parser.add_argument('--act_channels', type=int, nargs='+',
+                      metavar='CHANNEL',
+                      help=('Channels (from 0) of the actual signals, to '
+                            'analyze the channels of the interleaved '
+                            'recording ref_wav_path instead of a pair of '
+                            'files. The results of each channel are shown '
+                            'in turn.'))
+  parser.add_argument('--ref_channel', type=int,
+                      help=('Channel (from 0) of the reference signal with '
+                            '--act_channels. Defaults to 0.'))
+  _AddAnalysisArgs(parser)
+  parser.add_argument('--jobs', type=int, default=1,
+                      help=('Number of processes analyzing chunks of the '
+                            'files in parallel. 0 uses every CPU.'))
+  parser.add_argument('--server', metavar='HOST:PORT',
+                      help=('Send the files to a running analysis server '
+                            '(see the serve subcommand) instead of analyzing '
+                            'them in this process.'))
+  parser.add_argument('--server_timeout', type=float, metavar='SECS',
+                      help=('Time to wait for the result of --server (secs). '
+                            'By default, waits as long as the analysis '
+                            'takes.'))
+  parser.add_argument('--profile', nargs='?', const='-', metavar='PATH',
+                      help=('Print the time spent in each stage of the '
+                            'analysis and counters of what was analyzed to '
+                            'standard error, or write them as JSON to PATH.'))
+  parser.add_argument('--parsable_output', default=False, action='store_true',
+                      help='Print latencies and dropouts as a JSON string.')
+  parser.add_argument('--output_format', choices=export.OUTPUT_FORMATS,
+                      help=('Write latencies and dropouts in this format, to '
+                            '--output or standard output. Defaults to the '
+                            'format of the extension of --output.'))
+  parser.add_argument('--output',
+                      help=('Path of the file the latencies and dropouts are '
+                            'written to, in --output_format.'))
+  parser.add_argument('--print_stats', default=False, action='store_true',
+                      help=('Print latencies stats (max, min, and average), '
+                            'and the number and total duration of the '
+                            'dropouts.'))
+  parser.add_argument('--print_percentiles', default=False, action='store_true',
+                      help='Print latency percentiles.')
+  parser.add_argument('--plot_timeline', default=False, action='store_true',
+                      help=('Plot the conditions in a timeline.'))
+  parser.add_argument('--plot_ascii_graph', default=False, action='store_true',
+                      help=('Plots all latencies as ASCII art.'))
+  parser.add_argument('--start_time', default='00:00:00',
+                      help=('hh:mm:ss of when playback started.'))
+  parser.add_argument('--dots_per_msec', type=int, default='10',
+                      help=('How many ASCII dots are used per msec of '
+                        'latency.'))
+  args = parser.parse_args(args)
+  if args.jobs < 0:
+    parser.error('--jobs must be 0 or more.')
+  if args.output and not args.output_format:
+    try:
+      args.output_format = export.GetFormat(args.output)
+    except ValueError as e:
+      parser.error(str(e))
+  if args.output_format == export.FORMAT_NPZ and not args.output:
+    parser.error('--output is required by --output_format npz.')
+  if args.output_format == export.FORMAT_JSONL and (args.jobs != 1 or
+                                                    args.cache_dir):
+    parser.error('--output_format jsonl analyzes the files in order in one '
+                 'process, without --jobs or --cache_dir.')
+  if args.server and (args.jobs != 1 or args.cache_dir or args.profile or
+                      args.output_format == export.FORMAT_JSONL):
+    parser.error('--server analyzes the files with the settings of the '
+                 'server, without --jobs, --cache_dir, --profile or '
+                 '--output_format jsonl.')
+  if args.server_timeout is not None and not args.server:
+    parser.error('--server_timeout needs --server.')
+  if args.act_channels is None:
+    if args.act_wav_path is None:
+      parser.error('act_wav_path is required without --act_channels.')
+    if args.ref_channel is not None:
+      parser.error('--ref_channel needs --act_channels.')
+  else:
+    if args.act_wav_path is not None:
+      parser.error('--act_channels analyzes the channels of ref_wav_path, '
+                   'without act_wav_path.')
+    if (args.jobs != 1 or args.cache_dir or args.server or args.profile or
+        args.output_format or args.output):
+      parser.error('--act_channels analyzes the channels in one process, '
+                   'without --jobs, --cache_dir, --server, --profile, '
+                   '--output_format or --output.')
+    if args.ref_channel is None:
+      args.ref_channel = 0
+  return args
+
+
+def ParseBatchArgs(args):
+  """Helper function for parsing the parameters of the batch subcommand.
+
+  Args:
+    args: (list of str) arguments passed to CLI after 'batch'.
+
+  Returns:
+    The parsed parameters.
+  """
+  parser = argparse.ArgumentParser(
+      prog='batch',
+      description=('Measure latency of every (ref, act) pair of a manifest. '
+                   'The analysis flags are the defaults for the pairs which '
+                   'do not set them.'))
+  parser.add_argument('--debug', default=False, action='store_true',
+                      help='Enable debug output.')
+  parser.add_argument('manifest_path',
+                      help=('Path to a CSV (with header row) or JSONL '
+                            'manifest with ref_wav_path and act_wav_path '
+                            'fields, and optionally any analysis flag.'))
+  _AddAnalysisArgs(parser)
+  parser.add_argument('--jobs', type=int, default=1,
+                      help=('Number of pairs analyzed in parallel. 0 uses '
+                            'every CPU.'))
+  parser.add_argument('--output',
+                      help=('Path of the JSONL file the result records are '
+                            'written to. Defaults to standard output.'))
+  args = parser.parse_args(args)
+  if args.jobs < 0:
+    parser.error('--jobs must be 0 or more.')
+  return args
+
+
+def ParseGenerateArgs(args):
+  """Helper function for parsing the parameters of the generate subcommand.
+
+  Args:
+    args: (list of str) arguments passed to CLI after 'generate'.
+
+  Returns:
+    The parsed parameters.
+  """
+  defaults = generator.DEFAULT_GENERATOR_SETTINGS
+  parser = argparse.ArgumentParser(
+      prog=GENERATE_COMMAND,
+      description=('Generate test audio, with known latencies, drift and '
+                   'dropouts.'))
+  parser.add_argument('--debug', default=False, action='store_true',
+                      help='Enable debug output.')
+  parser.add_argument('wav_path', help='Path of the .wav file to write.')
+  parser.add_argument('--duration', type=float, default=60,
+                      help='Duration of the audio (secs).')
+  parser.add_argument('--period', type=float, default=defaults.period_secs,
+                      help='Fundamental period of the audio (secs).')
+  parser.add_argument('--pulse_length', type=float,
+                      default=defaults.pulse_duration_secs,
+                      help='Duration of the pulses (secs).')
+  parser.add_argument('--pulse_amplitude', type=float,
+                      default=defaults.pulse_amplitude,
+                      help='Peak value of the pulses. Range: [0.0, 1.0]')
+  parser.add_argument('--noise_amplitude', type=float,
+                      default=defaults.noise_amplitude,
+                      help=('Peak value of the noise between the pulses. '
+                            'Range: [0.0, 1.0]'))
+  parser.add_argument('--rate', type=int, default=defaults.samp_rate,
+                      help='Sampling rate (Hz).')
+  parser.add_argument('--width', type=int, default=defaults.sample_width,
+                      choices=generator.SAMPLE_WIDTHS,
+                      help='Width of the samples (bytes).')
+  parser.add_argument('--channels', type=int, default=defaults.num_channels,
+                      help='Number of channels.')
+  parser.add_argument('--latency', type=float, nargs='+', default=[0.0],
+                      help=('Delay of the pulses (secs), either one for all '
+                            'the channels or one per channel.'))
+  parser.add_argument('--drift_ppm', type=float, nargs='+', default=[0.0],
+                      help=('How much faster the clock runs (parts per '
+                            'million), either one for all the channels or '
+                            'one per channel.'))
+  parser.add_argument('--dropout', type=float, nargs=2, action='append',
+                      default=[], metavar=('START', 'END'),
+                      help=('Silences the audio from START to END (secs). '
+                            'Can be repeated.'))
+  parser.add_argument('--dropout_channels', type=int, nargs='+',
+                      help=('Channels (from 0) the dropouts are in. Defaults '
+                            'to all.'))
+  parser.add_argument('--seed', type=int, default=0,
+                      help='Seed of the noise.')
+  args = parser.parse_args(args)
+
+  for name in ('latency', 'drift_ppm'):
+    values = getattr(args, name)
+    if len(values) == 1:
+      setattr(args, name, values * args.channels)
+    elif len(values) != args.channels:
+      parser.error('--%s needs 1 or %d values.' % (name, args.channels))
+  if args.dropout_channels is None:
+    args.dropout_channels = list(range(args.channels))
+  return args
+
+
+def ParseServeArgs(args):
+  """Helper function for parsing the parameters of the serve subcommand.
+
+  Args:
+    args: (list of str) arguments passed to CLI after 'serve'.
+
+  Returns:
+    The parsed parameters.
+  """
+  parser = argparse.ArgumentParser(
+      prog=SERVE_COMMAND,
+      description=('Serve the analysis of pairs of files to local clients '
+                   '(see --server) with a pool of worker processes, until '
+                   'interrupted. The analysis flags are the defaults for '
+                   'the requests which do not set them.'))
+  parser.add_argument('--debug', default=False, action='store_true',
+                      help='Enable debug output.')
+  parser.add_argument('--port', type=int, default=server.DEFAULT_PORT,
+                      help='Port of localhost to listen on.')
+  parser.add_argument('--workers', type=int, default=0,
+                      help=('Number of worker processes. 0 uses every '
+                            'CPU.'))
+  parser.add_argument('--max_queue', type=int,
+                      default=server.DEFAULT_MAX_QUEUE,
+                      help=('Number of requests which can wait for a '
+                            'worker. Further requests are rejected, and '
+                            'sent again by the clients.'))
+  _AddAnalysisArgs(parser)
+  args = parser.parse_args(args)
+  if args.workers < 0:
+    parser.error('--workers must be 0 or more.')
+  return args
+
+
+def ParseStreamArgs(args):
+  """Helper function for parsing the parameters of the stream subcommand.
+
+  Args:
+    args: (list of str) arguments passed to CLI after 'stream'.
+
+  Returns:
+    The parsed parameters.
+  """
+  parser = argparse.ArgumentParser(
+      prog=STREAM_COMMAND,
+      description=('Measure latency between two channels of audio streamed '
+                   'through a pipe, like the output of arecord, as it is '
+                   'recorded. Results are written as JSON Lines records.'))
+  parser.add_argument('--debug', default=False, action='store_true',
+                      help='Enable debug output.')
+  parser.add_argument('input_path',
+                      help=('Path of the stream (a FIFO or a file), or "-" '
+                            'for standard input. It is a .wav stream unless '
+                            '--format is given.'))
+  parser.add_argument('--ref_channel', type=int, default=0,
+                      help='Channel (from 0) of the reference signal.')
+  parser.add_argument('--act_channel', type=int, default=1,
+                      help='Channel (from 0) of the actual signal.')
+  parser.add_argument('--format', choices=list(pcm_stream.RAW_FORMATS),
+                      help=('Format of the samples of a headerless PCM '
+                            'stream, named like in arecord.'))
+  parser.add_argument('--rate', type=int, default=48000,
+                      help='Sampling rate of a headerless stream (Hz).')
+  parser.add_argument('--channels', type=int, default=2,
+                      help='Number of channels of a headerless stream.')
+  _AddSettingsArgs(parser)
+  parser.add_argument('--output',
+                      help=('Path of the JSONL file the results are written '
+                            'to. Defaults to standard output.'))
+  return parser.parse_args(args)
+
+
+def ParseMonitorArgs(args):
+  """Helper function for parsing the parameters of the monitor subcommand.
+
+  Args:
+    args: (list of str) arguments passed to CLI after 'monitor'.
+
+  Returns:
+    The parsed parameters.
+  """
+  parser = argparse.ArgumentParser(
+      prog=MONITOR_COMMAND,
+      description=('Monitor the latency between two channels of several '
+                   'headerless PCM streams at once, as they are recorded. '
+                   'Alerts are written as JSON Lines records, then a '
+                   'report once every stream has ended. Needs Python 3.'))
+  parser.add_argument('--debug', default=False, action='store_true',
+                      help='Enable debug output.')
+  parser.add_argument('streams', nargs='+', metavar='NAME=PATH',
+                      help=('Name of a stream in the records, and path of '
+                            'its FIFO or pipe.'))
+  parser.add_argument('--ref_channel', type=int, default=0,
+                      help='Channel (from 0) of the reference signals.')
+  parser.add_argument('--act_channel', type=int, default=1,
+                      help='Channel (from 0) of the actual signals.')
+  parser.add_argument('--format', default='S16_LE',
+                      choices=list(pcm_stream.RAW_FORMATS),
+                      help='Format of the samples, named like in arecord.')
+  parser.add_argument('--rate', type=int, default=48000,
+                      help='Sampling rate of the streams (Hz).')
+  parser.add_argument('--channels', type=int, default=2,
+                      help='Number of channels of the streams.')
+  _AddSettingsArgs(parser)
+  parser.add_argument('--clear_latency_threshold', type=float,
+                      help=('Latency alerts are cleared once latencies are '
+                            'below this threshold (secs). Defaults to half '
+                            'of --latency_threshold.'))
+  parser.add_argument('--raise_windows', type=int, default=2,
+                      help=('Number of consecutive windows above '
+                            '--latency_threshold raising a latency alert.'))
+  parser.add_argument('--clear_windows', type=int, default=5,
+                      help=('Number of consecutive valid windows clearing '
+                            'an alert.'))
+  parser.add_argument('--output',
+                      help=('Path of the JSONL file the records are written '
+                            'to. Defaults to standard output.'))
+  args = parser.parse_args(args)
+  if sys.version_info[0] < 3:
+    parser.error('The monitor subcommand needs Python 3.')
+  if any('=' not in stream for stream in args.streams):
+    parser.error('Streams are given as NAME=PATH.')
+  args.streams = [stream.split('=', 1) for stream in args.streams]
+  if args.clear_latency_threshold is None:
+    args.clear_latency_threshold = args.latency_threshold / 2
+  return args
+
+
+def _AddAnalysisArgs(parser):
+  """Adds the flags shared by the analysis of a pair and of a manifest."""
+  _AddSettingsArgs(parser)
+  parser.add_argument('--use_mmap', default=False, action='store_true',
+                      help=('Read the files through memory maps. Faster for '
+                            'long recordings.'))
+  parser.add_argument('--cache_dir',
+                      help=('Directory where the pulses located in reference '
+                            'files are kept, to be reused when the same '
+                            'reference is analyzed again.'))
+  parser.add_argument('--cache_size_mb', type=float,
+                      help=('Max size of the cache directory (MB), 256 by '
+                            'default. The least recently used entries are '
+                            'deleted first.'))
+
+
+def _AddSettingsArgs(parser):
+  """Adds the flags of the analysis settings and the latency threshold."""
   parser.add_argument('--period', type=float, default=0.1,
                       help='Fundamental period of audio files (secs).')
   parser.add_argument('--pulse_length', type=float, default=0.002,
@@ -71,32 +447,37 @@ def ParseArgs(args):
   parser.add_argument('--min_silence_length', type=float, default=0.005,
                       help=('Minimum length of silence (secs). Silences '
                             'below this duration will be ignored.'))
-  parser.add_argument('--parsable_output', default=False, action='store_true',
-                      help='Print latencies and dropouts as a JSON string.')
-  parser.add_argument('--print_stats', default=False, action='store_true',
-                      help='Print latencies stats (max, min, and average).')
-  parser.add_argument('--print_percentiles', default=False, action='store_true',
-                      help='Print latency percentiles.')
-  parser.add_argument('--plot_timeline', default=False, action='store_true',
-                      help=('Plot the conditions in a timeline.'))
+  parser.add_argument('--pulse_search',
+                      default=analysis_settings.PULSE_SEARCH_FULL,
+                      choices=analysis_settings.PULSE_SEARCHES,
+                      help=('How the pulses of the reference file are '
+                            'searched. "decimated" only searches the '
+                            'samples around the loud parts of the file, '
+                            'with the same results, but is not faster as '
+                            'finding them reads every sample. "tracked" '
+                            'only searches around the pulses predicted from '
+                            'the previous ones, and estimates the clock '
+                            'drift of the file (see --profile).'))
   parser.add_argument('--latency_threshold', type=float, default=0.001,
                       help=('Latencies equal or greater than this threshold '
                             '(secs) are considered excessive.'))
-  parser.add_argument('--plot_ascii_graph', default=False, action='store_true',
-                      help=('Plots all latencies as ASCII art.'))
-  parser.add_argument('--start_time', default='00:00:00',
-                      help=('hh:mm:ss of when playback started.'))
-  parser.add_argument('--dots_per_msec', type=int, default='10',
-                      help=('How many ASCII dots are used per msec of '
-                        'latency.'))
-  return parser.parse_args(args)
+
+
+def _CreateCache(args):
+  """Creates the cache requested by the flags, or returns None."""
+  if not args.cache_dir:
+    return None
+  if args.cache_size_mb is None:
+    return cache.DirectoryCache(args.cache_dir)
+  return cache.DirectoryCache(args.cache_dir,
+                              int(args.cache_size_mb * 2**20))
 
 
 def GetStats(latencies):
   """Gets latency stats.
 
   Args:
-    latencies: (list) list of 2-tuples (<time>, <latency>).
+    latencies: (list or LatencySeries) list of 2-tuples (<time>, <latency>).
 
   Returns:
     A 3-tuple:
@@ -104,37 +485,25 @@ def GetStats(latencies):
       Element 2: (float) min latency in seconds.
       Element 3: (float) mean latency in seconds.
   """
-  values = [d for _, d in latencies if not math.isnan(d)]
-  if values:
-    # The max, min, and avg should be based on absolute values (otherwise,
-    # we could report that -0.1 is greater than -0.2, which is misleading),
-    # but we still need to show the signed value so users can tell if the
-    # signal was ahead or behind.
-    return (max(values, key=abs),
-            min(values, key=abs),
-            numpy.mean(values))
-  else:
-    return float('NaN'), float('NaN'), float('NaN')
+  return latency_series.LatencySeries.FromPairs(latencies).GetStats()
 
 
-def CalculatePercentiles(latencies, percentiles=(0, 50, 75, 90, 95, 99, 100)):
+def CalculatePercentiles(latencies, percentiles=None):
   """Calculates the latency percentiles.
 
   Args:
-    latencies: (list) list of 2-tuples (<time>, <latency>).
-    percentiles: (tuple) tuple containing the percentiles to calculate.
+    latencies: (list or LatencySeries) list of 2-tuples (<time>, <latency>).
+    percentiles: (tuple) tuple containing the percentiles to calculate, by
+      default latency_series.DEFAULT_PERCENTILES.
 
   Returns:
     A list of the form [(<percentile>, abs(<value>)), ...] for each of
     the percentiles requested.
   """
-  values = [d for _, d in latencies if not math.isnan(d)]
-  if values:
-    vals = numpy.percentile(sorted([abs(v) for v in values]),
-                            percentiles).tolist()
-    return zip(percentiles, vals)
-  else:
-    return zip(percentiles, (float('NaN'),) * 7)
+  if percentiles is None:
+    percentiles = latency_series.DEFAULT_PERCENTILES
+  return latency_series.LatencySeries.FromPairs(latencies).GetPercentiles(
+      percentiles)
 
 
 def _Print(message):
@@ -205,8 +574,8 @@ def _PlotAsciiGraph(
     print((start_time + t).strftime('%H:%M:%S'),
       '%2.2d:%2.2d > %+4.4d %s' % (time_h, time_m, usecs, out_str))
 
-  values = [d for _, d in latencies if not math.isnan(d)]
-  if values:
+  values = latency_series.LatencySeries.FromPairs(latencies).GetValidValues()
+  if len(values):
     avg = numpy.mean(values)
     print("\navg[%d]=%.6f\n" % (len(values), avg))
 
@@ -219,16 +588,48 @@ def _PrintPercentiles(percentiles):
 
 
 def _GetWaveDurationSecs(wav_path):
-  """Gets the duration in secs of the WAV file."""
-  wav = wave.open(wav_path)
+  """Gets the duration in secs of the WAV file.
+
+  The file may be in any format the wave readers support.
+  """
+  reader = wave_reader.OpenWaveReader(wav_path)
   try:
-    return wav.getnframes() / (wav.getnchannels() * wav.getframerate())
+    return reader.GetNumberOfSamples() / reader.GetSamplingRate()
   finally:
-    wav.close()
+    reader.Close()
+
+
+def _GetExitCode(max_latency, dropouts, latency_threshold):
+  """Gets the exit code for the results of the analysis of a pair."""
+  if abs(max_latency) >= latency_threshold:
+    return EXIT_CODE_LATENCIES_ABOVE_THRESHOLD
+  elif dropouts:
+    return EXIT_CODE_DROPOUTS_DETECTED
+  else:
+    return EXIT_CODE_SUCCESS
+
+
+def _AggregateExitCodes(exit_codes):
+  """Gets the most severe of |exit_codes|, see EXIT_CODES_BY_SEVERITY."""
+  for exit_code in EXIT_CODES_BY_SEVERITY:
+    if exit_code in exit_codes:
+      return exit_code
+  return EXIT_CODE_SUCCESS
 
 
 def _Main(args):
   """Parses options and shows results."""
+  if args and args[0] == BATCH_COMMAND:
+    _BatchMain(args[1:])
+  if args and args[0] == GENERATE_COMMAND:
+    _GenerateMain(args[1:])
+  if args and args[0] == STREAM_COMMAND:
+    _StreamMain(args[1:])
+  if args and args[0] == MONITOR_COMMAND:
+    _MonitorMain(args[1:])
+  if args and args[0] == SERVE_COMMAND:
+    _ServeMain(args[1:])
+
   try:
     args = ParseArgs(args)
   except SystemExit:
@@ -238,44 +639,398 @@ def _Main(args):
     logging.basicConfig(level=logging.DEBUG)
 
   try:
-    settings = analyzer.AnalysisSettings(
+    settings = analysis_settings.AnalysisSettings(
         args.period, args.pulse_length, args.dropout_threshold,
-        args.silence_threshold, args.min_silence_length)
-    latencies, dropouts = audio_sync.AnalyzeAudios(
-        args.ref_wav_path, args.act_wav_path, settings)
-    max_latency, min_latency, avg_latency = GetStats(latencies)
+        args.silence_threshold, args.min_silence_length, args.pulse_search)
+    instrumentation = profiling.Instrumentation() if args.profile else None
+    if args.act_channels:
+      sys.exit(_AnalyzeChannels(args, settings))
+    if args.output_format == export.FORMAT_JSONL:
+      _StreamResults(args, settings, instrumentation)
+    if args.server:
+      latencies, dropouts, stats = _AnalyzeOnServer(args)
+    else:
+      with (instrumentation or profiling.NULL_INSTRUMENTATION).Time(
+          profiling.STAGE_ANALYSIS):
+        latencies, dropouts = audio_sync.AnalyzeAudios(
+            args.ref_wav_path, args.act_wav_path, settings,
+            use_mmap=args.use_mmap, jobs=args.jobs or None,
+            analysis_cache=_CreateCache(args),
+            instrumentation=instrumentation)
+      stats = GetStats(latencies)
+    if instrumentation:
+      _WriteProfile(instrumentation.GetReport(), args.profile)
+    max_latency, _, _ = stats
+
+    if args.output:
+      export.SaveResults(args.output, latencies, dropouts, args.output_format)
 
-    if args.parsable_output:
-      _Print(json.dumps({'latencies': latencies, 'dropouts': dropouts}))
+    if args.parsable_output or (args.output_format == export.FORMAT_JSON and
+                                not args.output):
+      _Print(json.dumps({'latencies': list(latencies),
+                         'dropouts': dropouts}))
+    elif args.output_format and not args.output:
+      # The binary formats are written to the underlying buffer in Python 3.
+      stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+      export.WriteResults(stdout, latencies, dropouts, args.output_format)
+      stdout.flush()
     else:
-      if args.plot_ascii_graph:
-        try:
-          start_time = datetime.datetime.strptime(args.start_time, "%H:%M:%S")
-        except ValueError:
-          sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
-        _PlotAsciiGraph(latencies, start_time, dots_per_msec=args.dots_per_msec,
-                        latency_threshold_secs=args.latency_threshold)
-      duration_secs = _GetWaveDurationSecs(args.ref_wav_path)
-      if args.plot_timeline:
-        _PlotResults(duration_secs, latencies, dropouts,
-                     latency_threshold_secs=args.latency_threshold)
-      if args.print_stats:
-        _Print('Max latency: %f secs' % max_latency)
-        _Print('Min latency: %f secs' % min_latency)
-        _Print('Mean latency: %f secs\n' % avg_latency)
-      if args.print_percentiles:
-        percentiles = CalculatePercentiles(latencies)
-        _PrintPercentiles(percentiles)
-
-    if abs(max_latency) >= args.latency_threshold:
-      sys.exit(EXIT_CODE_LATENCIES_ABOVE_THRESHOLD)
-    elif dropouts:
-      sys.exit(EXIT_CODE_DROPOUTS_DETECTED)
+      _ShowResults(args, latencies, dropouts, stats)
+
+    sys.exit(_GetExitCode(max_latency, dropouts, args.latency_threshold))
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('')
+    sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+
+
+def _ShowResults(args, latencies, dropouts, stats):
+  """Prints the stats, percentiles and plots of the results asked by the flags.
+
+  Args:
+    args: (argparse.Namespace) the parsed flags.
+    latencies: (list of 2-tuple) the latencies.
+    dropouts: (list of 2-tuple) the dropouts.
+    stats: (3-tuple) the stats of the latencies, see GetStats().
+  """
+  max_latency, min_latency, avg_latency = stats
+  if args.plot_ascii_graph:
+    try:
+      start_time = datetime.datetime.strptime(args.start_time, "%H:%M:%S")
+    except ValueError:
+      sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+    _PlotAsciiGraph(latencies, start_time, dots_per_msec=args.dots_per_msec,
+                    latency_threshold_secs=args.latency_threshold)
+  dropout_set = interval_set.IntervalSet(dropouts)
+  if args.plot_timeline:
+    # Only read when plotting, as the wave readers import numpy.
+    _PlotResults(_GetWaveDurationSecs(args.ref_wav_path), latencies,
+                 dropout_set, latency_threshold_secs=args.latency_threshold)
+  if args.print_stats:
+    _Print('Max latency: %f secs' % max_latency)
+    _Print('Min latency: %f secs' % min_latency)
+    _Print('Mean latency: %f secs' % avg_latency)
+    _Print('Dropouts: %d (%f secs)\n' % (
+        len(dropout_set), dropout_set.GetTotalDuration()))
+  if args.print_percentiles:
+    percentiles = CalculatePercentiles(latencies)
+    _PrintPercentiles(percentiles)
+
+
+def _AnalyzeChannels(args, settings):
+  """Analyzes the channels of --act_channels and shows their results.
+
+  The channels are analyzed in a single pass over the recording, see
+  audio_sync.AnalyzeMultichannelAudio(). With --parsable_output, a JSON list
+  with the results of each channel is printed, otherwise the results asked
+  by the flags are shown for each channel in turn.
+
+  Args:
+    args: (argparse.Namespace) the parsed flags.
+    settings: (AnalysisSettings) analysis settings.
+
+  Returns:
+    (int) the most severe exit code of the channels, see
+    EXIT_CODES_BY_SEVERITY.
+  """
+  results = audio_sync.AnalyzeMultichannelAudio(
+      args.ref_wav_path, args.ref_channel, args.act_channels, settings,
+      use_mmap=args.use_mmap)
+  if args.parsable_output:
+    _Print(json.dumps([
+        {'channel': channel, 'latencies': list(latencies),
+         'dropouts': dropouts}
+        for channel, (latencies, dropouts) in zip(args.act_channels,
+                                                   results)]))
+  exit_codes = []
+  for channel, (latencies, dropouts) in zip(args.act_channels, results):
+    stats = GetStats(latencies)
+    if not args.parsable_output:
+      _Print('Channel %d:' % channel)
+      _ShowResults(args, latencies, dropouts, stats)
+    exit_codes.append(
+        _GetExitCode(stats[0], dropouts, args.latency_threshold))
+  return _AggregateExitCodes(exit_codes)
+
+
+def _AnalyzeOnServer(args):
+  """Analyzes the files of the flags on the server of --server.
+
+  Returns:
+    A 3-tuple with the latencies and dropouts, in the format returned by
+    audio_sync.AnalyzeAudios(), and their stats, see GetStats(). Unlike a
+    local analysis, this doesn't import numpy.
+  """
+  row = dict((field, getattr(args, field)) for field in batch.SETTINGS_FIELDS)
+  row.update(ref_wav_path=os.path.abspath(args.ref_wav_path),
+             act_wav_path=os.path.abspath(args.act_wav_path),
+             use_mmap=args.use_mmap)
+  record = client.Analyze(args.server, row,
+                          result_timeout_secs=args.server_timeout)
+  return ([tuple(latency) for latency in record['latencies']],
+          [tuple(dropout) for dropout in record['dropouts']],
+          tuple(record['latency_stats'][field]
+                for field in client.LATENCY_STATS_FIELDS))
+
+
+def _StreamResults(args, settings, instrumentation):
+  """Writes the results as JSON Lines records while the files are analyzed.
+
+  A summary record with the exit code is written last, then the program
+  exits with it.
+  """
+  if args.output:
+    output_file = open(args.output, 'wb')
+  else:
+    output_file = getattr(sys.stdout, 'buffer', sys.stdout)
+  try:
+    writer = export.JsonlWriter(output_file)
+    with (instrumentation or profiling.NULL_INSTRUMENTATION).Time(
+        profiling.STAGE_ANALYSIS):
+      for latencies, dropouts in audio_sync.IterAnalyzeAudios(
+          args.ref_wav_path, args.act_wav_path, settings,
+          use_mmap=args.use_mmap, instrumentation=instrumentation):
+        writer.Write(latencies, dropouts)
+    max_latency, _, _ = writer.GetStats()
+    exit_code = _GetExitCode(max_latency, writer.num_dropouts,
+                             args.latency_threshold)
+    writer.WriteSummary(exit_code=exit_code)
+  finally:
+    if args.output:
+      output_file.close()
+  if instrumentation:
+    _WriteProfile(instrumentation.GetReport(), args.profile)
+  sys.exit(exit_code)
+
+
+def _WriteProfile(report, profile_path):
+  """Writes a profiling report.
+
+  The report is written as text to stderr if |profile_path| is '-', or as
+  JSON to |profile_path| otherwise.
+  """
+  if profile_path == '-':
+    print(profiling.FormatReport(report), file=sys.stderr)
+  else:
+    with open(profile_path, 'w') as profile_file:
+      json.dump(report, profile_file, indent=2, sort_keys=True)
+
+
+def _BatchMain(args):
+  """Parses options and writes one result record per pair of a manifest.
+
+  The exit code is the most severe of the exit codes of the pairs, in the
+  order: unknown error, latencies above threshold, dropouts detected.
+  """
+  try:
+    args = ParseBatchArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  if args.debug:
+    logging.basicConfig(level=logging.DEBUG)
+
+  try:
+    rows = batch.ReadManifest(args.manifest_path)
+    default_settings = dict(
+        (field, getattr(args, field)) for field in batch.SETTINGS_FIELDS)
+
+    output_file = open(args.output, 'w') if args.output else None
+    try:
+      exit_codes = []
+      for record in batch.AnalyzeManifest(
+          rows, default_settings, jobs=args.jobs or None,
+          use_mmap=args.use_mmap, analysis_cache=_CreateCache(args)):
+        if 'error' in record:
+          record['exit_code'] = EXIT_CODE_UNKNOWN_ERROR
+        else:
+          max_latency, _, _ = GetStats(record['latencies'])
+          record['exit_code'] = _GetExitCode(
+              max_latency, record['dropouts'], record['latency_threshold'])
+        exit_codes.append(record['exit_code'])
+
+        if output_file:
+          output_file.write(json.dumps(record) + '\n')
+          output_file.flush()
+        else:
+          _Print(json.dumps(record))
+    finally:
+      if output_file:
+        output_file.close()
+
+    sys.exit(_AggregateExitCodes(exit_codes))
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('')
+    sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+
+
+def _GenerateMain(args):
+  """Parses options and writes test audio."""
+  try:
+    args = ParseGenerateArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  if args.debug:
+    logging.basicConfig(level=logging.DEBUG)
+
+  try:
+    settings = generator.GeneratorSettings(
+        args.period, args.pulse_length, args.pulse_amplitude,
+        args.noise_amplitude, args.rate, args.width, args.channels)
+    impairments = [
+        generator.Impairments(
+            latency, drift_ppm,
+            args.dropout if channel in args.dropout_channels else ())
+        for channel, (latency, drift_ppm) in enumerate(
+            zip(args.latency, args.drift_ppm))]
+    generator.WriteTestAudio(args.wav_path, args.duration, settings,
+                             impairments, seed=args.seed)
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('')
+    sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+  sys.exit(EXIT_CODE_SUCCESS)
+
+
+def _ServeMain(args):
+  """Parses options and serves the analysis of pairs until interrupted.
+
+  The stats of the server are then printed to stderr.
+  """
+  try:
+    args = ParseServeArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  if args.debug:
+    logging.basicConfig(level=logging.DEBUG)
+
+  try:
+    default_settings = dict(
+        (field, getattr(args, field)) for field in batch.SETTINGS_FIELDS)
+    analysis_server = server.AnalysisServer(
+        default_settings, port=args.port, workers=args.workers or None,
+        max_queue=args.max_queue, use_mmap=args.use_mmap,
+        analysis_cache=_CreateCache(args))
+    print('Serving on %s.' % analysis_server.address, file=sys.stderr)
+    try:
+      analysis_server.ServeForever()
+    except KeyboardInterrupt:
+      pass
+    print(json.dumps(analysis_server.GetStats(), indent=2, sort_keys=True),
+          file=sys.stderr)
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('')
+    sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+  sys.exit(EXIT_CODE_SUCCESS)
+
+
+def _StreamMain(args):
+  """Parses options and writes JSON Lines records while a stream is analyzed.
+
+  A summary record with the exit code is written last, then the program
+  exits with it.
+  """
+  try:
+    args = ParseStreamArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  if args.debug:
+    logging.basicConfig(level=logging.DEBUG)
+
+  try:
+    settings = analysis_settings.AnalysisSettings(
+        args.period, args.pulse_length, args.dropout_threshold,
+        args.silence_threshold, args.min_silence_length, args.pulse_search)
+    stream_format = None
+    if args.format:
+      stream_format = pcm_stream.GetRawFormat(args.format, args.rate,
+                                              args.channels)
+    if args.input_path == STDIN_PATH:
+      input_file = io.open(sys.stdin.fileno(), 'rb', closefd=False)
+    else:
+      input_file = io.open(args.input_path, 'rb')
+    if args.output:
+      output_file = open(args.output, 'wb')
     else:
-      sys.exit(EXIT_CODE_SUCCESS)
+      output_file = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+      writer = export.JsonlWriter(output_file)
+      for latencies, dropouts in pcm_stream.IterAnalyzeStream(
+          input_file, args.ref_channel, args.act_channel, settings,
+          stream_format=stream_format):
+        writer.Write(latencies, dropouts)
+      max_latency, _, _ = writer.GetStats()
+      exit_code = _GetExitCode(max_latency, writer.num_dropouts,
+                               args.latency_threshold)
+      writer.WriteSummary(exit_code=exit_code)
+    finally:
+      input_file.close()
+      if args.output:
+        output_file.close()
+  except Exception:  # pylint: disable=broad-except
+    logging.exception('')
+    sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+  sys.exit(exit_code)
+
+
+def _MonitorMain(args):
+  """Parses options and writes a JSON Lines record per alert of the streams.
+
+  A report record is written once the streams have all ended. The exit code
+  is the most severe of the exit codes of the streams, which are
+  EXIT_CODE_LATENCIES_ABOVE_THRESHOLD if a latency alert was raised.
+  """
+  try:
+    args = ParseMonitorArgs(args)
+  except SystemExit:
+    sys.exit(EXIT_CODE_ARGS_PARSE_ERROR)
+
+  if args.debug:
+    logging.basicConfig(level=logging.DEBUG)
+
+  # Only imported here, as the module needs Python 3.
+  from audio_sync import monitor  # pylint: disable=g-import-not-at-top
+
+  try:
+    settings = analysis_settings.AnalysisSettings(
+        args.period, args.pulse_length, args.dropout_threshold,
+        args.silence_threshold, args.min_silence_length, args.pulse_search)
+    alert_settings = monitor.AlertSettings(
+        args.latency_threshold, args.clear_latency_threshold,
+        args.raise_windows, args.clear_windows)
+    stream_format = pcm_stream.GetRawFormat(args.format, args.rate,
+                                            args.channels)
+    if args.output:
+      output_file = open(args.output, 'w')
+    else:
+      output_file = sys.stdout
+
+    def _WriteEvent(event):
+      record = dict(event._asdict(), type='event')
+      output_file.write(json.dumps(record, sort_keys=True) + '\n')
+      output_file.flush()
+
+    try:
+      report = monitor.MonitorPipes(
+          args.streams, stream_format, settings, _WriteEvent, alert_settings,
+          args.ref_channel, args.act_channel)
+      output_file.write(json.dumps({'type': 'report', 'streams': report},
+                                   sort_keys=True) + '\n')
+    finally:
+      if args.output:
+        output_file.close()
+
+    exit_codes = []
+    for stream_report in report.values():
+      if stream_report['events'][monitor.EVENT_LATENCY_ALERT]:
+        exit_codes.append(EXIT_CODE_LATENCIES_ABOVE_THRESHOLD)
+      elif stream_report['dropouts']:
+        exit_codes.append(EXIT_CODE_DROPOUTS_DETECTED)
   except Exception:  # pylint: disable=broad-except
     logging.exception('')
     sys.exit(EXIT_CODE_UNKNOWN_ERROR)
+  sys.exit(_AggregateExitCodes(exit_codes))
 
 
 def main():
@@ -16,9 +16,20 @@
 import json
 import math
 import os
+import shutil
+import struct
+import tempfile
+import threading
 import unittest
+import wave
 
+import numpy
+
+from audio_sync import batch
 from audio_sync import cli
+from audio_sync import export
+from audio_sync import server
+from audio_sync import wave_reader
 
 
 # Absolute path to the folder containing the handcrafted (ref, act) filepairs
@@ -52,6 +63,71 @@ def _RunCli(*args):
     cli._Print = orig_print
 
 
+def _RunBatchCli(*args):
+  output = []
+  orig_print = cli._Print
+  # pylint: disable=unnecessary-lambda
+  cli._Print = lambda message: output.append(message)
+  try:
+    try:
+      cli._Main(['batch', '--period', '0.3'] + list(args))
+    except SystemExit as e:
+      return e.code, [json.loads(line) for line in output]
+    raise Exception('Program did not exit properly.')
+  finally:
+    cli._Print = orig_print
+
+
+def _RunGenerateCli(*args):
+  try:
+    cli._Main(['generate'] + list(args))
+  except SystemExit as e:
+    return e.code
+  raise Exception('Program did not exit properly.')
+
+
+def _WriteFloatCopy(wave_path, float_wave_path):
+  """Writes the samples of a mono wave file to a float32 wave file.
+
+  The wave module can't read the written file.
+  """
+  reader = wave_reader.CreateWaveReader(wave_path)
+  try:
+    samp_rate = reader.GetSamplingRate()
+    data = wave_reader.Pcm2Float(reader.ReadSamplesArray(),
+                                 reader.GetSampleScaler()).astype('<f4')
+  finally:
+    reader.Close()
+  fmt_chunk = struct.pack('<HHIIHH', wave_reader.WAVE_FORMAT_IEEE_FLOAT, 1,
+                          samp_rate, samp_rate * 4, 4, 32)
+  chunks = (b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk +
+            b'data' + struct.pack('<I', data.nbytes) + data.tobytes())
+  with open(float_wave_path, 'wb') as wave_file:
+    wave_file.write(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' +
+                    chunks)
+
+
+def _WriteInterleaved(wave_paths, multichannel_wave_path):
+  """Interleaves mono wave files with the same format in one file."""
+  channels = []
+  for wave_path in wave_paths:
+    reader = wave_reader.CreateWaveReader(wave_path)
+    try:
+      samp_rate = reader.GetSamplingRate()
+      samp_width = reader.GetSampleWidth()
+      channels.append(reader.ReadSamplesArray())
+    finally:
+      reader.Close()
+  wave_file = wave.open(multichannel_wave_path, 'wb')
+  try:
+    wave_file.setnchannels(len(channels))
+    wave_file.setsampwidth(samp_width)
+    wave_file.setframerate(samp_rate)
+    wave_file.writeframes(numpy.column_stack(channels).tobytes())
+  finally:
+    wave_file.close()
+
+
 def _AssertDropoutListIsValid(dropout_list):
   for i, dropout in enumerate(dropout_list):
     assert len(dropout) == 2, 'Invalid dropout %s at index %d.' % (dropout, i)
@@ -80,6 +156,11 @@ class LatencyMeasurementCliExitCodesTest(unittest.TestCase):
     exit_code, _ = _RunCli(DELAY1_PATH, DELAY2_PATH)
     self.assertEqual(exit_code, 1)
 
+  def testLatencyThresholdExceededExitCodeWithMmap(self):
+    """Verifies code when reading the files through memory maps."""
+    exit_code, _ = _RunCli(DELAY1_PATH, DELAY2_PATH, '--use_mmap')
+    self.assertEqual(exit_code, 1)
+
   def testLatencyThresholdExceededAndDropoutExitCode(self):
     """Verifies code when there are latencies > threshold and dropouts."""
     exit_code, _ = _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH)
@@ -91,6 +172,158 @@ class LatencyMeasurementCliExitCodesTest(unittest.TestCase):
     self.assertEqual(exit_code, 2)
 
 
+class LatencyMeasurementCliBatchTest(unittest.TestCase):
+  """Tests for the analysis of a manifest with the batch subcommand."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _WriteManifest(self, rows):
+    manifest_path = os.path.join(self._temp_dir, 'manifest.jsonl')
+    with open(manifest_path, 'w') as manifest_file:
+      for row in rows:
+        manifest_file.write(json.dumps(row) + '\n')
+    return manifest_path
+
+  def testOneRecordPerPair(self):
+    """Verifies one record with its exit code is written per pair."""
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY1_PATH},
+        {'ref_wav_path': DROPOUT1_PATH, 'act_wav_path': DROPOUT2_PATH}])
+    exit_code, records = _RunBatchCli(manifest_path)
+    self.assertEqual(2, exit_code)
+    self.assertEqual([0, 2], [record['exit_code'] for record in records])
+    for record in records:
+      _AssertDropoutListIsValid(record['dropouts'])
+
+  def testExitCodeIsMostSevere(self):
+    """Verifies errors come first, then latencies above threshold."""
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DROPOUT1_PATH, 'act_wav_path': DROPOUT2_PATH},
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY2_PATH}])
+    exit_code, _ = _RunBatchCli(manifest_path, '--jobs', '2')
+    self.assertEqual(1, exit_code)
+
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY2_PATH},
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': 'missing.wav'}])
+    exit_code, records = _RunBatchCli(manifest_path)
+    self.assertEqual(255, exit_code)
+    self.assertEqual([1, 255], [record['exit_code'] for record in records])
+    self.assertIn('error', records[1])
+
+  def testSettingsOfPair(self):
+    """Verifies the settings of a pair override the flags."""
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY2_PATH,
+         'latency_threshold': 1.0}])
+    exit_code, _ = _RunBatchCli(manifest_path, '--latency_threshold', '0.001')
+    self.assertEqual(0, exit_code)
+
+  def testOutputFile(self):
+    """Verifies the records are written to the file given by --output."""
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY1_PATH}])
+    output_path = os.path.join(self._temp_dir, 'results.jsonl')
+    exit_code, records = _RunBatchCli(manifest_path, '--output', output_path)
+    self.assertEqual(0, exit_code)
+    self.assertEqual([], records)
+    with open(output_path) as output_file:
+      self.assertEqual(1, len(output_file.readlines()))
+
+  def testExitCodeWhenManifestIsInvalid(self):
+    """Verifies code when the manifest can't be read."""
+    exit_code, _ = _RunBatchCli(os.path.join(self._temp_dir, 'missing.csv'))
+    self.assertEqual(255, exit_code)
+
+  def testNegativeJobs(self):
+    """Verifies a negative number of processes is rejected."""
+    manifest_path = self._WriteManifest([
+        {'ref_wav_path': DELAY1_PATH, 'act_wav_path': DELAY1_PATH}])
+    exit_code, _ = _RunBatchCli(manifest_path, '--jobs', '-1')
+    self.assertEqual(127, exit_code)
+
+
+class LatencyMeasurementCliGenerateTest(unittest.TestCase):
+  """Tests for the generate subcommand."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testGeneratedAudioIsAnalyzed(self):
+    ref_path = os.path.join(self._temp_dir, 'ref.wav')
+    act_path = os.path.join(self._temp_dir, 'act.wav')
+    self.assertEqual(0, _RunGenerateCli(ref_path, '--duration', '3',
+                                        '--period', '0.3'))
+    self.assertEqual(0, _RunGenerateCli(act_path, '--duration', '3',
+                                        '--period', '0.3', '--latency',
+                                        '0.01', '--seed', '1'))
+    exit_code, output = _RunCli(ref_path, act_path, '--parsable_output')
+    self.assertEqual(1, exit_code)
+    latencies = json.loads(output)['latencies']
+    self.assertEqual(set([-0.01]), set(
+        round(latency, 6) for _, latency in latencies))
+
+  def testExitCodeWhenLatenciesDontMatchChannels(self):
+    wav_path = os.path.join(self._temp_dir, 'test.wav')
+    self.assertEqual(127, _RunGenerateCli(wav_path, '--channels', '2',
+                                          '--latency', '0', '0.1', '0.2'))
+    self.assertFalse(os.path.exists(wav_path))
+
+
+class LatencyMeasurementCliStreamTest(unittest.TestCase):
+  """Tests for the stream subcommand."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._wav_path = os.path.join(self._temp_dir, 'stream.wav')
+    self._output_path = os.path.join(self._temp_dir, 'results.jsonl')
+    _RunGenerateCli(self._wav_path, '--duration', '3', '--period', '0.3',
+                    '--rate', '8000', '--channels', '2', '--latency', '0',
+                    '0.01', '--dropout', '1.0', '1.5', '--dropout_channels',
+                    '1')
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _RunStreamCli(self, *args):
+    try:
+      cli._Main(['stream', '--period', '0.3', '--output', self._output_path] +
+                list(args))
+    except SystemExit as e:
+      return e.code
+    raise Exception('Program did not exit properly.')
+
+  def testWaveStream(self):
+    self.assertEqual(1, self._RunStreamCli(self._wav_path))
+    with open(self._output_path) as output_file:
+      records = [json.loads(line) for line in output_file]
+    self.assertEqual('summary', records[-1]['type'])
+    self.assertEqual(1, records[-1]['exit_code'])
+    self.assertEqual(1, records[-1]['dropouts'])
+    self.assertAlmostEqual(-0.01, records[-1]['max_latency'])
+
+  def testExitCodes(self):
+    self.assertEqual(255, self._RunStreamCli(self._wav_path, '--act_channel',
+                                             '2'))
+    self.assertEqual(127, self._RunStreamCli(self._wav_path, '--format',
+                                             'U8'))
+
+  def testMonitorExitCodeWhenStreamIsInvalid(self):
+    try:
+      cli._Main(['monitor', self._wav_path])
+    except SystemExit as e:
+      self.assertEqual(127, e.code)
+    else:
+      raise Exception('Program did not exit properly.')
+
+
 class LatencyMeasurementCliCalculatePercentilesTest(unittest.TestCase):
   """Tests for the CalculatePercentiles function."""
 
@@ -135,6 +368,227 @@ class LatencyMeasurementCliOutputTest(unittest.TestCase):
     _, output = _RunCli(DELAY1_PATH, DELAY1_PATH, '--print_percentiles')
     self.assertNotEqual(output, '')
 
+  def testOutputFile(self):
+    """Verifies the results written with --output are the printed ones."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      _, output = _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH,
+                          '--parsable_output')
+      expected = json.loads(output)
+      for output_format in export.OUTPUT_FORMATS:
+        output_path = os.path.join(temp_dir, 'results')
+        _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH, '--output',
+                output_path, '--output_format', output_format)
+        latencies, dropouts = export.LoadResults(output_path, output_format)
+        self.assertEqual(
+            json.dumps(expected),
+            json.dumps({'latencies': list(latencies), 'dropouts': dropouts}))
+    finally:
+      shutil.rmtree(temp_dir)
+
+  def testJsonlOutput(self):
+    """Verifies the JSON Lines records end with a summary with the exit code."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+      output_path = os.path.join(temp_dir, 'results.jsonl')
+      exit_code, _ = _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH,
+                             '--output', output_path)
+      with open(output_path) as output_file:
+        records = [json.loads(line) for line in output_file]
+      latencies, dropouts = export.LoadResults(output_path)
+    finally:
+      shutil.rmtree(temp_dir)
+
+    _, output = _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH,
+                        '--parsable_output')
+    expected = json.loads(output)
+    self.assertEqual(
+        json.dumps(expected),
+        json.dumps({'latencies': list(latencies), 'dropouts': dropouts}))
+    self.assertEqual('summary', records[-1]['type'])
+    self.assertEqual(exit_code, records[-1]['exit_code'])
+    self.assertEqual(len(expected['dropouts']), records[-1]['dropouts'])
+
+    exit_code, _ = _RunCli(DELAY1_PATH, DELAY1_PATH, '--output_format',
+                           'jsonl', '--jobs', '2')
+    self.assertEqual(exit_code, 127)
+
+  def testNegativeJobs(self):
+    """Verifies a negative number of processes is rejected."""
+    exit_code, _ = _RunCli(DELAY1_PATH, DELAY1_PATH, '--jobs', '-2')
+    self.assertEqual(exit_code, 127)
+
+  def testOutputFormatWithoutFile(self):
+    """Verifies JSON goes to standard output, and npz needs a file."""
+    _, output = _RunCli(DELAY1_PATH, DELAY1_PATH, '--output_format', 'json')
+    self.assertIn('latencies', json.loads(output))
+    exit_code, _ = _RunCli(DELAY1_PATH, DELAY1_PATH, '--output_format', 'npz')
+    self.assertEqual(exit_code, 127)
+
+
+class LatencyMeasurementCliFloatWaveTest(unittest.TestCase):
+  """Tests for floating point wave files, which wave can't read."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._ref_path = os.path.join(self._temp_dir, 'ref.wav')
+    self._act_path = os.path.join(self._temp_dir, 'act.wav')
+    _WriteFloatCopy(DELAY_DROPOUT1_PATH, self._ref_path)
+    _WriteFloatCopy(DELAY_DROPOUT2_PATH, self._act_path)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testTextOutput(self):
+    """Verifies the text output is the same as for the 16Bit files."""
+    for flags in ((), ('--print_stats',), ('--plot_timeline',)):
+      self.assertEqual(
+          _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH, *flags),
+          _RunCli(self._ref_path, self._act_path, *flags))
+
+
+class LatencyMeasurementCliMultichannelTest(unittest.TestCase):
+  """Tests for the analysis of the channels of a file with --act_channels."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._wave_path = os.path.join(self._temp_dir, 'multichannel.wav')
+    _WriteInterleaved([DELAY_DROPOUT2_PATH, DELAY_DROPOUT1_PATH,
+                       DELAY_DROPOUT1_PATH], self._wave_path)
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testSameResultsAsMonoFiles(self):
+    """Verifies each channel gives the results of its pair of files."""
+    exit_code, output = _RunCli(self._wave_path, '--ref_channel', '1',
+                                '--act_channels', '0', '2',
+                                '--parsable_output')
+    dropouts_exit_code, dropouts_output = _RunCli(
+        DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH, '--parsable_output')
+    _, same_output = _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT1_PATH,
+                             '--parsable_output')
+    records = json.loads(output)
+    self.assertEqual([0, 2], [record.pop('channel') for record in records])
+    self.assertEqual(
+        json.dumps([json.loads(dropouts_output), json.loads(same_output)],
+                   sort_keys=True),
+        json.dumps(records, sort_keys=True))
+    self.assertEqual(dropouts_exit_code, exit_code)
+
+    for flags in (('--print_stats',), ('--print_percentiles',)):
+      expected = '\n'.join(
+          ['Channel 0:',
+           _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH, *flags)[1],
+           'Channel 2:',
+           _RunCli(DELAY_DROPOUT1_PATH, DELAY_DROPOUT1_PATH, *flags)[1]])
+      self.assertEqual(
+          (exit_code, expected),
+          _RunCli(self._wave_path, '--ref_channel', '1', '--act_channels',
+                  '0', '2', *flags))
+
+  def testExitCodes(self):
+    for flags in (('--act_channels', '0', DELAY1_PATH),
+                  ('--act_channels', '0', '--jobs', '2'),
+                  ('--act_channels', '0', '--output_format', 'json'),
+                  ('--ref_channel', '1', DELAY1_PATH),
+                  ()):
+      self.assertEqual(127, _RunCli(self._wave_path, *flags)[0], flags)
+    self.assertEqual(255, _RunCli(self._wave_path, '--act_channels', '3')[0])
+
+
+class LatencyMeasurementCliServerTest(unittest.TestCase):
+  """Tests for the analysis on a server with --server."""
+
+  @classmethod
+  def setUpClass(cls):
+    args = cli.ParseServeArgs(['--port', '0', '--workers', '1'])
+    cls._server = server.AnalysisServer(
+        dict((field, getattr(args, field)) for field in batch.SETTINGS_FIELDS),
+        port=0, workers=1)
+    cls._thread = threading.Thread(target=cls._server.ServeForever)
+    cls._thread.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls._server.Shutdown()
+    cls._thread.join()
+
+  def testSameResultsAsLocalAnalysis(self):
+    for args in ((DELAY_DROPOUT1_PATH, DELAY_DROPOUT2_PATH),
+                 (DELAY1_PATH, DELAY1_PATH)):
+      expected = _RunCli(*(args + ('--parsable_output',)))
+      self.assertEqual(expected, _RunCli(*(args + (
+          '--parsable_output', '--server', self._server.address))))
+      self.assertEqual(expected, _RunCli(*(args + (
+          '--parsable_output', '--server', self._server.address,
+          '--server_timeout', '60'))))
+
+  def testExitCodes(self):
+    self.assertEqual(127, _RunCli(DELAY1_PATH, DELAY1_PATH, '--server',
+                                  self._server.address, '--jobs', '2')[0])
+    self.assertEqual(127, _RunCli(DELAY1_PATH, DELAY1_PATH,
+                                  '--server_timeout', '60')[0])
+    self.assertEqual(255, _RunCli(DELAY1_PATH, 'missing.wav', '--server',
+                                  self._server.address)[0])
+
+  def testServeExitCodeWhenWorkersAreNegative(self):
+    try:
+      cli._Main(['serve', '--port', '0', '--workers', '-1'])
+    except SystemExit as e:
+      self.assertEqual(127, e.code)
+    else:
+      raise Exception('Program did not exit properly.')
+
+
+class LatencyMeasurementCliCacheTest(unittest.TestCase):
+  """Tests to verify the reuse of cached results by the CLI."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testCachedResultsAreReused(self):
+    """Verifies a run with other reporting flags gives the same results."""
+    expected = _RunCli(DELAY1_PATH, DELAY2_PATH, '--parsable_output')
+    self.assertEqual(expected, _RunCli(
+        DELAY1_PATH, DELAY2_PATH, '--parsable_output', '--cache_dir',
+        self._temp_dir))
+    self.assertEqual(expected, _RunCli(
+        DELAY1_PATH, DELAY2_PATH, '--parsable_output', '--cache_dir',
+        self._temp_dir))
+    self.assertTrue(any(name.startswith('results-')
+                        for name in os.listdir(self._temp_dir)))
+
+    exit_code, _ = _RunCli(DELAY1_PATH, DELAY2_PATH, '--cache_dir',
+                           self._temp_dir, '--latency_threshold', '1')
+    self.assertEqual(exit_code, 0)
+
+
+class LatencyMeasurementCliProfileTest(unittest.TestCase):
+  """Tests to verify the profile written by the CLI."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testProfileFile(self):
+    """Verifies the profile is written and the results don't change."""
+    profile_path = os.path.join(self._temp_dir, 'profile.json')
+    expected = _RunCli(DELAY1_PATH, DELAY2_PATH, '--parsable_output')
+    self.assertEqual(expected, _RunCli(
+        DELAY1_PATH, DELAY2_PATH, '--parsable_output', '--profile',
+        profile_path))
+    with open(profile_path) as profile_file:
+      report = json.load(profile_file)
+    self.assertIn('analysis', report['stages'])
+    self.assertIn('pulse_search', report['stages'])
+    self.assertGreater(report['counters']['chunks'], 0)
+
 # TODO(omarestrada): Check that specifying other audio parameters work.
 
 
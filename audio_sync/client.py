@@ -0,0 +1,150 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Client of the analysis server, see the server module.
+
+It only depends on the standard library, so that sending a pair to a
+running server doesn't import numpy.
+"""
+
+import json
+import socket
+import time
+
+try:
+  from http import client as http_client
+except ImportError:
+  # Python 2
+  import httplib as http_client
+
+# Same values as in the server module, which imports numpy.
+ANALYZE_PATH = '/analyze'
+STATS_PATH = '/stats'
+HTTP_OK = 200
+HTTP_SERVICE_UNAVAILABLE = 503
+LATENCY_STATS_FIELDS = ('max_latency', 'min_latency', 'mean_latency')
+# Time the client waits for a place in the queue of the server by default
+DEFAULT_TIMEOUT_SECS = 60
+# Time the client waits for the connection to the server
+DEFAULT_CONNECT_TIMEOUT_SECS = 10
+# Time between the requests rejected because the queue was full
+RETRY_DELAY_SECS = 0.1
+
+
+class ServerError(Exception):
+  """Exception for requests the server didn't complete."""
+
+
+class _HttpError(Exception):
+  """Exception for responses whose status is not 200."""
+
+  def __init__(self, code, body):
+    super(_HttpError, self).__init__('HTTP status %d' % code)
+    self.code = code
+    self.body = body
+
+
+def _Request(address, path, data=None,
+             connect_timeout_secs=DEFAULT_CONNECT_TIMEOUT_SECS,
+             response_timeout_secs=None):
+  """Sends a request to the server and decodes its JSON response.
+
+  Args:
+    address: (string) the 'host:port' of the server.
+    path: (string) the path of the request.
+    data: (dict) data to POST as JSON, or None to GET the path.
+    connect_timeout_secs: (float) time to wait for the connection.
+    response_timeout_secs: (float) time to wait for the response once
+      connected, or None to wait as long as it takes.
+
+  Raises:
+    _HttpError: if the status of the response is not 200.
+    socket.error: if the server couldn't be reached, or didn't respond in
+      time.
+    http_client.HTTPException: if the response is invalid.
+  """
+  if data is None:
+    method, body = 'GET', None
+  else:
+    method, body = 'POST', json.dumps(data).encode('utf-8')
+  connection = http_client.HTTPConnection(address,
+                                          timeout=connect_timeout_secs)
+  try:
+    connection.connect()
+    connection.sock.settimeout(response_timeout_secs)
+    connection.request(method, path, body,
+                       {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response_body = response.read()
+  finally:
+    connection.close()
+  if response.status != HTTP_OK:
+    raise _HttpError(response.status, response_body)
+  return json.loads(response_body.decode('utf-8'))
+
+
+def Analyze(address, row, timeout_secs=DEFAULT_TIMEOUT_SECS,
+            result_timeout_secs=None):
+  """Analyzes a pair on a server.
+
+  While the queue of the server is full, the request is sent again every
+  RETRY_DELAY_SECS, until |timeout_secs| have passed.
+
+  Args:
+    address: (string) the 'host:port' of the server.
+    row: (dict) the pair, like a row of a batch manifest. The paths must be
+      absolute, or relative to the directory of the server.
+    timeout_secs: (float) time to wait for a place in the queue.
+    result_timeout_secs: (float) time to wait for the result of each request
+      once connected, or None to wait as long as the analysis takes.
+
+  Returns:
+    (dict) the record of the pair, with the 'latencies', 'dropouts' and
+    'latency_stats'.
+
+  Raises:
+    ServerError: if the analysis failed, or the server couldn't be reached
+      or didn't respond in time.
+  """
+  deadline = time.time() + timeout_secs
+  while True:
+    try:
+      return _Request(address, ANALYZE_PATH, row,
+                      response_timeout_secs=result_timeout_secs)
+    except _HttpError as e:
+      if e.code == HTTP_SERVICE_UNAVAILABLE and time.time() < deadline:
+        time.sleep(RETRY_DELAY_SECS)
+        continue
+      try:
+        message = json.loads(e.body.decode('utf-8'))['error']
+      except (ValueError, KeyError):
+        message = str(e)
+      raise ServerError('Error %d: %s' % (e.code, message))
+    except socket.timeout:
+      raise ServerError('%s did not respond in time.' % address)
+    except (socket.error, http_client.HTTPException) as e:
+      raise ServerError('Could not reach %s: %s' % (address, e))
+
+
+def GetStats(address, timeout_secs=DEFAULT_TIMEOUT_SECS):
+  """Gets the stats of a server, see server.AnalysisServer.GetStats().
+
+  Raises:
+    ServerError: if the server couldn't be reached.
+  """
+  try:
+    return _Request(address, STATS_PATH, connect_timeout_secs=timeout_secs,
+                    response_timeout_secs=timeout_secs)
+  except (socket.error, http_client.HTTPException, _HttpError) as e:
+    raise ServerError('Could not reach %s: %s' % (address, e))
@@ -0,0 +1,337 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Export of the analysis results to files, and loading of those files.
+
+The results can be written in the following formats:
+  - json: the object printed by the CLI with --parsable_output,
+    {"latencies": [[<time>, <latency>], ...], "dropouts": [[<start>, <end>],
+    ...]}.
+  - jsonl: JSON Lines, with one {"type": "latency", "time": <time>,
+    "latency": <latency>} record per latency and one {"type": "dropout",
+    "start": <start>, "end": <end>} record per dropout, in order, then a
+    {"type": "summary", ...} record with the stats and percentiles of the
+    latencies, see JsonlWriter.WriteSummary(). Unlike the other formats, it
+    can be written while the analysis is running.
+  - npz: a NumPy archive with the float64 arrays latency_times,
+    latency_values, dropout_starts and dropout_ends.
+  - csv: a header row 'type,start_secs,end_secs,latency_secs', then one
+    'latency,<time>,,<latency>' row per latency and one
+    'dropout,<start>,<end>,' row per dropout.
+  - binary: a 24-byte little-endian header with the magic 'ASRS', the
+    uint32 version of the layout (1), and the uint64 number of latencies N
+    and of dropouts M, followed by the little-endian float64 columns: N
+    latency times, N latencies, M dropout starts and M dropout ends.
+
+Except in json and jsonl, the latencies are written directly from the
+arrays of the LatencySeries, without going through Python objects. Invalid
+latencies are NaN in every format.
+"""
+
+import json
+import os
+import struct
+
+from audio_sync import lazy_loader
+
+# Imported when first used, so that the CLI can check the formats of its
+# flags without importing numpy.
+latency_series = lazy_loader.LazyLoader('latency_series', globals(),
+                                        'audio_sync.latency_series')
+latency_summary = lazy_loader.LazyLoader('latency_summary', globals(),
+                                         'audio_sync.latency_summary')
+numpy = lazy_loader.LazyLoader('numpy', globals(), 'numpy')
+
+FORMAT_JSON = 'json'
+FORMAT_JSONL = 'jsonl'
+FORMAT_NPZ = 'npz'
+FORMAT_CSV = 'csv'
+FORMAT_BINARY = 'binary'
+OUTPUT_FORMATS = (FORMAT_JSON, FORMAT_JSONL, FORMAT_NPZ, FORMAT_CSV,
+                  FORMAT_BINARY)
+# Formats of the files with these extensions
+FORMATS_OF_EXTENSIONS = {
+    '.json': FORMAT_JSON,
+    '.jsonl': FORMAT_JSONL,
+    '.npz': FORMAT_NPZ,
+    '.csv': FORMAT_CSV,
+    '.bin': FORMAT_BINARY,
+}
+
+# Header row of the CSV files
+CSV_HEADER = b'type,start_secs,end_secs,latency_secs\n'
+# Format of the latency and dropout rows, which keeps every digit
+_CSV_LATENCY_FORMAT = 'latency,%.17g,,%.17g'
+_CSV_DROPOUT_FORMAT = 'dropout,%.17g,%.17g,'
+# Magic bytes and version of the binary layout
+BINARY_MAGIC = b'ASRS'
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct('<4sIQQ')
+_BINARY_DTYPE = '<f8'
+_BINARY_ITEM_SIZE = struct.calcsize('<d')
+
+
+def GetFormat(path):
+  """Gets the format of a results file from its extension.
+
+  Args:
+    path: (string) path to the file.
+
+  Returns:
+    (string) one of OUTPUT_FORMATS.
+
+  Raises:
+    ValueError: if the extension is not one of FORMATS_OF_EXTENSIONS.
+  """
+  extension = os.path.splitext(path)[1].lower()
+  if extension not in FORMATS_OF_EXTENSIONS:
+    raise ValueError('Unknown results format of %s, expected one of the '
+                     'extensions %s.' % (
+                         path, ', '.join(sorted(FORMATS_OF_EXTENSIONS))))
+  return FORMATS_OF_EXTENSIONS[extension]
+
+
+class JsonlWriter(object):
+  """Writes results as JSON Lines records while they are analyzed.
+
+  The latencies are added to a LatencySummary as they are written, so the
+  summary doesn't need all of them.
+  """
+
+  def __init__(self, output_file):
+    """Creates the writer.
+
+    Args:
+      output_file: (file) binary file object to write to.
+    """
+    self._output_file = output_file
+    self.latency_summary = latency_summary.LatencySummary()
+    self.num_dropouts = 0
+
+  def Write(self, latencies, dropouts):
+    """Writes the records of some results, and flushes them.
+
+    Args:
+      latencies: (LatencySeries or list of 2-tuple) latencies which come
+        after the ones already written.
+      dropouts: (list of 2-tuple) dropouts which come after the ones already
+        written.
+    """
+    latencies = latency_series.LatencySeries.FromPairs(latencies)
+    lines = [json.dumps({'type': 'latency', 'time': time, 'latency': latency},
+                        sort_keys=True)
+             for time, latency in latencies]
+    lines += [json.dumps({'type': 'dropout', 'start': start, 'end': end},
+                         sort_keys=True)
+              for start, end in dropouts]
+    if lines:
+      self._output_file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+      self._output_file.flush()
+
+    self.latency_summary.Add(latencies)
+    self.num_dropouts += len(dropouts)
+
+  def GetStats(self):
+    """Gets the stats of the latencies written so far.
+
+    Returns:
+      The same 3-tuple as LatencySeries.GetStats().
+    """
+    return self.latency_summary.GetStats()
+
+  def WriteSummary(self, **fields):
+    """Writes the summary record.
+
+    The record has the max, min and mean latencies, the number of latencies,
+    invalid latencies and dropouts, the estimated 'percentiles' (see
+    LatencySummary.GetPercentiles()), and the 'latency_summary' which can be
+    merged with those of other runs (see LatencySummary.FromDict()).
+
+    Args:
+      **fields: other fields of the summary record.
+    """
+    max_latency, min_latency, mean_latency = self.GetStats()
+    num_latencies = self.latency_summary.num_latencies
+    summary = {
+        'type': 'summary',
+        'max_latency': max_latency,
+        'min_latency': min_latency,
+        'mean_latency': mean_latency,
+        'latencies': num_latencies,
+        'invalid_latencies': (
+            num_latencies - self.latency_summary.num_valid_latencies),
+        'dropouts': self.num_dropouts,
+        'percentiles': self.latency_summary.GetPercentiles(),
+        'latency_summary': self.latency_summary.ToDict(),
+    }
+    summary.update(fields)
+    self._output_file.write(
+        (json.dumps(summary, sort_keys=True) + '\n').encode('utf-8'))
+    self._output_file.flush()
+
+
+def _DropoutsToArray(dropouts):
+  return numpy.array(dropouts, dtype=numpy.float64).reshape(-1, 2)
+
+
+def WriteResults(output_file, latencies, dropouts, output_format):
+  """Writes results to a file object.
+
+  Args:
+    output_file: (file) binary file object to write to.
+    latencies: (LatencySeries or list of 2-tuple) the latencies.
+    dropouts: (list of 2-tuple) the dropouts.
+    output_format: (string) one of OUTPUT_FORMATS.
+
+  Raises:
+    ValueError: if the format is not one of OUTPUT_FORMATS.
+  """
+  latencies = latency_series.LatencySeries.FromPairs(latencies)
+  dropouts = _DropoutsToArray(dropouts)
+  if output_format == FORMAT_JSON:
+    encoder = json.JSONEncoder()
+    for data in encoder.iterencode({'latencies': latencies.ToList(),
+                                    'dropouts': dropouts.tolist()}):
+      output_file.write(data.encode('utf-8'))
+  elif output_format == FORMAT_JSONL:
+    writer = JsonlWriter(output_file)
+    writer.Write(latencies, dropouts.tolist())
+    writer.WriteSummary()
+  elif output_format == FORMAT_NPZ:
+    numpy.savez(output_file, latency_times=latencies.times,
+                latency_values=latencies.values,
+                dropout_starts=dropouts[:, 0], dropout_ends=dropouts[:, 1])
+  elif output_format == FORMAT_CSV:
+    output_file.write(CSV_HEADER)
+    numpy.savetxt(output_file,
+                  numpy.column_stack((latencies.times, latencies.values)),
+                  fmt=_CSV_LATENCY_FORMAT)
+    numpy.savetxt(output_file, dropouts, fmt=_CSV_DROPOUT_FORMAT)
+  elif output_format == FORMAT_BINARY:
+    output_file.write(_BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                                          len(latencies), len(dropouts)))
+    for column in (latencies.times, latencies.values, dropouts[:, 0],
+                   dropouts[:, 1]):
+      output_file.write(column.astype(_BINARY_DTYPE).tobytes())
+  else:
+    raise ValueError('Unknown results format %s.' % output_format)
+
+
+def SaveResults(path, latencies, dropouts, output_format=None):
+  """Writes results to a file.
+
+  Args:
+    path: (string) path to the file.
+    latencies: (LatencySeries or list of 2-tuple) the latencies.
+    dropouts: (list of 2-tuple) the dropouts.
+    output_format: (string) one of OUTPUT_FORMATS. Defaults to the format of
+      the extension of |path|.
+
+  Raises:
+    ValueError: if the format is not known.
+  """
+  output_format = output_format or GetFormat(path)
+  with open(path, 'wb') as output_file:
+    WriteResults(output_file, latencies, dropouts, output_format)
+
+
+def _ReadBinary(input_file):
+  """Reads the latencies and dropouts of a file in the binary layout."""
+  header = input_file.read(_BINARY_HEADER.size)
+  if len(header) != _BINARY_HEADER.size:
+    raise ValueError('Truncated header.')
+  magic, version, num_latencies, num_dropouts = _BINARY_HEADER.unpack(header)
+  if magic != BINARY_MAGIC or version != BINARY_VERSION:
+    raise ValueError('Not a results file of version %d.' % BINARY_VERSION)
+  columns = []
+  for length in (num_latencies, num_latencies, num_dropouts, num_dropouts):
+    data = input_file.read(length * _BINARY_ITEM_SIZE)
+    if len(data) != length * _BINARY_ITEM_SIZE:
+      raise ValueError('Truncated data.')
+    columns.append(numpy.frombuffer(data, dtype=_BINARY_DTYPE))
+  return columns
+
+
+def _ReadJsonl(input_file):
+  """Reads the latencies and dropouts of a JSON Lines file."""
+  latencies = []
+  dropouts = []
+  for line in input_file:
+    record = json.loads(line.decode('utf-8'))
+    if record['type'] == 'latency':
+      latencies.append((record['time'], record['latency']))
+    elif record['type'] == 'dropout':
+      dropouts.append((record['start'], record['end']))
+  latencies = latency_series.LatencySeries.FromPairs(latencies)
+  dropouts = _DropoutsToArray(dropouts)
+  return latencies.times, latencies.values, dropouts[:, 0], dropouts[:, 1]
+
+
+def _ReadCsv(input_file):
+  """Reads the latencies and dropouts of a CSV file."""
+  if input_file.readline() != CSV_HEADER:
+    raise ValueError('Invalid header, expected %r.' % CSV_HEADER)
+  latencies = []
+  dropouts = []
+  for line in input_file:
+    record_type, start, end, latency = line.decode('ascii').strip().split(',')
+    if record_type == 'latency':
+      latencies.append((float(start), float(latency)))
+    elif record_type == 'dropout':
+      dropouts.append((float(start), float(end)))
+    else:
+      raise ValueError('Invalid row type %r.' % record_type)
+  latencies = latency_series.LatencySeries.FromPairs(latencies)
+  dropouts = _DropoutsToArray(dropouts)
+  return latencies.times, latencies.values, dropouts[:, 0], dropouts[:, 1]
+
+
+def LoadResults(path, output_format=None):
+  """Loads results written by SaveResults() or the CLI.
+
+  Args:
+    path: (string) path to the file.
+    output_format: (string) one of OUTPUT_FORMATS. Defaults to the format of
+      the extension of |path|.
+
+  Returns:
+    A 2-tuple with the latencies and dropouts, in the format returned by
+    audio_sync.AnalyzeAudios().
+
+  Raises:
+    ValueError: if the format is not known, or the file is not valid.
+  """
+  output_format = output_format or GetFormat(path)
+  with open(path, 'rb') as input_file:
+    if output_format == FORMAT_JSON:
+      results = json.loads(input_file.read().decode('utf-8'))
+      latencies = latency_series.LatencySeries.FromPairs(results['latencies'])
+      dropouts = _DropoutsToArray(results['dropouts'])
+      columns = (latencies.times, latencies.values, dropouts[:, 0],
+                 dropouts[:, 1])
+    elif output_format == FORMAT_JSONL:
+      columns = _ReadJsonl(input_file)
+    elif output_format == FORMAT_NPZ:
+      arrays = numpy.load(input_file)
+      columns = [arrays[name] for name in ('latency_times', 'latency_values',
+                                           'dropout_starts', 'dropout_ends')]
+    elif output_format == FORMAT_CSV:
+      columns = _ReadCsv(input_file)
+    elif output_format == FORMAT_BINARY:
+      columns = _ReadBinary(input_file)
+    else:
+      raise ValueError('Unknown results format %s.' % output_format)
+  latency_times, latency_values, dropout_starts, dropout_ends = columns
+  return (latency_series.LatencySeries(latency_times, latency_values),
+          list(zip(dropout_starts.tolist(), dropout_ends.tolist())))
@@ -0,0 +1,120 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the export module."""
+
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from audio_sync import export
+from audio_sync import latency_series
+from audio_sync import latency_summary
+
+LATENCIES = latency_series.LatencySeries(
+    [0.1495, 0.4495, 0.7495, 1.0 / 3], [0.0, -0.01, float('NaN'), 0.1 + 0.2])
+DROPOUTS = [(0.125125, 0.13075), (0.5095000000000001, 0.9995)]
+
+
+class ExportTest(unittest.TestCase):
+  """Tests for the export and loading of results."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _AssertResultsEqual(self, expected, actual):
+    (expected_latencies, expected_dropouts), (latencies, dropouts) = (
+        expected, actual)
+    # repr() compares the NaN latencies too.
+    self.assertEqual(repr(list(expected_latencies)), repr(list(latencies)))
+    self.assertEqual(expected_dropouts, dropouts)
+
+  def testSaveLoad(self):
+    for extension in export.FORMATS_OF_EXTENSIONS:
+      path = os.path.join(self._temp_dir, 'results' + extension)
+      export.SaveResults(path, LATENCIES, DROPOUTS)
+      self._AssertResultsEqual((LATENCIES, DROPOUTS),
+                               export.LoadResults(path))
+
+  def testSaveLoadEmptyResults(self):
+    for output_format in export.OUTPUT_FORMATS:
+      path = os.path.join(self._temp_dir, 'results')
+      export.SaveResults(path, [], [], output_format)
+      self._AssertResultsEqual(([], []),
+                               export.LoadResults(path, output_format))
+
+  def testBinaryLayout(self):
+    output_file = io.BytesIO()
+    export.WriteResults(output_file, LATENCIES[:2], DROPOUTS[:1],
+                        export.FORMAT_BINARY)
+    self.assertEqual(
+        b'ASRS' + struct.pack('<IQQ', 1, 2, 1) +
+        struct.pack('<6d', 0.1495, 0.4495, 0.0, -0.01, 0.125125, 0.13075),
+        output_file.getvalue())
+
+  def testCsvLayout(self):
+    output_file = io.BytesIO()
+    export.WriteResults(output_file, [(0.5, 0.25)], [(1.0, 1.5)],
+                        export.FORMAT_CSV)
+    self.assertEqual(b'type,start_secs,end_secs,latency_secs\n'
+                     b'latency,0.5,,0.25\n'
+                     b'dropout,1,1.5,\n', output_file.getvalue())
+
+  def testJsonlWriter(self):
+    output_file = io.BytesIO()
+    writer = export.JsonlWriter(output_file)
+    writer.Write(LATENCIES[:2], DROPOUTS[:1])
+    writer.Write(LATENCIES[2:], DROPOUTS[1:])
+    self.assertEqual(LATENCIES.GetStats(), writer.GetStats())
+    writer.WriteSummary(exit_code=2)
+
+    records = [json.loads(line.decode('utf-8'))
+               for line in output_file.getvalue().splitlines()]
+    self.assertEqual(['latency', 'latency', 'dropout', 'latency', 'latency',
+                      'dropout', 'summary'],
+                     [record['type'] for record in records])
+    summary = records[-1]
+    self.assertEqual(4, summary['latencies'])
+    self.assertEqual(1, summary['invalid_latencies'])
+    self.assertEqual(2, summary['dropouts'])
+    self.assertEqual(2, summary['exit_code'])
+    self.assertAlmostEqual(0.3, summary['max_latency'])
+    self.assertEqual(len(latency_series.DEFAULT_PERCENTILES),
+                     len(summary['percentiles']))
+    self.assertEqual(4, latency_summary.LatencySummary.FromDict(
+        summary['latency_summary']).num_latencies)
+
+  def testInvalidFiles(self):
+    with self.assertRaises(ValueError):
+      export.GetFormat('results.txt')
+    path = os.path.join(self._temp_dir, 'results.bin')
+    export.SaveResults(path, LATENCIES, DROPOUTS)
+    with open(path, 'rb') as input_file:
+      data = input_file.read()
+    for invalid_data in (data[:-1], b'XXXX' + data[4:]):
+      with open(path, 'wb') as output_file:
+        output_file.write(invalid_data)
+      with self.assertRaises(ValueError):
+        export.LoadResults(path)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,184 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Generation of test audio with known latencies, drift and dropouts.
+
+The generated audio has the same shape as the one generated with SoX in the
+README: every period starts with a sine pulse of one cycle, and is followed
+by noise (white instead of pink) until the next pulse.
+
+Each channel can be impaired, to produce recordings whose latencies and
+dropouts are known:
+  - latency_secs: the pulses are delayed by this time.
+  - drift_ppm: the clock of the channel runs faster by this many parts per
+    million, so the pulses come earlier and earlier (or later and later if
+    negative).
+  - dropouts: (start_secs, end_secs) ranges which are silent.
+
+The files are written a block at a time, so the memory used doesn't depend on
+their duration.
+"""
+from __future__ import division
+
+import collections
+import math
+import wave
+
+import numpy
+
+from audio_sync import analyzer
+
+
+# Number of frames generated at a time
+FRAMES_PER_BLOCK = 65536
+# Widths of the samples which can be written, in bytes
+SAMPLE_WIDTHS = (1, 2, 3, 4)
+# Parts per million
+PPM = 1e-6
+
+# Properties of the generated audio
+GeneratorSettings = collections.namedtuple(
+    'GeneratorSettings', ['period_secs', 'pulse_duration_secs',
+                          'pulse_amplitude', 'noise_amplitude', 'samp_rate',
+                          'sample_width', 'num_channels'])
+
+# Properties of the audio generated with SoX in the README
+DEFAULT_GENERATOR_SETTINGS = GeneratorSettings(
+    period_secs=0.1,
+    pulse_duration_secs=0.002,
+    pulse_amplitude=0.8,
+    noise_amplitude=0.2,
+    samp_rate=48000,
+    sample_width=2,
+    num_channels=1)
+
+# Impairments of a generated channel, see the module doc comment
+Impairments = collections.namedtuple('Impairments',
+                                     ['latency_secs', 'drift_ppm', 'dropouts'])
+Impairments.__new__.__defaults__ = (0.0, 0.0, ())
+
+NO_IMPAIRMENTS = Impairments()
+
+
+def GenerateSignal(start_frame, num_frames, settings, impairments,
+                   random_state):
+  """Generates a block of one channel of test audio.
+
+  Args:
+    start_frame: (int) position of the block in the audio.
+    num_frames: (int) number of frames of the block.
+    settings: (GeneratorSettings) properties of the audio.
+    impairments: (Impairments) impairments of the channel.
+    random_state: (numpy.random.RandomState) source of the noise.
+
+  Returns:
+    (numpy.ndarray) the signal normalized to [-1, 1].
+  """
+  times = numpy.arange(start_frame, start_frame + num_frames) / float(
+      settings.samp_rate)
+  # Time since the start of the audio, on the clock of the channel
+  channel_times = ((times - impairments.latency_secs) *
+                   (1 + impairments.drift_ppm * PPM))
+  time_in_period = numpy.mod(channel_times, settings.period_secs)
+  is_pulse = ((channel_times >= 0) &
+              (time_in_period < settings.pulse_duration_secs))
+
+  signal = random_state.uniform(-settings.noise_amplitude,
+                                settings.noise_amplitude, num_frames)
+  signal[is_pulse] = settings.pulse_amplitude * numpy.sin(
+      2 * numpy.pi * time_in_period[is_pulse] / settings.pulse_duration_secs)
+  if len(impairments.dropouts):
+    dropout_frames = numpy.ceil(numpy.reshape(
+        impairments.dropouts, (-1, 2)) * settings.samp_rate).astype(int)
+    dropout_frames -= start_frame
+    in_block = (dropout_frames[:, 0] < num_frames) & (dropout_frames[:, 1] > 0)
+    for first_frame, end_frame in numpy.clip(dropout_frames[in_block], 0,
+                                             num_frames):
+      signal[first_frame:end_frame] = 0
+  return signal
+
+
+def Float2Pcm(signal, sample_width):
+  """Converts a signal normalized to [-1, 1] to packed little-endian PCM.
+
+  Like in WAV files, samples of 1 byte are unsigned, all others are signed.
+
+  Args:
+    signal: (numpy.ndarray) the signal, interleaved if it has several
+      channels.
+    sample_width: (int) width of the samples in bytes, one of SAMPLE_WIDTHS.
+
+  Returns:
+    (bytes) the packed samples.
+
+  Raises:
+    ValueError: if the width is not supported.
+  """
+  if sample_width not in SAMPLE_WIDTHS:
+    raise ValueError('Invalid width %d.' % sample_width)
+  scaler = 2 ** (analyzer.BITS_PER_BYTE * sample_width - 1) - 1
+  samples = numpy.round(numpy.clip(signal, -1, 1) * scaler).astype('<i4')
+  if sample_width == 1:
+    return (samples + scaler + 1).astype('u1').tobytes()
+  if sample_width == 3:
+    # Drop the most significant byte of each little-endian int32.
+    return samples.view('u1').reshape(-1, 4)[:, :3].tobytes()
+  return samples.astype('<i%d' % sample_width).tobytes()
+
+
+def WriteTestAudio(wave_path, duration_secs,
+                   settings=DEFAULT_GENERATOR_SETTINGS, impairments=None,
+                   seed=0):
+  """Writes test audio to a WAV file.
+
+  Args:
+    wave_path: (string) path of the WAV file to write.
+    duration_secs: (float) duration of the audio.
+    settings: (GeneratorSettings) properties of the audio.
+    impairments: (list of Impairments) impairments of each channel. Defaults
+      to no impairments.
+    seed: (int) seed of the noise. Each channel has its own source of
+      noise, seeded with (seed, <channel>), so that the audio doesn't depend
+      on FRAMES_PER_BLOCK.
+
+  Raises:
+    ValueError: if the settings are invalid, or if there are not as many
+      impairments as channels.
+  """
+  if impairments is None:
+    impairments = [NO_IMPAIRMENTS] * settings.num_channels
+  if len(impairments) != settings.num_channels:
+    raise ValueError('Got impairments for %d channels instead of %d.' % (
+        len(impairments), settings.num_channels))
+  if settings.sample_width not in SAMPLE_WIDTHS:
+    raise ValueError('Invalid width %d.' % settings.sample_width)
+
+  num_frames = int(math.ceil(duration_secs * settings.samp_rate))
+  random_states = [numpy.random.RandomState([seed, channel])
+                   for channel in range(settings.num_channels)]
+  wave_writer = wave.open(wave_path, 'wb')
+  try:
+    wave_writer.setnchannels(settings.num_channels)
+    wave_writer.setsampwidth(settings.sample_width)
+    wave_writer.setframerate(settings.samp_rate)
+    for start_frame in range(0, num_frames, FRAMES_PER_BLOCK):
+      block_frames = min(FRAMES_PER_BLOCK, num_frames - start_frame)
+      channels = [GenerateSignal(start_frame, block_frames, settings,
+                                 channel_impairments, random_state)
+                  for channel_impairments, random_state in zip(
+                      impairments, random_states)]
+      wave_writer.writeframes(Float2Pcm(numpy.column_stack(channels).ravel(),
+                                        settings.sample_width))
+  finally:
+    wave_writer.close()
@@ -0,0 +1,145 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the generator module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+import numpy
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import wave_reader
+
+SETTINGS = generator.DEFAULT_GENERATOR_SETTINGS._replace(samp_rate=16000)
+ANALYSIS_SETTINGS = analyzer.AnalysisSettings(0.1, 0.002, 0.5, 0.05, 0.005)
+
+
+class GeneratorTest(unittest.TestCase):
+  """Tests for the generation of test audio."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._ref_path = os.path.join(self._temp_dir, 'ref.wav')
+    self._act_path = os.path.join(self._temp_dir, 'act.wav')
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _GetLatencies(self, impairments, duration_secs=10):
+    generator.WriteTestAudio(self._ref_path, duration_secs, SETTINGS)
+    generator.WriteTestAudio(self._act_path, duration_secs, SETTINGS,
+                             [impairments], seed=1)
+    return audio_sync.AnalyzeAudios(self._ref_path, self._act_path,
+                                    ANALYSIS_SETTINGS)
+
+  def testWaveParameters(self):
+    settings = SETTINGS._replace(sample_width=4, num_channels=3)
+    generator.WriteTestAudio(self._ref_path, 1.5, settings)
+    wave_file = wave.open(self._ref_path)
+    try:
+      self.assertEqual(3, wave_file.getnchannels())
+      self.assertEqual(4, wave_file.getsampwidth())
+      self.assertEqual(16000, wave_file.getframerate())
+      self.assertEqual(24000, wave_file.getnframes())
+    finally:
+      wave_file.close()
+
+  def testInvalidParameters(self):
+    with self.assertRaises(ValueError):
+      generator.WriteTestAudio(self._ref_path, 1, SETTINGS,
+                               [generator.NO_IMPAIRMENTS] * 2)
+    with self.assertRaises(ValueError):
+      generator.WriteTestAudio(self._ref_path, 1,
+                               SETTINGS._replace(sample_width=5))
+
+  def testBlocksDontChangeAudio(self):
+    for num_channels in (1, 2):
+      settings = SETTINGS._replace(num_channels=num_channels)
+      generator.WriteTestAudio(self._ref_path, 1, settings)
+      frames_per_block = generator.FRAMES_PER_BLOCK
+      try:
+        generator.FRAMES_PER_BLOCK = 1000
+        generator.WriteTestAudio(self._act_path, 1, settings)
+      finally:
+        generator.FRAMES_PER_BLOCK = frames_per_block
+
+      with open(self._ref_path, 'rb') as ref_file:
+        with open(self._act_path, 'rb') as act_file:
+          self.assertEqual(ref_file.read(), act_file.read())
+
+  def testFloat2Pcm(self):
+    signal = numpy.array([-1, -0.5, 0, 0.5, 1])
+    self.assertEqual(numpy.array([1, 64, 128, 192, 255], dtype='u1').tobytes(),
+                     generator.Float2Pcm(signal, 1))
+    self.assertEqual(
+        numpy.array([-32767, -16384, 0, 16384, 32767], dtype='<i2').tobytes(),
+        generator.Float2Pcm(signal, 2))
+    self.assertEqual(b'\x01\x00\x80\x00\x00\xc0\x00\x00\x00'
+                     b'\x00\x00\x40\xff\xff\x7f',
+                     generator.Float2Pcm(signal, 3))
+    with self.assertRaises(ValueError):
+      generator.Float2Pcm(signal, 8)
+
+  def testLatency(self):
+    latencies, dropouts = self._GetLatencies(
+        generator.Impairments(latency_secs=0.005))
+    self.assertEqual(set([-0.005]), set(
+        round(latency, 6) for _, latency in latencies))
+    self.assertEqual([], dropouts)
+
+  def testSampleWidths(self):
+    """Checks the audio of every width is read back as it was generated."""
+    signal = generator.GenerateSignal(0, 1000, SETTINGS,
+                                      generator.NO_IMPAIRMENTS,
+                                      numpy.random.RandomState([0, 0]))
+    for sample_width in generator.SAMPLE_WIDTHS:
+      generator.WriteTestAudio(
+          self._ref_path, 1000.0 / SETTINGS.samp_rate,
+          SETTINGS._replace(sample_width=sample_width))
+      reader = wave_reader.CreateWaveReader(self._ref_path)
+      try:
+        samples = wave_reader.Pcm2Float(reader.ReadSamplesArray(),
+                                        reader.GetSampleScaler())
+      finally:
+        reader.Close()
+      numpy.testing.assert_allclose(
+          signal, samples, atol=2.0 / 2 ** (8 * sample_width - 1))
+
+  def testDrift(self):
+    """Checks the latency increases by the drift every second."""
+    latencies, _ = self._GetLatencies(generator.Impairments(drift_ppm=500))
+    times, latency_values = numpy.array(latencies).T
+    slope = numpy.polyfit(times, latency_values, 1)[0]
+    self.assertAlmostEqual(500e-6, slope, delta=20e-6)
+
+  def testDropouts(self):
+    _, dropouts = self._GetLatencies(
+        generator.Impairments(dropouts=[(2.0, 2.5), (6.05, 6.2)]))
+    self.assertEqual(2, len(dropouts))
+    for (start, end), (dropout_start, dropout_end) in zip(
+        [(2.0, 2.5), (6.05, 6.2)], dropouts):
+      # The start of a dropout is only known to be after the previous pulse.
+      self.assertAlmostEqual(start, dropout_start,
+                             delta=ANALYSIS_SETTINGS.period_secs)
+      self.assertAlmostEqual(end, dropout_end, delta=0.001)
+
+
+if __name__ == '__main__':
+  unittest.main()
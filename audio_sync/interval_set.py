@@ -0,0 +1,191 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Sorted set of time intervals, such as the dropouts of an analysis.
+
+The starts and ends of the intervals are kept in two arrays of floats, in
+increasing order. Intervals separated by less than |min_gap_secs| (e.g.
+analyzer.NO_GAP_TIME_SECS for dropouts) are merged in a single pass when
+they are added, so the intervals of the set never overlap, and queries are
+binary searches of the arrays.
+
+Like LatencySeries, an IntervalSet iterates, indexes and compares like the
+list of (<start>, <end>) tuples it replaces. Only the standard library is
+used, so that the plots and the CLI don't need numpy for it.
+"""
+
+import array
+import bisect
+import heapq
+
+
+class IntervalSet(object):
+  """Sorted and disjoint (<start>, <end>) intervals in seconds."""
+
+  def __init__(self, intervals=(), min_gap_secs=0.0):
+    """Creates the set.
+
+    Args:
+      intervals: (iterable of 2-tuple) the intervals, in any order.
+      min_gap_secs: (float) intervals separated by less than this are merged,
+        so with 0 only overlapping intervals are.
+
+    Raises:
+      ValueError: if an interval ends before it starts.
+    """
+    self.min_gap_secs = min_gap_secs
+    self.starts = array.array('d')
+    self.ends = array.array('d')
+    self.Extend(intervals)
+
+  def __len__(self):
+    return len(self.starts)
+
+  def __iter__(self):
+    return iter(zip(self.starts, self.ends))
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return IntervalSet(zip(self.starts[index], self.ends[index]),
+                         self.min_gap_secs)
+    return self.starts[index], self.ends[index]
+
+  def __eq__(self, other):
+    try:
+      return self.ToList() == list(other)
+    except TypeError:
+      return NotImplemented
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'IntervalSet(%r)' % self.ToList()
+
+  def ToList(self):
+    """Gets the intervals as a list of (<start>, <end>) tuples of floats.
+
+    The list can be serialized to JSON.
+    """
+    return list(zip(self.starts, self.ends))
+
+  def _Append(self, start, end):
+    """Adds an interval which doesn't start before the last one.
+
+    The intervals are merged if they are less than min_gap_secs apart.
+    """
+    if start > end:
+      raise ValueError('The interval (%r, %r) is inverted.' % (start, end))
+    if self.ends and start - self.ends[-1] < self.min_gap_secs:
+      self.ends[-1] = max(self.ends[-1], end)
+    else:
+      self.starts.append(start)
+      self.ends.append(end)
+
+  def Extend(self, intervals):
+    """Adds intervals to the set.
+
+    Intervals which are sorted and don't start before the last interval of
+    the set, like the dropouts of the next chunk of an analysis, are added
+    in time linear in their number. Others are merged with the whole set.
+
+    Args:
+      intervals: (iterable of 2-tuple) the intervals, in any order.
+
+    Raises:
+      ValueError: if an interval ends before it starts.
+    """
+    intervals = [(float(start), float(end)) for start, end in intervals]
+    is_sorted = all(intervals[index - 1][0] <= intervals[index][0]
+                    for index in range(1, len(intervals)))
+    if not is_sorted or (intervals and self.starts and
+                         intervals[0][0] < self.starts[-1]):
+      intervals = list(heapq.merge(self.ToList(), sorted(intervals)))
+      del self.starts[:]
+      del self.ends[:]
+    for start, end in intervals:
+      self._Append(start, end)
+
+  def PopEndingBy(self, time_secs):
+    """Removes the intervals which end at or before a time.
+
+    Args:
+      time_secs: (float) the time.
+
+    Returns:
+      (list of 2-tuple) the intervals removed.
+    """
+    # As the intervals don't overlap, their ends are sorted too.
+    index = bisect.bisect_right(self.ends, time_secs)
+    intervals = list(zip(self.starts[:index], self.ends[:index]))
+    del self.starts[:index]
+    del self.ends[:index]
+    return intervals
+
+  def Contains(self, time_secs):
+    """Tells if a time is in one of the intervals, bounds included."""
+    index = bisect.bisect_right(self.starts, time_secs) - 1
+    return index >= 0 and time_secs <= self.ends[index]
+
+  def Overlaps(self, start, end):
+    """Tells if one of the intervals overlaps (start, end).
+
+    Intervals which only share a bound with it don't overlap it.
+    """
+    index = bisect.bisect_right(self.ends, start)
+    return index < len(self) and self.starts[index] < end
+
+  def Union(self, other):
+    """Gets the intervals which are in either set.
+
+    Args:
+      other: (IntervalSet or list of 2-tuple) the other intervals.
+
+    Returns:
+      (IntervalSet) the union, with the min_gap_secs of this set.
+    """
+    if not isinstance(other, IntervalSet):
+      other = IntervalSet(other)
+    return IntervalSet(heapq.merge(self, other), self.min_gap_secs)
+
+  def Intersection(self, other):
+    """Gets the parts of the intervals which overlap in both sets.
+
+    Args:
+      other: (IntervalSet or list of 2-tuple) the other intervals.
+
+    Returns:
+      (IntervalSet) the intersection, with the min_gap_secs of this set.
+    """
+    if not isinstance(other, IntervalSet):
+      other = IntervalSet(other)
+    intersection = IntervalSet(min_gap_secs=self.min_gap_secs)
+    index = other_index = 0
+    while index < len(self) and other_index < len(other):
+      start = max(self.starts[index], other.starts[other_index])
+      end = min(self.ends[index], other.ends[other_index])
+      if start < end:
+        intersection._Append(start, end)
+      if self.ends[index] < other.ends[other_index]:
+        index += 1
+      else:
+        other_index += 1
+    return intersection
+
+  def GetTotalDuration(self):
+    """Gets the sum of the durations of the intervals (float), in secs."""
+    return sum(end - start for start, end in self)
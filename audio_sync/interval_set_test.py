@@ -0,0 +1,117 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the interval_set module."""
+
+import json
+import unittest
+
+from audio_sync import interval_set
+
+NO_GAP_TIME_SECS = 0.001
+
+
+class IntervalSetTest(unittest.TestCase):
+  """Tests for the IntervalSet class."""
+
+  def setUp(self):
+    self._intervals = interval_set.IntervalSet(
+        [(1.0, 2.0), (4.0, 5.0), (7.0, 7.5)])
+
+  def testBehavesLikeListOfTuples(self):
+    self.assertEqual(3, len(self._intervals))
+    self.assertEqual((4.0, 5.0), self._intervals[1])
+    self.assertEqual((7.0, 7.5), self._intervals[-1])
+    self.assertEqual([(4.0, 5.0), (7.0, 7.5)], self._intervals[1:])
+    self.assertEqual([(1.0, 2.0), (4.0, 5.0), (7.0, 7.5)],
+                     list(self._intervals))
+    self.assertNotEqual([(1.0, 2.0)], self._intervals)
+    self.assertFalse(interval_set.IntervalSet())
+    self.assertEqual('[[1.0, 2.0], [4.0, 5.0], [7.0, 7.5]]',
+                     json.dumps(self._intervals.ToList()))
+
+  def testMergesIntervalsWithoutGap(self):
+    intervals = interval_set.IntervalSet(
+        [(0.0, 1.0), (1.0005, 2.0), (2.5, 3.0), (3.002, 4.0), (3.5, 3.6)],
+        NO_GAP_TIME_SECS)
+    self.assertEqual([(0.0, 2.0), (2.5, 3.0), (3.002, 4.0)], intervals)
+
+    intervals.Extend([(4.0005, 4.5), (6.0, 7.0)])
+    self.assertEqual([(0.0, 2.0), (2.5, 3.0), (3.002, 4.5), (6.0, 7.0)],
+                     intervals)
+    # Intervals before the last one are merged with the whole set.
+    intervals.Extend([(5.0, 5.5), (0.5, 2.8)])
+    self.assertEqual([(0.0, 3.0), (3.002, 4.5), (5.0, 5.5), (6.0, 7.0)],
+                     intervals)
+
+  def testOnlyOverlappingIntervalsMergedWithoutMinGap(self):
+    self.assertEqual([(0.0, 1.0), (1.0, 2.0)],
+                     interval_set.IntervalSet([(1.0, 2.0), (0.0, 1.0)]))
+    self.assertEqual([(0.0, 2.0)],
+                     interval_set.IntervalSet([(0.0, 1.5), (1.0, 2.0)]))
+
+  def testInvertedInterval(self):
+    with self.assertRaises(ValueError):
+      interval_set.IntervalSet([(2.0, 1.0)])
+
+  def testPopEndingBy(self):
+    self.assertEqual([(1.0, 2.0), (4.0, 5.0)],
+                     self._intervals.PopEndingBy(5.0))
+    self.assertEqual([(7.0, 7.5)], self._intervals)
+    self.assertEqual([], self._intervals.PopEndingBy(7.4))
+    self.assertEqual([(7.0, 7.5)], self._intervals.PopEndingBy(float('inf')))
+    self.assertFalse(self._intervals)
+
+  def testContains(self):
+    for time_secs in (1.0, 1.5, 2.0, 7.5):
+      self.assertTrue(self._intervals.Contains(time_secs))
+    for time_secs in (0.5, 2.5, 6.9, 8.0):
+      self.assertFalse(self._intervals.Contains(time_secs))
+
+  def testOverlaps(self):
+    self.assertTrue(self._intervals.Overlaps(1.5, 1.6))  # Containment.
+    self.assertTrue(self._intervals.Overlaps(0.0, 10.0))
+    self.assertTrue(self._intervals.Overlaps(4.5, 6.0))  # Right overlap.
+    self.assertTrue(self._intervals.Overlaps(6.0, 7.1))  # Left overlap.
+    self.assertFalse(self._intervals.Overlaps(2.5, 3.5))
+    self.assertFalse(self._intervals.Overlaps(2.0, 4.0))  # Boundaries
+    self.assertFalse(self._intervals.Overlaps(8.0, 9.0))
+
+  def testUnion(self):
+    union = self._intervals.Union([(1.5, 4.0), (8.0, 9.0)])
+    self.assertEqual([(1.0, 4.0), (4.0, 5.0), (7.0, 7.5), (8.0, 9.0)], union)
+    self.assertEqual(self._intervals, self._intervals.Union([]))
+    union = interval_set.IntervalSet([(0.0, 1.0)], NO_GAP_TIME_SECS).Union(
+        interval_set.IntervalSet([(1.0005, 2.0)]))
+    self.assertEqual([(0.0, 2.0)], union)
+
+  def testIntersection(self):
+    intersection = self._intervals.Intersection(
+        interval_set.IntervalSet([(1.5, 4.5), (5.0, 6.0), (6.5, 10.0)]))
+    self.assertEqual([(1.5, 2.0), (4.0, 4.5), (7.0, 7.5)], intersection)
+    self.assertEqual([], self._intervals.Intersection([(2.0, 4.0)]))
+
+  def testGetTotalDuration(self):
+    self.assertAlmostEqual(2.5, self._intervals.GetTotalDuration())
+    self.assertEqual(0, interval_set.IntervalSet().GetTotalDuration())
+
+  def testManyIntervals(self):
+    starts = [index * 0.01 for index in range(100000)]
+    intervals = interval_set.IntervalSet(
+        [(start, start + 0.0095) for start in starts], NO_GAP_TIME_SECS)
+    self.assertEqual([(0.0, starts[-1] + 0.0095)], intervals)
+
+
+if __name__ == '__main__':
+  unittest.main()
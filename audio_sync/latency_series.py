@@ -0,0 +1,165 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Compact container of the latencies measured during an analysis.
+
+A day-long recording has close to a million latencies, which take a lot more
+memory as a list of (<time>, <latency>) tuples than as two arrays of floats.
+LatencySeries keeps them as arrays, but still iterates, indexes and compares
+like the list of tuples, so the callers of the analysis don't need to know.
+
+The latencies of invalid windows are NaN, and are ignored by the statistics.
+"""
+
+import numpy
+
+# Percentiles reported by default
+DEFAULT_PERCENTILES = (0, 50, 75, 90, 95, 99, 100)
+
+
+class LatencySeries(object):
+  """Latencies of an analysis, as (<time>, <latency>) pairs in seconds."""
+
+  def __init__(self, times=(), values=()):
+    """Creates the series.
+
+    Args:
+      times: (sequence of float) time of each latency, in increasing order.
+      values: (sequence of float) the latencies, NaN for invalid windows.
+
+    Raises:
+      ValueError: if there are not as many times as latencies.
+    """
+    self.times = numpy.array(times, dtype=numpy.float64).ravel()
+    self.values = numpy.array(values, dtype=numpy.float64).ravel()
+    if len(self.times) != len(self.values):
+      raise ValueError('Got %d times for %d latencies.' % (
+          len(self.times), len(self.values)))
+
+  @classmethod
+  def FromPairs(cls, pairs):
+    """Creates a series from (<time>, <latency>) pairs.
+
+    Args:
+      pairs: (iterable of 2-tuple) the latencies, or a LatencySeries which is
+        returned as is.
+
+    Returns:
+      (LatencySeries) the series.
+    """
+    if isinstance(pairs, cls):
+      return pairs
+    pairs = numpy.array(list(pairs), dtype=numpy.float64).reshape(-1, 2)
+    return cls(pairs[:, 0], pairs[:, 1])
+
+  @classmethod
+  def Concatenate(cls, series):
+    """Concatenates several series in order.
+
+    Args:
+      series: (list of LatencySeries) the series.
+
+    Returns:
+      (LatencySeries) the concatenation.
+    """
+    if not series:
+      return cls()
+    return cls(numpy.concatenate([s.times for s in series]),
+               numpy.concatenate([s.values for s in series]))
+
+  def __len__(self):
+    return len(self.times)
+
+  def __iter__(self):
+    return iter(self.ToList())
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return LatencySeries(self.times[index], self.values[index])
+    return float(self.times[index]), float(self.values[index])
+
+  def __eq__(self, other):
+    try:
+      return self.ToList() == list(other)
+    except TypeError:
+      return NotImplemented
+
+  def __ne__(self, other):
+    equal = self.__eq__(other)
+    return equal if equal is NotImplemented else not equal
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'LatencySeries(%r)' % self.ToList()
+
+  def __array__(self, dtype=None, copy=None):
+    # The (<time>, <value>) rows are always a new array, which can't be
+    # avoided when asked not to copy.
+    if copy is False:
+      raise ValueError('A LatencySeries cannot be converted to an array '
+                       'without a copy.')
+    return numpy.column_stack((self.times, self.values)).astype(
+        dtype or numpy.float64, copy=False)
+
+  def ToList(self):
+    """Gets the latencies as a list of (<time>, <latency>) tuples of floats.
+
+    The list can be serialized to JSON.
+    """
+    return list(zip(self.times.tolist(), self.values.tolist()))
+
+  def GetValidValues(self):
+    """Gets the latencies of the valid windows.
+
+    Returns:
+      (numpy.ndarray) the latencies which are not NaN.
+    """
+    return self.values[~numpy.isnan(self.values)]
+
+  def GetStats(self):
+    """Gets latency stats.
+
+    The max and min are based on absolute values (otherwise, we could report
+    that -0.1 is greater than -0.2, which is misleading), but are signed so
+    users can tell if the signal was ahead or behind.
+
+    Returns:
+      A 3-tuple with the max, min and mean latencies in seconds, which are NaN
+      if there are no valid latencies.
+    """
+    values = self.GetValidValues()
+    if not len(values):
+      return float('NaN'), float('NaN'), float('NaN')
+    abs_values = numpy.abs(values)
+    return (float(values[numpy.argmax(abs_values)]),
+            float(values[numpy.argmin(abs_values)]),
+            float(numpy.mean(values)))
+
+  def GetPercentiles(self, percentiles=DEFAULT_PERCENTILES):
+    """Calculates percentiles of the absolute latencies.
+
+    Args:
+      percentiles: (sequence of number) the percentiles to calculate.
+
+    Returns:
+      A list of the form [(<percentile>, abs(<value>)), ...] for each of
+      the percentiles requested, with NaN values if there are no valid
+      latencies.
+    """
+    values = self.GetValidValues()
+    if not len(values):
+      return [(percentile, float('NaN')) for percentile in percentiles]
+    return list(zip(percentiles,
+                    numpy.percentile(numpy.abs(values), percentiles).tolist()))
@@ -0,0 +1,90 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the latency_series module."""
+
+import json
+import math
+import pickle
+import unittest
+
+import numpy
+
+from audio_sync import latency_series
+
+NAN = float('NaN')
+
+
+class LatencySeriesTest(unittest.TestCase):
+  """Tests for the LatencySeries class."""
+
+  def setUp(self):
+    self._pairs = [(0.5, 0.01), (1.5, NAN), (2.5, -0.03), (3.5, 0.02)]
+    self._series = latency_series.LatencySeries.FromPairs(self._pairs)
+
+  def testBehavesLikeListOfTuples(self):
+    self.assertEqual(4, len(self._series))
+    self.assertEqual((0.5, 0.01), self._series[0])
+    self.assertEqual((3.5, 0.02), self._series[-1])
+    self.assertEqual([(2.5, -0.03), (3.5, 0.02)], self._series[2:])
+    self.assertEqual([0.5, 1.5, 2.5, 3.5], [time for time, _ in self._series])
+    self.assertTrue(self._series)
+    self.assertFalse(latency_series.LatencySeries())
+    self.assertEqual([], latency_series.LatencySeries())
+    self.assertNotEqual([(0.5, 0.01)], self._series)
+    self.assertEqual(json.dumps(self._pairs), json.dumps(list(self._series)))
+    self.assertEqual((4, 2), numpy.array(self._series).shape)
+
+  def testArray(self):
+    array = numpy.asarray(self._series, dtype=numpy.float32)
+    self.assertEqual(numpy.float32, array.dtype)
+    self.assertEqual([0.5, 1.5, 2.5, 3.5], array[:, 0].tolist())
+    with self.assertRaises(ValueError):
+      self._series.__array__(copy=False)
+
+  def testPickle(self):
+    series = pickle.loads(pickle.dumps(self._series))
+    self.assertEqual(self._series.times.tolist(), series.times.tolist())
+
+  def testConcatenate(self):
+    series = latency_series.LatencySeries.Concatenate(
+        [self._series[:1], latency_series.LatencySeries(), self._series[1:]])
+    self.assertEqual(self._series.times.tolist(), series.times.tolist())
+    self.assertEqual(0, len(latency_series.LatencySeries.Concatenate([])))
+
+  def testInvalidLengths(self):
+    with self.assertRaises(ValueError):
+      latency_series.LatencySeries([0, 1], [0])
+
+  def testStatsIgnoreInvalidWindows(self):
+    self.assertEqual((-0.03, 0.01, 0.0), tuple(
+        round(value, 6) for value in self._series.GetStats()))
+    self.assertTrue(all(math.isnan(value) for value in
+                        latency_series.LatencySeries.FromPairs(
+                            [(0, NAN)]).GetStats()))
+
+  def testPercentiles(self):
+    percentiles = self._series.GetPercentiles((0, 50, 100))
+    self.assertEqual([0, 50, 100],
+                     [percentile for percentile, _ in percentiles])
+    for expected, (_, value) in zip([0.01, 0.02, 0.03], percentiles):
+      self.assertAlmostEqual(expected, value)
+
+    percentiles = latency_series.LatencySeries().GetPercentiles((10, 90))
+    self.assertEqual([10, 90], [percentile for percentile, _ in percentiles])
+    self.assertTrue(all(math.isnan(value) for _, value in percentiles))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,224 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Constant-memory summary of latencies, with approximate percentiles.
+
+LatencySeries.GetPercentiles() sorts every latency, so the latencies of a
+multi-day run or of a stream would all have to be kept. LatencySummary
+instead counts the latencies in buckets of exponentially growing width (as
+in DDSketch), and keeps the count, sum, max and min exactly:
+  - The absolute latencies in (gamma^(i-1), gamma^i] fall in bucket i, where
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy), and those
+    below MIN_LATENCY_SECS in a bucket of their own, estimated as 0.
+  - A percentile is estimated from the bucket of the latency of nearest
+    rank, and is within relative_accuracy of it (or MIN_LATENCY_SECS for the
+    smallest latencies). The 0th and 100th percentiles are exact.
+  - The number of buckets only grows with the range of the latencies, e.g.
+    about 800 buckets from MIN_LATENCY_SECS to 10 seconds with the
+    DEFAULT_RELATIVE_ACCURACY, however many latencies are added.
+  - Summaries merge by adding their counts, so the summaries of chunks,
+    channels or runs analyzed apart give the same percentiles as a single
+    summary of all their latencies. ToDict() and FromDict() let summaries be
+    stored as JSON and merged later.
+"""
+from __future__ import division
+
+import math
+
+import numpy
+
+from audio_sync import latency_series
+
+# Relative error of the percentiles by default
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Absolute latencies below this are counted as 0 (a sample at 192 kHz is
+# about 5.2e-6 secs).
+MIN_LATENCY_SECS = 1e-6
+
+
+class LatencySummary(object):
+  """Stats and approximate percentiles of latencies, in constant memory."""
+
+  def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Creates an empty summary.
+
+    Args:
+      relative_accuracy: (float) relative error of the percentiles, in
+        (0, 1).
+
+    Raises:
+      ValueError: if relative_accuracy is not in (0, 1).
+    """
+    if not 0 < relative_accuracy < 1:
+      raise ValueError('The relative accuracy must be in (0, 1), not %r.' %
+                       relative_accuracy)
+    self.relative_accuracy = relative_accuracy
+    self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self._log_gamma = math.log(self._gamma)
+    self.num_latencies = 0
+    self.num_valid_latencies = 0
+    self._sum_latencies = 0.0
+    self._max_latency = float('NaN')
+    self._min_latency = float('NaN')
+    self._num_zeros = 0
+    # Number of absolute latencies in each bucket, by index
+    self._buckets = {}
+
+  def Add(self, latencies):
+    """Adds latencies to the summary.
+
+    Args:
+      latencies: (LatencySeries or list of 2-tuple) the latencies.
+    """
+    latencies = latency_series.LatencySeries.FromPairs(latencies)
+    self.num_latencies += len(latencies)
+    values = latencies.GetValidValues()
+    if not len(values):
+      return
+    self.num_valid_latencies += len(values)
+    self._sum_latencies += float(numpy.sum(values))
+    max_latency, min_latency, _ = latencies.GetStats()
+    self._UpdateMaxMin(max_latency, min_latency)
+
+    abs_values = numpy.abs(values)
+    is_zero = abs_values < MIN_LATENCY_SECS
+    self._num_zeros += int(numpy.count_nonzero(is_zero))
+    indexes = numpy.ceil(
+        numpy.log(abs_values[~is_zero]) / self._log_gamma).astype(numpy.int64)
+    for index, count in zip(*numpy.unique(indexes, return_counts=True)):
+      index = int(index)
+      self._buckets[index] = self._buckets.get(index, 0) + int(count)
+
+  def _UpdateMaxMin(self, max_latency, min_latency):
+    # Like in LatencySeries.GetStats(), the first of equal values is kept.
+    if not abs(max_latency) <= abs(self._max_latency):
+      self._max_latency = max_latency
+    if not abs(min_latency) >= abs(self._min_latency):
+      self._min_latency = min_latency
+
+  def Merge(self, other):
+    """Adds the latencies of another summary to this one.
+
+    Args:
+      other: (LatencySummary) summary of latencies which come after the ones
+        of this summary.
+
+    Raises:
+      ValueError: if the summaries have different relative accuracies.
+    """
+    if other.relative_accuracy != self.relative_accuracy:
+      raise ValueError('Cannot merge summaries with relative accuracies %r '
+                       'and %r.' % (self.relative_accuracy,
+                                    other.relative_accuracy))
+    self.num_latencies += other.num_latencies
+    if not other.num_valid_latencies:
+      return
+    self.num_valid_latencies += other.num_valid_latencies
+    self._sum_latencies += other._sum_latencies
+    self._UpdateMaxMin(other._max_latency, other._min_latency)
+    self._num_zeros += other._num_zeros
+    for index, count in other._buckets.items():
+      self._buckets[index] = self._buckets.get(index, 0) + count
+
+  def GetStats(self):
+    """Gets the stats of the latencies, which are exact.
+
+    Returns:
+      The same 3-tuple as LatencySeries.GetStats().
+    """
+    mean_latency = float('NaN')
+    if self.num_valid_latencies:
+      mean_latency = self._sum_latencies / self.num_valid_latencies
+    return self._max_latency, self._min_latency, mean_latency
+
+  def GetPercentiles(self, percentiles=latency_series.DEFAULT_PERCENTILES):
+    """Estimates percentiles of the absolute latencies.
+
+    Args:
+      percentiles: (sequence of number) the percentiles to estimate.
+
+    Returns:
+      The same list as LatencySeries.GetPercentiles(), with values within
+      the relative accuracy of the latencies of nearest rank.
+    """
+    if not self.num_valid_latencies:
+      return [(percentile, float('NaN')) for percentile in percentiles]
+    max_abs_latency = abs(self._max_latency)
+    min_abs_latency = abs(self._min_latency)
+    last_rank = self.num_valid_latencies - 1
+    indexes = sorted(self._buckets)
+    counts = numpy.cumsum([self._num_zeros] +
+                          [self._buckets[index] for index in indexes])
+
+    results = []
+    for percentile in percentiles:
+      rank = int(math.floor(percentile / 100 * last_rank + 0.5))
+      if rank <= 0:
+        value = min_abs_latency
+      elif rank >= last_rank:
+        value = max_abs_latency
+      else:
+        bucket = int(numpy.searchsorted(counts, rank, side='right'))
+        if bucket:
+          value = (2 * self._gamma ** indexes[bucket - 1] /
+                   (self._gamma + 1))
+        else:
+          value = 0.0
+        value = min(max(value, min_abs_latency), max_abs_latency)
+      results.append((percentile, value))
+    return results
+
+  def ToDict(self):
+    """Gets the summary as a dict which can be serialized to JSON.
+
+    Returns:
+      (dict) the summary, which FromDict() restores.
+    """
+    return {
+        'relative_accuracy': self.relative_accuracy,
+        'latencies': self.num_latencies,
+        'valid_latencies': self.num_valid_latencies,
+        'sum_latencies': self._sum_latencies,
+        'max_latency': self._max_latency,
+        'min_latency': self._min_latency,
+        'zeros': self._num_zeros,
+        'buckets': sorted(self._buckets.items()),
+    }
+
+  @classmethod
+  def FromDict(cls, summary_dict):
+    """Restores a summary saved by ToDict().
+
+    Args:
+      summary_dict: (dict) the summary.
+
+    Returns:
+      (LatencySummary) the summary.
+
+    Raises:
+      ValueError: if the dict is not a valid summary.
+    """
+    try:
+      summary = cls(summary_dict['relative_accuracy'])
+      summary.num_latencies = int(summary_dict['latencies'])
+      summary.num_valid_latencies = int(summary_dict['valid_latencies'])
+      summary._sum_latencies = float(summary_dict['sum_latencies'])
+      summary._max_latency = float(summary_dict['max_latency'])
+      summary._min_latency = float(summary_dict['min_latency'])
+      summary._num_zeros = int(summary_dict['zeros'])
+      summary._buckets = dict((int(index), int(count))
+                              for index, count in summary_dict['buckets'])
+    except (KeyError, TypeError) as e:
+      raise ValueError('Invalid latency summary: %r' % e)
+    return summary
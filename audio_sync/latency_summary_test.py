@@ -0,0 +1,128 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the latency_summary module."""
+
+import json
+import math
+import unittest
+
+import numpy
+
+from audio_sync import latency_series
+from audio_sync import latency_summary
+
+NAN = float('NaN')
+
+
+def _NearestRankPercentiles(values, percentiles):
+  abs_values = numpy.sort(numpy.abs(values))
+  return [abs_values[int(math.floor(percentile / 100.0 *
+                                    (len(values) - 1) + 0.5))]
+          for percentile in percentiles]
+
+
+class LatencySummaryTest(unittest.TestCase):
+  """Tests for the LatencySummary class."""
+
+  def setUp(self):
+    random_state = numpy.random.RandomState(0)
+    values = random_state.normal(0.002, 0.01, 10000)
+    values[::100] = NAN
+    values[1::100] = 0.0
+    self._series = latency_series.LatencySeries(
+        numpy.arange(len(values)) * 0.5, values)
+
+  def testStats(self):
+    summary = latency_summary.LatencySummary()
+    summary.Add(self._series[:3000])
+    summary.Add(list(self._series[3000:]))
+    self.assertEqual(10000, summary.num_latencies)
+    self.assertEqual(9900, summary.num_valid_latencies)
+    expected_stats = self._series.GetStats()
+    self.assertEqual(expected_stats[:2], summary.GetStats()[:2])
+    self.assertAlmostEqual(expected_stats[2], summary.GetStats()[2])
+
+  def testPercentilesWithinRelativeAccuracy(self):
+    percentiles = (0, 1, 10, 25, 50, 75, 90, 99, 99.9, 100)
+    expected_values = _NearestRankPercentiles(
+        self._series.GetValidValues(), percentiles)
+    for relative_accuracy in (0.001, 0.01, 0.05):
+      summary = latency_summary.LatencySummary(relative_accuracy)
+      summary.Add(self._series)
+      results = summary.GetPercentiles(percentiles)
+      self.assertEqual(list(percentiles),
+                       [percentile for percentile, _ in results])
+      for expected, (_, value) in zip(expected_values, results):
+        self.assertLessEqual(abs(value - expected),
+                             relative_accuracy * expected + 1e-12)
+      self.assertEqual(expected_values[0], results[0][1])
+      self.assertEqual(expected_values[-1], results[-1][1])
+
+  def testZeroLatencies(self):
+    summary = latency_summary.LatencySummary()
+    summary.Add([(0, 0.0), (1, 1e-7), (2, 0.0), (3, -0.01)])
+    self.assertEqual([(0, 0.0), (50, 0.0), (100, 0.01)],
+                     summary.GetPercentiles((0, 50, 100)))
+
+  def testMergeMatchesSingleSummary(self):
+    single_summary = latency_summary.LatencySummary()
+    single_summary.Add(self._series)
+    merged_summary = latency_summary.LatencySummary()
+    for start in range(0, len(self._series), 999):
+      chunk_summary = latency_summary.LatencySummary()
+      chunk_summary.Add(self._series[start:start + 999])
+      merged_summary.Merge(chunk_summary)
+    merged_summary.Merge(latency_summary.LatencySummary())
+    self.assertEqual(single_summary.GetPercentiles(),
+                     merged_summary.GetPercentiles())
+    self.assertEqual(single_summary.GetStats()[:2],
+                     merged_summary.GetStats()[:2])
+    self.assertEqual(single_summary.num_latencies,
+                     merged_summary.num_latencies)
+
+    with self.assertRaises(ValueError):
+      merged_summary.Merge(latency_summary.LatencySummary(0.02))
+
+  def testToDictAndFromDict(self):
+    summary = latency_summary.LatencySummary()
+    summary.Add(self._series)
+    restored = latency_summary.LatencySummary.FromDict(
+        json.loads(json.dumps(summary.ToDict())))
+    self.assertEqual(summary.GetPercentiles(), restored.GetPercentiles())
+    self.assertEqual(summary.GetStats(), restored.GetStats())
+    self.assertEqual(summary.num_latencies, restored.num_latencies)
+    # Far fewer buckets than latencies are kept.
+    self.assertLess(len(summary.ToDict()['buckets']), 500)
+
+    with self.assertRaises(ValueError):
+      latency_summary.LatencySummary.FromDict({'relative_accuracy': 0.01})
+
+  def testEmpty(self):
+    summary = latency_summary.LatencySummary()
+    summary.Add([(0, NAN)])
+    self.assertEqual(1, summary.num_latencies)
+    self.assertTrue(all(math.isnan(value) for value in summary.GetStats()))
+    percentiles = summary.GetPercentiles((10, 90))
+    self.assertEqual([10, 90], [percentile for percentile, _ in percentiles])
+    self.assertTrue(all(math.isnan(value) for _, value in percentiles))
+
+  def testInvalidRelativeAccuracy(self):
+    for relative_accuracy in (0, 1, -0.1):
+      with self.assertRaises(ValueError):
+        latency_summary.LatencySummary(relative_accuracy)
+
+
+if __name__ == '__main__':
+  unittest.main()
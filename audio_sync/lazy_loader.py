@@ -0,0 +1,59 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Modules imported when they are first used.
+
+Importing numpy and the analysis modules takes longer than most runs of the
+CLI that only parse their arguments, or send the files to a server. The
+modules which are not needed on every code path are declared with
+
+  numpy = lazy_loader.LazyLoader('numpy', globals(), 'numpy')
+
+instead of 'import numpy', and only imported when one of their attributes
+is used. The global is then replaced by the module itself, so later uses
+cost nothing.
+"""
+
+import importlib
+import types
+
+
+class LazyLoader(types.ModuleType):
+  """Module imported when one of its attributes is first used."""
+
+  def __init__(self, local_name, parent_module_globals, name):
+    """Initializer.
+
+    Args:
+      local_name: (string) name of the global holding the module.
+      parent_module_globals: (dict) globals() of the module holding it.
+      name: (string) full name of the module to import.
+    """
+    self._local_name = local_name
+    self._parent_module_globals = parent_module_globals
+    super(LazyLoader, self).__init__(name)
+
+  def _Load(self):
+    """Imports the module, and replaces the global holding it."""
+    module = importlib.import_module(self.__name__)
+    self._parent_module_globals[self._local_name] = module
+    # Later uses through this object don't need to go through __getattr__.
+    self.__dict__.update(module.__dict__)
+    return module
+
+  def __getattr__(self, name):
+    return getattr(self._Load(), name)
+
+  def __dir__(self):
+    return dir(self._Load())
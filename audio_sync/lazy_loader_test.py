@@ -0,0 +1,66 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the lazy_loader module."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from audio_sync import lazy_loader
+
+# Script using the analysis modules as attributes of the package, printing
+# whether they were imported before
+_PACKAGE_ATTRIBUTES_SCRIPT = '''
+import sys
+import audio_sync
+print('audio_sync.analyzer' in sys.modules)
+settings = audio_sync.analyzer.AnalysisSettings(0.3, 0.002, 0.3, 0.05, 0.005)
+assert settings == audio_sync.AnalysisSettings(0.3, 0.002, 0.3, 0.05, 0.005)
+assert callable(audio_sync.wave_reader.OpenWaveReader)
+assert callable(audio_sync.cache.GetPulseIndexName)
+from audio_sync import analyzer
+print(analyzer is sys.modules['audio_sync.analyzer'])
+'''
+
+
+class LazyLoaderTest(unittest.TestCase):
+  """Tests for the LazyLoader class."""
+
+  def testImportedWhenUsed(self):
+    module_globals = {}
+    module_globals['colorsys'] = lazy_loader.LazyLoader(
+        'colorsys', module_globals, 'colorsys')
+    sys.modules.pop('colorsys', None)
+    proxy = module_globals['colorsys']
+    self.assertNotIn('colorsys', sys.modules)
+
+    self.assertEqual((0.0, 0.0, 1.0), proxy.hsv_to_rgb(2 / 3.0, 1.0, 1.0))
+    self.assertIs(sys.modules['colorsys'], module_globals['colorsys'])
+    # The attributes are available without going through the module again.
+    self.assertIs(sys.modules['colorsys'].rgb_to_hsv, proxy.rgb_to_hsv)
+
+  def testPackageAttributes(self):
+    """Checks the analysis modules are attributes of the package."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', _PACKAGE_ATTRIBUTES_SCRIPT], env=env)
+    self.assertEqual(['False', 'True'], output.decode('utf-8').split())
+
+
+if __name__ == '__main__':
+  unittest.main()
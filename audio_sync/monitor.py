@@ -0,0 +1,415 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Live monitoring of the sync of several capture streams at once.
+
+A Monitor reads headerless PCM streams (see pcm_stream) concurrently in an
+asyncio event loop, and analyzes each of them with its own
+analyzer.StreamingAnalyzer as blocks arrive. The decoding and analysis of
+the blocks run in an executor, so that the event loop keeps reading the
+other streams meanwhile.
+
+The results of each stream go through an AlertTracker, which turns them into
+events with hysteresis:
+  - EVENT_LATENCY_ALERT: raise_windows consecutive valid windows have a
+    latency of at least latency_threshold (in absolute value).
+  - EVENT_LATENCY_CLEARED: while the alert is raised, clear_windows
+    consecutive valid windows have a latency below clear_latency_threshold.
+  - EVENT_DROPOUT: a dropout is reported while no dropout alert is raised.
+  - EVENT_DROPOUT_CLEARED: clear_windows consecutive valid windows follow
+    the last dropout.
+
+Each event carries its alert delay: the wall time from the arrival of the
+block holding the audio where the condition started, to the event. It
+includes the time spent waiting for the executor, the analysis of the
+windows, and the windows the hysteresis waits for. Dropouts are only
+reported once the actual signal is back, so their delay includes the
+duration of the dropout.
+
+This module needs Python 3.7 or later.
+"""
+
+import asyncio
+import bisect
+import collections
+import math
+import time
+
+from audio_sync import analyzer
+from audio_sync import pcm_stream
+from audio_sync import wave_reader
+
+EVENT_LATENCY_ALERT = 'latency_alert'
+EVENT_LATENCY_CLEARED = 'latency_cleared'
+EVENT_DROPOUT = 'dropout'
+EVENT_DROPOUT_CLEARED = 'dropout_cleared'
+EVENTS = (EVENT_LATENCY_ALERT, EVENT_LATENCY_CLEARED, EVENT_DROPOUT,
+          EVENT_DROPOUT_CLEARED)
+
+# Number of block arrival times kept per stream to measure the alert delays.
+# Events about audio older than these are given the delay from the oldest.
+MAX_TRACKED_BLOCKS = 4096
+
+# Thresholds and number of windows of the alerts, see the module doc comment
+AlertSettings = collections.namedtuple(
+    'AlertSettings', ['latency_threshold', 'clear_latency_threshold',
+                      'raise_windows', 'clear_windows'])
+
+DEFAULT_ALERT_SETTINGS = AlertSettings(
+    latency_threshold=0.001,
+    clear_latency_threshold=0.0005,
+    raise_windows=2,
+    clear_windows=5)
+
+# Event of a monitored stream. |value| is the latency of the window which
+# raised or cleared a latency alert, the (start, end) of a dropout, or None.
+Event = collections.namedtuple(
+    'Event', ['stream', 'kind', 'time_secs', 'value', 'alert_delay_secs'])
+
+
+class AlertTracker(object):
+  """Turns the results of the analysis of a stream into events."""
+
+  def __init__(self, alert_settings=DEFAULT_ALERT_SETTINGS):
+    """Initializer.
+
+    Args:
+      alert_settings: (AlertSettings) thresholds and number of windows of
+        the alerts.
+    """
+    self._alert_settings = alert_settings
+    self.latency_alert = False
+    self.dropout_alert = False
+    # Time and length of the run of windows which may change the latency
+    # alert, and of the run of valid windows since the last dropout.
+    self._latency_run_start = None
+    self._latency_run_length = 0
+    self._valid_run_start = None
+    self._valid_run_length = 0
+
+  def Update(self, latencies, dropouts):
+    """Updates the alerts with new results.
+
+    Args:
+      latencies: (list of 2-tuple) latencies which come after the ones
+        already given, as returned by analyzer.StreamingAnalyzer.Feed().
+      dropouts: (list of 2-tuple) dropouts which come after the ones already
+        given.
+
+    Returns:
+      (list of 3-tuple) the (<kind>, <time>, <value>) of the events raised,
+      where <time> is when the condition of the event started, see Event.
+    """
+    events = []
+    for time_secs, latency in latencies:
+      if math.isnan(latency):
+        self._valid_run_length = 0
+        continue
+      self._UpdateLatencyAlert(time_secs, latency, events)
+      if self.dropout_alert:
+        if not self._valid_run_length:
+          self._valid_run_start = time_secs
+        self._valid_run_length += 1
+        if self._valid_run_length >= self._alert_settings.clear_windows:
+          self.dropout_alert = False
+          events.append((EVENT_DROPOUT_CLEARED, self._valid_run_start, None))
+
+    for dropout in dropouts:
+      if not self.dropout_alert:
+        self.dropout_alert = True
+        events.append((EVENT_DROPOUT, dropout[0], tuple(dropout)))
+      # The windows after the dropout may have been given already, but they
+      # are only counted from now on, which can only delay the clearing.
+      self._valid_run_length = 0
+    return events
+
+  def _UpdateLatencyAlert(self, time_secs, latency, events):
+    """Updates the latency alert with the latency of a valid window."""
+    alert_settings = self._alert_settings
+    if self.latency_alert:
+      in_run = abs(latency) < alert_settings.clear_latency_threshold
+      windows = alert_settings.clear_windows
+      kind = EVENT_LATENCY_CLEARED
+    else:
+      in_run = abs(latency) >= alert_settings.latency_threshold
+      windows = alert_settings.raise_windows
+      kind = EVENT_LATENCY_ALERT
+    if not in_run:
+      self._latency_run_length = 0
+      return
+    if not self._latency_run_length:
+      self._latency_run_start = time_secs
+    self._latency_run_length += 1
+    if self._latency_run_length >= windows:
+      self.latency_alert = not self.latency_alert
+      self._latency_run_length = 0
+      events.append((kind, self._latency_run_start, latency))
+
+
+class _MonitoredStream(object):
+  """State of the monitoring of one stream."""
+
+  def __init__(self, name, reader, stream_format, ref_channel, act_channel,
+               settings, alert_settings):
+    self.name = name
+    self.reader = reader
+    self.stream_format = stream_format
+    self._ref_channel = ref_channel
+    self._act_channel = act_channel
+    self._analyzer = analyzer.StreamingAnalyzer(stream_format.samp_rate,
+                                                settings)
+    self._sample_scaler = wave_reader.GetSampleScaler(
+        stream_format.sample_width, stream_format.is_float)
+    self.tracker = AlertTracker(alert_settings)
+    # End (in secs from the start of the stream) and arrival (in secs of the
+    # monitor clock) of the last blocks read.
+    self._block_ends = []
+    self._block_arrivals = []
+    self.num_frames = 0
+    self.num_latencies = 0
+    self.num_dropouts = 0
+    self.num_events = dict((kind, 0) for kind in EVENTS)
+    self._num_delays = 0
+    self._sum_delays = 0.0
+    self._max_delay = float('NaN')
+
+  def RecordArrival(self, num_frames, arrival_time):
+    """Records that |num_frames| frames arrived at |arrival_time|."""
+    self.num_frames += num_frames
+    self._block_ends.append(self.num_frames / self.stream_format.samp_rate)
+    self._block_arrivals.append(arrival_time)
+    if len(self._block_ends) > MAX_TRACKED_BLOCKS:
+      # Dropped in halves so that the lists are not shifted every block.
+      del self._block_ends[:MAX_TRACKED_BLOCKS // 2]
+      del self._block_arrivals[:MAX_TRACKED_BLOCKS // 2]
+
+  def Analyze(self, data):
+    """Analyzes a block of interleaved samples.
+
+    The analysis is flushed if |data| is None. Runs in the executor.
+
+    Returns:
+      A 2-tuple with the latencies and dropouts completed by the block.
+    """
+    if data is None:
+      return self._analyzer.Flush()
+    frames = pcm_stream.DecodeFrames(
+        data, len(data) // (self.stream_format.num_channels *
+                            self.stream_format.sample_width),
+        self.stream_format)
+    return self._analyzer.Feed(
+        wave_reader.Pcm2Float(frames[:, self._ref_channel],
+                              self._sample_scaler),
+        wave_reader.Pcm2Float(frames[:, self._act_channel],
+                              self._sample_scaler))
+
+  def GetAlertDelay(self, time_secs, now):
+    """Gets the time from the arrival of the audio at |time_secs| to |now|."""
+    index = bisect.bisect_left(self._block_ends, time_secs)
+    index = min(index, len(self._block_arrivals) - 1)
+    delay = now - self._block_arrivals[index]
+    self._num_delays += 1
+    self._sum_delays += delay
+    if not delay <= self._max_delay:
+      self._max_delay = delay
+    return delay
+
+  def GetReport(self):
+    """Gets the counters, alert delays, drift and percentiles of the stream."""
+    mean_delay = float('NaN')
+    if self._num_delays:
+      mean_delay = self._sum_delays / self._num_delays
+    return {
+        'frames': self.num_frames,
+        'latencies': self.num_latencies,
+        'dropouts': self.num_dropouts,
+        'events': dict(self.num_events),
+        'latency_alert': self.tracker.latency_alert,
+        'dropout_alert': self.tracker.dropout_alert,
+        'alert_delay_secs': {'mean': mean_delay, 'max': self._max_delay},
+        'drift_ppm': self._analyzer.drift_ppm,
+        'percentiles': self._analyzer.latency_summary.GetPercentiles(),
+    }
+
+
+class Monitor(object):
+  """Monitors the sync of several streams concurrently."""
+
+  def __init__(self, settings, callback, alert_settings=DEFAULT_ALERT_SETTINGS,
+               executor=None, frames_per_block=pcm_stream.FRAMES_PER_BLOCK,
+               clock=time.monotonic):
+    """Initializer.
+
+    Args:
+      settings: (AnalysisSettings) analysis settings of every stream.
+      callback: (callable) called in the event loop with each Event.
+      alert_settings: (AlertSettings) thresholds and number of windows of
+        the alerts.
+      executor: (concurrent.futures.Executor) executor analyzing the blocks,
+        or None for the default executor of the event loop.
+      frames_per_block: (int) number of frames read at a time.
+      clock: (callable) returns the current time in seconds, to measure the
+        alert delays.
+    """
+    self._settings = settings
+    self._callback = callback
+    self._alert_settings = alert_settings
+    self._executor = executor
+    self._frames_per_block = frames_per_block
+    self._clock = clock
+    self._streams = collections.OrderedDict()
+
+  def AddStream(self, name, reader, stream_format, ref_channel=0,
+                act_channel=1):
+    """Adds a stream to monitor.
+
+    Args:
+      name: (string) name of the stream in the events and report.
+      reader: (asyncio.StreamReader) the headerless PCM stream, see
+        OpenPipe().
+      stream_format: (pcm_stream.StreamFormat) format of the samples.
+      ref_channel: (int) index of the reference channel.
+      act_channel: (int) index of the actual channel.
+
+    Raises:
+      ValueError: if a stream of the same name was already added.
+      InputSignalException: if any of the channels is not in the stream.
+    """
+    if name in self._streams:
+      raise ValueError('Stream %s was already added.' % name)
+    for channel in (ref_channel, act_channel):
+      if not 0 <= channel < stream_format.num_channels:
+        raise analyzer.InputSignalException(
+            'Channel %d is not in stream %s, which has %d channels.' % (
+                channel, name, stream_format.num_channels))
+    self._streams[name] = _MonitoredStream(
+        name, reader, stream_format, ref_channel, act_channel, self._settings,
+        self._alert_settings)
+
+  async def Run(self):
+    """Monitors the streams until all of them end.
+
+    Raises:
+      Any error reading or analyzing a stream, once the monitoring of the
+      other streams is cancelled.
+    """
+    tasks = [asyncio.ensure_future(self._MonitorStream(stream))
+             for stream in self._streams.values()]
+    try:
+      await asyncio.gather(*tasks)
+    except BaseException:
+      for task in tasks:
+        task.cancel()
+      raise
+
+  async def _MonitorStream(self, stream):
+    """Reads and analyzes a stream until it ends."""
+    loop = asyncio.get_event_loop()
+    frame_width = (stream.stream_format.num_channels *
+                   stream.stream_format.sample_width)
+    block_size = self._frames_per_block * frame_width
+    ended = False
+    while not ended:
+      try:
+        data = await stream.reader.readexactly(block_size)
+      except asyncio.IncompleteReadError as e:
+        # Trailing bytes that don't make a frame are ignored.
+        data = e.partial[:len(e.partial) - len(e.partial) % frame_width]
+        ended = True
+      if data:
+        stream.RecordArrival(len(data) // frame_width, self._clock())
+        latencies, dropouts = await loop.run_in_executor(
+            self._executor, stream.Analyze, data)
+        self._HandleResults(stream, latencies, dropouts)
+    latencies, dropouts = await loop.run_in_executor(
+        self._executor, stream.Analyze, None)
+    self._HandleResults(stream, latencies, dropouts)
+
+  def _HandleResults(self, stream, latencies, dropouts):
+    """Updates the alerts of a stream.
+
+    The callback is called with the events raised.
+    """
+    stream.num_latencies += len(latencies)
+    stream.num_dropouts += len(dropouts)
+    events = stream.tracker.Update(latencies, dropouts)
+    if not events:
+      return
+    now = self._clock()
+    for kind, time_secs, value in events:
+      stream.num_events[kind] += 1
+      self._callback(Event(stream.name, kind, time_secs, value,
+                           stream.GetAlertDelay(time_secs, now)))
+
+  def GetReport(self):
+    """Gets the counters and alert delays of each stream.
+
+    Returns:
+      (dict) for each stream name, the number of frames read, latencies,
+      dropouts and events of each kind, whether the alerts are raised, the
+      mean and max alert delays in seconds, and the drift of the reference
+      in ppm if the pulse search tracks the pulses (see
+      analyzer.StreamingAnalyzer.drift_ppm), and the estimated percentiles
+      of the absolute latencies (see LatencySummary.GetPercentiles()).
+    """
+    return dict((name, stream.GetReport())
+                for name, stream in self._streams.items())
+
+
+async def OpenPipe(path):
+  """Opens a pipe, FIFO or character device for reading in the event loop.
+
+  Args:
+    path: (string) path to open.
+
+  Returns:
+    (asyncio.StreamReader) the reader of the pipe.
+  """
+  loop = asyncio.get_event_loop()
+  # Opening a FIFO blocks until it has a writer.
+  pipe = await loop.run_in_executor(None, open, path, 'rb', 0)
+  reader = asyncio.StreamReader()
+  await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                               pipe)
+  return reader
+
+
+def MonitorPipes(pipes, stream_format, settings, callback,
+                 alert_settings=DEFAULT_ALERT_SETTINGS, ref_channel=0,
+                 act_channel=1):
+  """Monitors pipes until all of them end, in a new event loop.
+
+  Args:
+    pipes: (list of 2-tuple) the (<name>, <path>) of each pipe.
+    stream_format: (pcm_stream.StreamFormat) format of the samples of every
+      pipe.
+    settings: (AnalysisSettings) analysis settings of every pipe.
+    callback: (callable) called with each Event.
+    alert_settings: (AlertSettings) thresholds and number of windows of
+      the alerts.
+    ref_channel: (int) index of the reference channel of every pipe.
+    act_channel: (int) index of the actual channel of every pipe.
+
+  Returns:
+    (dict) the report of the monitor, see Monitor.GetReport().
+  """
+  async def _MonitorPipes():
+    monitor = Monitor(settings, callback, alert_settings)
+    for name, path in pipes:
+      monitor.AddStream(name, await OpenPipe(path), stream_format,
+                        ref_channel, act_channel)
+    await monitor.Run()
+    return monitor.GetReport()
+
+  return asyncio.run(_MonitorPipes())
@@ -0,0 +1,145 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the monitor module, which are skipped in Python 2."""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import latency_series
+from audio_sync import pcm_stream
+
+if sys.version_info[0] >= 3:
+  import asyncio  # pylint: disable=g-import-not-at-top
+  from audio_sync import monitor  # pylint: disable=g-import-not-at-top
+else:
+  monitor = None
+
+SETTINGS = analyzer.AnalysisSettings(0.1, 0.002, 0.5, 0.05, 0.005)
+GENERATOR_SETTINGS = generator.DEFAULT_GENERATOR_SETTINGS._replace(
+    samp_rate=8000, num_channels=2)
+# Size of the header written by the wave module
+WAVE_HEADER_SIZE = 44
+NAN = float('NaN')
+
+
+@unittest.skipIf(monitor is None, 'The monitor module needs Python 3.')
+class AlertTrackerTest(unittest.TestCase):
+  """Tests for the AlertTracker class."""
+
+  def setUp(self):
+    self._tracker = monitor.AlertTracker(monitor.AlertSettings(
+        latency_threshold=0.01, clear_latency_threshold=0.005,
+        raise_windows=2, clear_windows=2))
+    self._num_windows = 0
+
+  def _Update(self, values, dropouts=()):
+    """Updates the tracker with windows at 0, 1, 2... secs."""
+    times = range(self._num_windows, self._num_windows + len(values))
+    self._num_windows += len(values)
+    return self._tracker.Update(list(zip(times, values)), list(dropouts))
+
+  def testLatencyHysteresis(self):
+    # A single window above the threshold doesn't raise the alert, and NaN
+    # windows don't break the run.
+    self.assertEqual([], self._Update([0.0, 0.02, 0.0, 0.02]))
+    self.assertEqual([(monitor.EVENT_LATENCY_ALERT, 3, -0.03)],
+                     self._Update([NAN, -0.03]))
+    self.assertTrue(self._tracker.latency_alert)
+    # Latencies between the thresholds keep the alert raised.
+    self.assertEqual([], self._Update([0.004, 0.008, 0.004]))
+    self.assertEqual([(monitor.EVENT_LATENCY_CLEARED, 10, 0.0)],
+                     self._Update([0.02, 0.0, 0.0, 0.0]))
+    self.assertFalse(self._tracker.latency_alert)
+
+  def testDropoutHysteresis(self):
+    self.assertEqual([(monitor.EVENT_DROPOUT, 1.0, (1.0, 1.5))],
+                     self._Update([0.0, NAN], [(1.0, 1.5)]))
+    # Dropouts while the alert is raised only delay its clearing.
+    self.assertEqual([], self._Update([0.0, NAN], [(3.0, 3.5)]))
+    self.assertEqual([(monitor.EVENT_DROPOUT_CLEARED, 4, None)],
+                     self._Update([0.0, 0.0]))
+    self.assertFalse(self._tracker.dropout_alert)
+
+
+@unittest.skipIf(monitor is None, 'The monitor module needs Python 3.')
+class MonitorTest(unittest.TestCase):
+  """Tests for the Monitor class."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._data = {}
+    for name, impairments in (
+        ('in_sync', generator.NO_IMPAIRMENTS),
+        ('late', generator.Impairments(latency_secs=0.005,
+                                       dropouts=[(2.0, 2.5)]))):
+      path = os.path.join(self._temp_dir, name + '.wav')
+      generator.WriteTestAudio(path, 5, GENERATOR_SETTINGS,
+                               [generator.NO_IMPAIRMENTS, impairments])
+      with open(path, 'rb') as wave_file:
+        self._data[name] = wave_file.read()[WAVE_HEADER_SIZE:]
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def testMonitorStreams(self):
+    events = []
+    stream_format = pcm_stream.GetRawFormat('S16_LE', 8000, 2)
+
+    stream_monitor = monitor.Monitor(SETTINGS, events.append,
+                                     frames_per_block=1000)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+      for name, data in sorted(self._data.items()):
+        reader = asyncio.StreamReader()
+        # The last frame is incomplete.
+        reader.feed_data(data + b'\x00')
+        reader.feed_eof()
+        stream_monitor.AddStream(name, reader, stream_format)
+      with self.assertRaises(ValueError):
+        stream_monitor.AddStream('late', reader, stream_format)
+      with self.assertRaises(analyzer.InputSignalException):
+        stream_monitor.AddStream('other', reader, stream_format, 0, 2)
+      loop.run_until_complete(stream_monitor.Run())
+    finally:
+      asyncio.set_event_loop(None)
+      loop.close()
+
+    report = stream_monitor.GetReport()
+    self.assertEqual(set(['late']), set(event.stream for event in events))
+    self.assertEqual([monitor.EVENT_LATENCY_ALERT, monitor.EVENT_DROPOUT,
+                      monitor.EVENT_DROPOUT_CLEARED],
+                     [event.kind for event in events])
+    self.assertTrue(all(event.alert_delay_secs >= 0 for event in events))
+
+    self.assertEqual(40000, report['in_sync']['frames'])
+    self.assertEqual(0, sum(report['in_sync']['events'].values()))
+    self.assertEqual(report['in_sync']['latencies'],
+                     report['late']['latencies'])
+    self.assertEqual(1, report['late']['dropouts'])
+    self.assertTrue(report['late']['latency_alert'])
+    self.assertGreaterEqual(report['late']['alert_delay_secs']['max'], 0)
+    self.assertIsNone(report['late']['drift_ppm'])
+    self.assertEqual(len(latency_series.DEFAULT_PERCENTILES),
+                     len(report['late']['percentiles']))
+
+
+if __name__ == '__main__':
+  unittest.main()
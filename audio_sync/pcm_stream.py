@@ -0,0 +1,226 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Analysis of audio streamed through a pipe, like the output of arecord.
+
+Unlike the readers of wave_reader, the stream is read sequentially without
+seeking, so it can be standard input or a FIFO filled while recording. It
+either starts with a WAV header (the data size of which is ignored, as it is
+unknown when recording to a pipe), or is headerless PCM whose format is
+given by the caller.
+
+The stream is read into a block of fixed size, the reference and actual
+channels are de-interleaved from it, and they are fed to an
+analyzer.StreamingAnalyzer, which only keeps the samples it still needs. So
+memory doesn't grow with the duration of the capture.
+"""
+
+import collections
+import struct
+
+from audio_sync import analyzer
+from audio_sync import wave_reader
+
+# Number of frames read from the stream at a time
+FRAMES_PER_BLOCK = 4096
+# Size of the reads used to skip the chunks of the WAV header
+_SKIP_SIZE = 65536
+
+# Format of the samples of a stream
+StreamFormat = collections.namedtuple(
+    'StreamFormat', ['samp_rate', 'num_channels', 'sample_width', 'is_float'])
+
+# Sample formats of headerless PCM, named like the formats of arecord, with
+# the width of the samples in bytes and whether they are IEEE floats
+RAW_FORMATS = collections.OrderedDict([
+    ('S16_LE', (2, False)),
+    ('S24_3LE', (3, False)),
+    ('S32_LE', (4, False)),
+    ('FLOAT_LE', (4, True)),
+    ('FLOAT64_LE', (8, True)),
+])
+
+
+def GetRawFormat(raw_format, samp_rate, num_channels):
+  """Gets the format of a headerless PCM stream.
+
+  Args:
+    raw_format: (string) one of RAW_FORMATS.
+    samp_rate: (int) the sampling frequency in Hz.
+    num_channels: (int) number of interleaved channels.
+
+  Returns:
+    (StreamFormat) the format.
+
+  Raises:
+    ValueError: if the format is not one of RAW_FORMATS.
+  """
+  if raw_format not in RAW_FORMATS:
+    raise ValueError('Unknown format %s, expected one of %s.' % (
+        raw_format, ', '.join(RAW_FORMATS)))
+  sample_width, is_float = RAW_FORMATS[raw_format]
+  return StreamFormat(samp_rate, num_channels, sample_width, is_float)
+
+
+def _ReadExactly(stream, size):
+  """Reads |size| bytes, or less if the stream ends first."""
+  data = b''
+  while len(data) < size:
+    read_data = stream.read(size - len(data))
+    if not read_data:
+      break
+    data += read_data
+  return data
+
+
+def ReadWaveHeader(stream):
+  """Reads the WAV header at the start of a stream.
+
+  The stream is left at the first sample.
+
+  Args:
+    stream: (file) binary file object, which doesn't need to be seekable.
+
+  Returns:
+    (StreamFormat) the format of the samples.
+
+  Raises:
+    wave_reader.Error: if the header is not valid or the format is not
+      supported.
+  """
+  header = _ReadExactly(stream, 12)
+  if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+    raise wave_reader.Error('Not a RIFF/WAVE stream.')
+
+  fmt_chunk = None
+  while True:
+    chunk_header = _ReadExactly(stream, 8)
+    if len(chunk_header) < 8:
+      raise wave_reader.Error('No data chunk found.')
+    chunk_id = chunk_header[:4]
+    chunk_size = struct.unpack('<I', chunk_header[4:])[0]
+    if chunk_id == b'data':
+      break
+    # Chunks are word aligned.
+    padded_size = chunk_size + chunk_size % 2
+    if chunk_id == b'fmt ':
+      fmt_chunk = _ReadExactly(stream, padded_size)[:chunk_size]
+    else:
+      while padded_size:
+        skipped_size = len(_ReadExactly(stream, min(padded_size, _SKIP_SIZE)))
+        if not skipped_size:
+          break
+        padded_size -= skipped_size
+
+  if fmt_chunk is None:
+    raise wave_reader.Error('No fmt chunk found before the data chunk.')
+  num_channels, samp_rate, sample_width, is_float = (
+      wave_reader.ParseFmtChunk(fmt_chunk))
+  return StreamFormat(samp_rate, num_channels, sample_width, is_float)
+
+
+def IterFrames(stream, stream_format, frames_per_block=FRAMES_PER_BLOCK):
+  """Reads the frames of a stream a block at a time.
+
+  The blocks are read into the same buffer, so the arrays must not be used
+  once the next one is requested.
+
+  Args:
+    stream: (file) binary file object positioned at the first sample, which
+      must have a readinto() method.
+    stream_format: (StreamFormat) the format of the samples.
+    frames_per_block: (int) number of frames of each block.
+
+  Yields:
+    (numpy.ndarray) the samples of each block, with a column per channel.
+    Only the last one may have less than |frames_per_block| frames. Trailing
+    bytes that don't make a frame are ignored.
+  """
+  frame_width = stream_format.num_channels * stream_format.sample_width
+  block = bytearray(frames_per_block * frame_width)
+  block_view = memoryview(block)
+  num_bytes = 0
+  while True:
+    read_size = stream.readinto(block_view[num_bytes:])
+    if not read_size:
+      break
+    num_bytes += read_size
+    if num_bytes == len(block):
+      yield DecodeFrames(block, frames_per_block, stream_format)
+      num_bytes = 0
+  if num_bytes >= frame_width:
+    yield DecodeFrames(block, num_bytes // frame_width, stream_format)
+
+
+def DecodeFrames(block, num_frames, stream_format):
+  """Decodes the first frames of a block of interleaved samples.
+
+  Args:
+    block: (buffer) the packed samples.
+    num_frames: (int) number of frames to decode.
+    stream_format: (StreamFormat) the format of the samples.
+
+  Returns:
+    (numpy.ndarray) the samples, with a column per channel.
+  """
+  return wave_reader.DecodeSamples(
+      block, stream_format.sample_width, stream_format.is_float,
+      count=num_frames * stream_format.num_channels).reshape(
+          -1, stream_format.num_channels)
+
+
+def IterAnalyzeStream(stream, ref_channel, act_channel, settings,
+                      stream_format=None, frames_per_block=FRAMES_PER_BLOCK):
+  """Determines latencies and dropouts between two channels of a stream.
+
+  The stream is analyzed as it is read.
+
+  Args:
+    stream: (file) binary file object, which doesn't need to be seekable
+      but must have a readinto() method.
+    ref_channel: (int) index of the reference channel.
+    act_channel: (int) index of the actual channel.
+    settings: (AnalysisSettings) analysis settings.
+    stream_format: (StreamFormat) format of headerless PCM, or None if the
+      stream starts with a WAV header.
+    frames_per_block: (int) number of frames read at a time.
+
+  Yields:
+    A 2-tuple with the latencies and dropouts completed by each block, in
+    the format returned by analyzer.StreamingAnalyzer.Feed(). Blocks which
+    complete neither are skipped.
+
+  Raises:
+    wave_reader.Error: if the WAV header is not valid.
+    InputSignalException: if any of the channels is not in the stream.
+  """
+  if stream_format is None:
+    stream_format = ReadWaveHeader(stream)
+  for channel in (ref_channel, act_channel):
+    if not 0 <= channel < stream_format.num_channels:
+      raise analyzer.InputSignalException(
+          'Channel %d is not in the stream, which has %d channels.' % (
+              channel, stream_format.num_channels))
+
+  streaming_analyzer = analyzer.StreamingAnalyzer(stream_format.samp_rate,
+                                                  settings)
+  sample_scaler = wave_reader.GetSampleScaler(stream_format.sample_width,
+                                              stream_format.is_float)
+  for frames in IterFrames(stream, stream_format, frames_per_block):
+    latencies, dropouts = streaming_analyzer.Feed(
+        wave_reader.Pcm2Float(frames[:, ref_channel], sample_scaler),
+        wave_reader.Pcm2Float(frames[:, act_channel], sample_scaler))
+    if latencies or dropouts:
+      yield latencies, dropouts
+  yield streaming_analyzer.Flush()
@@ -0,0 +1,110 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the pcm_stream module."""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import latency_series
+from audio_sync import pcm_stream
+from audio_sync import wave_reader
+
+SETTINGS = analyzer.AnalysisSettings(0.1, 0.002, 0.5, 0.05, 0.005)
+GENERATOR_SETTINGS = generator.DEFAULT_GENERATOR_SETTINGS._replace(
+    samp_rate=8000, num_channels=2)
+# Size of the header written by the wave module
+WAVE_HEADER_SIZE = 44
+
+
+class PcmStreamTest(unittest.TestCase):
+  """Tests for the analysis of streamed audio."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._path = os.path.join(self._temp_dir, 'stream.wav')
+    generator.WriteTestAudio(
+        self._path, 10, GENERATOR_SETTINGS,
+        [generator.NO_IMPAIRMENTS,
+         generator.Impairments(latency_secs=0.005,
+                               dropouts=[(2.0, 2.5), (6.05, 6.2)])])
+    with open(self._path, 'rb') as wave_file:
+      self._data = wave_file.read()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _AssertSameAsFileAnalysis(self, results):
+    latencies = latency_series.LatencySeries.Concatenate(
+        [latency_series.LatencySeries.FromPairs(chunk_latencies)
+         for chunk_latencies, _ in results])
+    dropouts = [dropout for _, chunk_dropouts in results
+                for dropout in chunk_dropouts]
+    (expected_latencies, expected_dropouts), = (
+        audio_sync.AnalyzeMultichannelAudio(self._path, 0, [1], SETTINGS))
+    # repr() compares the NaN latencies too.
+    self.assertEqual(repr(list(expected_latencies)), repr(list(latencies)))
+    self.assertEqual(expected_dropouts, dropouts)
+    self.assertTrue(dropouts)
+
+  def testWaveStream(self):
+    self._AssertSameAsFileAnalysis(list(pcm_stream.IterAnalyzeStream(
+        io.BytesIO(self._data), 0, 1, SETTINGS)))
+
+  def testRawStream(self):
+    stream_format = pcm_stream.GetRawFormat('S16_LE', 8000, 2)
+    self._AssertSameAsFileAnalysis(list(pcm_stream.IterAnalyzeStream(
+        io.BytesIO(self._data[WAVE_HEADER_SIZE:]), 0, 1, SETTINGS,
+        stream_format=stream_format, frames_per_block=1000)))
+
+  def testReadWaveHeaderSkipsChunks(self):
+    # A LIST chunk of odd size is inserted before the data chunk, and the
+    # sizes are left as a recorder writing to a pipe does.
+    list_chunk = b'LIST' + struct.pack('<I', 3) + b'abc\x00'
+    stream = io.BytesIO(self._data[:36] + list_chunk + self._data[36:40] +
+                        b'\xff\xff\xff\xff' + b'\x01\x02')
+    self.assertEqual(pcm_stream.StreamFormat(8000, 2, 2, False),
+                     pcm_stream.ReadWaveHeader(stream))
+    self.assertEqual(b'\x01\x02', stream.read())
+
+  def testIterFrames(self):
+    stream_format = pcm_stream.GetRawFormat('S24_3LE', 8000, 2)
+    stream = io.BytesIO(b'\x01\x00\x00\xff\xff\xff' * 5 + b'\x00')
+    blocks = [frames.tolist() for frames in pcm_stream.IterFrames(
+        stream, stream_format, frames_per_block=2)]
+    self.assertEqual([[[1, -1]] * 2, [[1, -1]] * 2, [[1, -1]]], blocks)
+
+  def testInvalidStreams(self):
+    with self.assertRaises(wave_reader.Error):
+      list(pcm_stream.IterAnalyzeStream(io.BytesIO(b'RIFF\x00\x00'), 0, 1,
+                                        SETTINGS))
+    with self.assertRaises(wave_reader.Error):
+      list(pcm_stream.IterAnalyzeStream(io.BytesIO(self._data[:36]), 0, 1,
+                                        SETTINGS))
+    with self.assertRaises(analyzer.InputSignalException):
+      list(pcm_stream.IterAnalyzeStream(io.BytesIO(self._data), 0, 2,
+                                        SETTINGS))
+    with self.assertRaises(ValueError):
+      pcm_stream.GetRawFormat('U8', 8000, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,34 +18,19 @@ from __future__ import print_function
 
 import logging
 
+from audio_sync import interval_set
+
 
 CONDITION_NONE = '.'
 CONDITION_DROPOUT = 'o'
 CONDITION_NEGATIVE_LATENCY_EXCEEDED = '>'
 CONDITION_POSITIVE_LATENCY_EXCEEDED = '<'
 NUM_CONDITIONS = 3
-
-
-def _Intersects(range1, range2):
-  """Tells if two number ranges intersect.
-
-  Args:
-    range1: (tuple(num, num)) tuple representing a range. The
-      first number must be <= the second number.
-    range2: (tuple(num, num)) tuple representing a range. The
-      first number must be <= the second number.
-
-  Returns:
-    True if the ranges intersect False otherwise.
-
-  Raises:
-    ValueError: if the ranges are invalid.
-  """
-  if range1[0] > range1[1]:
-    raise ValueError('range1 is inverted.')
-  if range2[0] > range2[1]:
-    raise ValueError('range2 is inverted.')
-  return not (range1[1] <= range2[0] or range1[0] >= range2[1])
+# Conditions in the order they are stacked in the rows of the plot, from the
+# top one
+PLOTTED_CONDITIONS = (CONDITION_POSITIVE_LATENCY_EXCEEDED,
+                      CONDITION_NEGATIVE_LATENCY_EXCEEDED, CONDITION_DROPOUT,
+                      CONDITION_NONE)
 
 
 def GetConditionsInTimeframe(
@@ -54,7 +39,8 @@ def GetConditionsInTimeframe(
 
   Args:
     latencies: (list of 2-tuple) latencies measured during the timeframe.
-    dropouts: (list of 2-tuple) dropouts detected during the timeframe.
+    dropouts: (IntervalSet or list of 2-tuple) dropouts detected during the
+      timeframe.
     timeframe_secs: (float) duration of the timeframe.
     num_intervals: (int) number of intervals to split the timeframe.
     latency_threshold_secs: (float) Latencies greater than this threshold
@@ -64,11 +50,13 @@ def GetConditionsInTimeframe(
     (list of sets) a list of |num_intervals| sets specifying the
     conditions that occurred in each interval.
   """
+  if not isinstance(dropouts, interval_set.IntervalSet):
+    dropouts = interval_set.IntervalSet(dropouts)
   interval_secs = timeframe_secs / num_intervals
-  i = j = 0
+  i = 0
   t = 0.0
   timeline = []
-  for _ in xrange(num_intervals):
+  for _ in range(num_intervals):
     next_t = t + interval_secs
     conditions = set()
 
@@ -86,12 +74,8 @@ def GetConditionsInTimeframe(
       i += 1
 
     # Check dropouts.
-    while j < len(dropouts):
-      if _Intersects(dropouts[j], (t, next_t)):
-        conditions.add(CONDITION_DROPOUT)
-      if dropouts[j][1] >= next_t:
-        break
-      j += 1
+    if dropouts.Overlaps(t, next_t):
+      conditions.add(CONDITION_DROPOUT)
 
     if not conditions:
       conditions.add(CONDITION_NONE)
@@ -124,9 +108,11 @@ def GetPlotString(conditions_timeline, timeline_secs, num_ticks):
   if num_intervals % num_ticks != 0:
     raise ValueError('num_intervals (%d) mod num_ticks (%d) must be 0.' % (
         num_intervals, num_ticks))
-  # Conditions.
+  # Conditions, sorted as the iteration order of sets varies between runs.
   conditions_list = [
-      ' ' * (NUM_CONDITIONS - len(x)) + ''.join(x) for x in conditions_timeline
+      ' ' * (NUM_CONDITIONS - len(x)) +
+      ''.join(sorted(x, key=PLOTTED_CONDITIONS.index))
+      for x in conditions_timeline
   ]
   # Ticks.
   dots_per_tick = num_intervals // num_ticks
@@ -135,7 +121,7 @@ def GetPlotString(conditions_timeline, timeline_secs, num_ticks):
   # Times.
   tick_duration_secs = timeline_secs / num_ticks
   times = []
-  for i in xrange(1, num_ticks + 1):
+  for i in range(1, num_ticks + 1):
     t_str = '%.2fs' % (i * tick_duration_secs)
     times.append((dots_per_tick - len(t_str)) * ' ' + t_str)
   times_line = ''.join(times)
@@ -19,37 +19,6 @@ import unittest
 from audio_sync import plot
 
 
-class IntersectsTest(unittest.TestCase):
-
-  def _CheckIntersection(self, expected_val, range1, range2):
-    self.assertEqual(expected_val, plot._Intersects(range1, range2))
-    self.assertEqual(expected_val, plot._Intersects(range2, range1))
-
-  def testInvalidRange(self):
-    with self.assertRaises(ValueError):
-      plot._Intersects((2, 1), (1, 2))
-    with self.assertRaises(ValueError):
-      plot._Intersects((1, 2), (2, 1))
-    with self.assertRaises(ValueError):
-      plot._Intersects((1, 2), (1, -2))
-    with self.assertRaises(ValueError):
-      plot._Intersects((1, -2), (1, 2))
-
-  def testIntersection(self):
-    self._CheckIntersection(True, (1, 2), (1, 3))  # Containment.
-    self._CheckIntersection(True, (1, 3), (2, 3))  # Right overlap.
-    self._CheckIntersection(True, (1, 3), (0, 2))  # Left overlap.
-
-  def testNegativeIntersection(self):
-    self._CheckIntersection(True, (-1, 2), (-2, 3))  # Containment.
-    self._CheckIntersection(True, (-1, 3), (2, 4))  # Right overlap.
-    self._CheckIntersection(True, (-3, -1), (-5, -2))  # Left overlap.
-
-  def testNoIntersection(self):
-    self._CheckIntersection(False, (1, 3), (4, 5))
-    self._CheckIntersection(False, (1, 3), (3, 4))  # Boundaries
-
-
 class PlotTest(unittest.TestCase):
 
   def testGetTimeline(self):
@@ -60,9 +29,13 @@ class PlotTest(unittest.TestCase):
         (0.1999, 0.2106), (1.3432, 1.375), (1.4432, 1.95)]
     conditions = plot.GetConditionsInTimeframe(
         latencies, dropouts, 2.0, 40, 0.02)
+    rows = plot.GetPlotString(conditions, 2.0, 4).split('\n')
     self.assertEqual(
-        ''.join(*zip(*conditions)),
+        rows[plot.NUM_CONDITIONS - 1],
         '...oo...............<.....ooooooooooooo.')
+    self.assertEqual(
+        rows[plot.NUM_CONDITIONS - 2],
+        '                          >             ')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,233 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Timers and counters of the stages of an analysis.
+
+The analysis functions take an optional Instrumentation. Without one, they
+use NULL_INSTRUMENTATION, whose methods do nothing, so the cost of the
+instrumentation is a few method calls per chunk.
+"""
+
+import collections
+import time
+import timeit
+
+
+# Stages of the analysis, in the order they are run
+STAGE_READ = 'read'
+STAGE_DECODE = 'decode'
+STAGE_PULSE_SEARCH = 'pulse_search'
+STAGE_LATENCY = 'latency'
+STAGE_DROPOUT = 'dropout'
+STAGES = (STAGE_READ, STAGE_DECODE, STAGE_PULSE_SEARCH, STAGE_LATENCY,
+          STAGE_DROPOUT)
+# The whole analysis, including the stages and the time between them
+STAGE_ANALYSIS = 'analysis'
+
+# Counters
+COUNTER_CHUNKS = 'chunks'
+COUNTER_CACHED_CHUNKS = 'cached_chunks'
+COUNTER_WINDOWS = 'windows'
+COUNTER_INVALID_WINDOWS = 'invalid_windows'
+COUNTER_BYTES_READ = 'bytes_read'
+COUNTER_CACHED_RESULTS = 'cached_results'
+# Pulses found around their predicted position by the tracked pulse search,
+# and predictions which missed, after which every sample is searched
+COUNTER_TRACKED_PULSES = 'tracked_pulses'
+COUNTER_LOST_LOCKS = 'lost_locks'
+
+# Peak values
+PEAK_READ_BUFFER_BYTES = 'read_buffer_bytes'
+PEAK_SIGNAL_BUFFER_BYTES = 'signal_buffer_bytes'
+
+# Last values
+# Drift of the reference signal estimated by the tracked pulse search (ppm)
+VALUE_DRIFT_PPM = 'drift_ppm'
+
+# Clock of the CPU time of the process. time.clock() was removed in Python 3.8.
+_GetCpuTime = (time.process_time if hasattr(time, 'process_time')
+               else time.clock)
+
+
+class _StageTimer(object):
+  """Context manager adding the time it runs to a stage."""
+
+  def __init__(self, instrumentation, stage):
+    self._instrumentation = instrumentation
+    self._stage = stage
+    self._wall_start = None
+    self._cpu_start = None
+
+  def __enter__(self):
+    self._wall_start = timeit.default_timer()
+    self._cpu_start = _GetCpuTime()
+
+  def __exit__(self, *_):
+    self._instrumentation.AddTime(
+        self._stage, timeit.default_timer() - self._wall_start,
+        _GetCpuTime() - self._cpu_start)
+
+
+class _NullStageTimer(object):
+  """Context manager doing nothing."""
+
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *_):
+    pass
+
+
+_NULL_STAGE_TIMER = _NullStageTimer()
+
+
+class Instrumentation(object):
+  """Wall and CPU time spent in each stage, counters, peak and last values."""
+
+  def __init__(self):
+    self._wall_secs = collections.defaultdict(float)
+    self._cpu_secs = collections.defaultdict(float)
+    self._calls = collections.defaultdict(int)
+    self._counters = collections.defaultdict(int)
+    self._peaks = collections.defaultdict(int)
+    self._values = {}
+
+  def Time(self, stage):
+    """Gets a context manager timing the code it runs as part of a stage.
+
+    Args:
+      stage: (string) the stage, one of STAGES.
+
+    Returns:
+      A context manager.
+    """
+    return _StageTimer(self, stage)
+
+  def AddTime(self, stage, wall_secs, cpu_secs):
+    """Adds time spent in a stage."""
+    self._wall_secs[stage] += wall_secs
+    self._cpu_secs[stage] += cpu_secs
+    self._calls[stage] += 1
+
+  def Count(self, counter, value=1):
+    """Adds |value| to a counter."""
+    self._counters[counter] += value
+
+  def RecordPeak(self, peak, value):
+    """Keeps the max of the values of a peak."""
+    self._peaks[peak] = max(self._peaks[peak], value)
+
+  def SetValue(self, name, value):
+    """Keeps the last of the values of an estimate."""
+    self._values[name] = value
+
+  def Merge(self, other):
+    """Adds the times and counters of another Instrumentation to this one.
+
+    Used to gather the instrumentation of worker processes. The times of the
+    stages are added, so they can be more than the time the analysis took.
+    The values of |other| replace the ones of this instrumentation.
+
+    Args:
+      other: (Instrumentation) the other instrumentation.
+    """
+    report = other.GetReport()
+    for stage, times in report['stages'].items():
+      self._wall_secs[stage] += times['wall_secs']
+      self._cpu_secs[stage] += times['cpu_secs']
+      self._calls[stage] += times['calls']
+    for counter, value in report['counters'].items():
+      self.Count(counter, value)
+    for peak, value in report['peaks'].items():
+      self.RecordPeak(peak, value)
+    for name, value in report['values'].items():
+      self.SetValue(name, value)
+
+  def GetReport(self):
+    """Gets the times and counters.
+
+    Returns:
+      (dict) with the fields:
+        'stages': the 'wall_secs', 'cpu_secs' and number of 'calls' of each
+          stage.
+        'counters': the value of each counter.
+        'peaks': the value of each peak.
+        'values': the last value of each estimate.
+    """
+    return {
+        'stages': dict(
+            (stage, {'wall_secs': self._wall_secs[stage],
+                     'cpu_secs': self._cpu_secs[stage],
+                     'calls': self._calls[stage]})
+            for stage in self._calls),
+        'counters': dict(self._counters),
+        'peaks': dict(self._peaks),
+        'values': dict(self._values),
+    }
+
+
+class _NullInstrumentation(object):
+  """Instrumentation doing nothing, see Instrumentation for the methods.
+
+  It is the only false instrumentation, so that work only needed by an
+  actual Instrumentation can be skipped.
+  """
+
+  def __nonzero__(self):
+    return False
+
+  __bool__ = __nonzero__
+
+  def Time(self, unused_stage):
+    return _NULL_STAGE_TIMER
+
+  def AddTime(self, unused_stage, unused_wall_secs, unused_cpu_secs):
+    pass
+
+  def Count(self, unused_counter, unused_value=1):
+    pass
+
+  def RecordPeak(self, unused_peak, unused_value):
+    pass
+
+  def SetValue(self, unused_name, unused_value):
+    pass
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
+
+
+def FormatReport(report):
+  """Formats a report returned by Instrumentation.GetReport() as text.
+
+  Args:
+    report: (dict) the report.
+
+  Returns:
+    (string) one line per stage, counter, peak and value.
+  """
+  lines = ['%-14s %10s %10s %8s' % ('stage', 'wall secs', 'cpu secs',
+                                    'calls')]
+  stages = report['stages']
+  for stage in STAGES + tuple(sorted(set(stages) - set(STAGES))):
+    if stage in stages:
+      lines.append('%-14s %10.3f %10.3f %8d' % (
+          stage, stages[stage]['wall_secs'], stages[stage]['cpu_secs'],
+          stages[stage]['calls']))
+  for values in (report['counters'], report['peaks']):
+    for key in sorted(values):
+      lines.append('%-25s %d' % (key, values[key]))
+  for key in sorted(report['values']):
+    lines.append('%-25s %.3f' % (key, report['values'][key]))
+  return '\n'.join(lines)
@@ -0,0 +1,148 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the profiling module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import generator
+from audio_sync import profiling
+
+SETTINGS = analyzer.AnalysisSettings(0.1, 0.002, 0.5, 0.05, 0.005)
+GENERATOR_SETTINGS = generator.DEFAULT_GENERATOR_SETTINGS._replace(
+    samp_rate=8000)
+
+
+class InstrumentationTest(unittest.TestCase):
+  """Tests for the Instrumentation class."""
+
+  def testTimeCountAndPeak(self):
+    instrumentation = profiling.Instrumentation()
+    for _ in range(3):
+      with instrumentation.Time(profiling.STAGE_READ):
+        sum(range(1000))
+    instrumentation.Count(profiling.COUNTER_CHUNKS)
+    instrumentation.Count(profiling.COUNTER_BYTES_READ, 10)
+    instrumentation.Count(profiling.COUNTER_BYTES_READ, 20)
+    instrumentation.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES, 20)
+    instrumentation.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES, 10)
+
+    report = instrumentation.GetReport()
+    self.assertEqual([profiling.STAGE_READ], list(report['stages']))
+    self.assertEqual(3, report['stages'][profiling.STAGE_READ]['calls'])
+    self.assertGreater(report['stages'][profiling.STAGE_READ]['wall_secs'], 0)
+    self.assertEqual({profiling.COUNTER_CHUNKS: 1,
+                      profiling.COUNTER_BYTES_READ: 30}, report['counters'])
+    self.assertEqual({profiling.PEAK_READ_BUFFER_BYTES: 20}, report['peaks'])
+
+  def testMerge(self):
+    instrumentation = profiling.Instrumentation()
+    instrumentation.AddTime(profiling.STAGE_READ, 1.0, 0.5)
+    instrumentation.Count(profiling.COUNTER_CHUNKS, 2)
+    instrumentation.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES, 10)
+    instrumentation.SetValue(profiling.VALUE_DRIFT_PPM, 1.5)
+    other = profiling.Instrumentation()
+    other.AddTime(profiling.STAGE_READ, 2.0, 1.5)
+    other.AddTime(profiling.STAGE_DECODE, 1.0, 1.0)
+    other.Count(profiling.COUNTER_CHUNKS, 3)
+    other.RecordPeak(profiling.PEAK_READ_BUFFER_BYTES, 20)
+    other.SetValue(profiling.VALUE_DRIFT_PPM, -2.5)
+
+    instrumentation.Merge(other)
+    report = instrumentation.GetReport()
+    self.assertEqual({'wall_secs': 3.0, 'cpu_secs': 2.0, 'calls': 2},
+                     report['stages'][profiling.STAGE_READ])
+    self.assertEqual({'wall_secs': 1.0, 'cpu_secs': 1.0, 'calls': 1},
+                     report['stages'][profiling.STAGE_DECODE])
+    self.assertEqual({profiling.COUNTER_CHUNKS: 5}, report['counters'])
+    self.assertEqual({profiling.PEAK_READ_BUFFER_BYTES: 20}, report['peaks'])
+    self.assertEqual({profiling.VALUE_DRIFT_PPM: -2.5}, report['values'])
+
+  def testNullInstrumentation(self):
+    self.assertFalse(profiling.NULL_INSTRUMENTATION)
+    with profiling.NULL_INSTRUMENTATION.Time(profiling.STAGE_READ):
+      profiling.NULL_INSTRUMENTATION.Count(profiling.COUNTER_CHUNKS)
+
+  def testFormatReport(self):
+    instrumentation = profiling.Instrumentation()
+    instrumentation.AddTime(profiling.STAGE_ANALYSIS, 2.0, 1.0)
+    instrumentation.AddTime(profiling.STAGE_DECODE, 1.0, 0.5)
+    instrumentation.AddTime(profiling.STAGE_READ, 1.0, 0.5)
+    instrumentation.Count(profiling.COUNTER_CHUNKS, 4)
+    lines = profiling.FormatReport(instrumentation.GetReport()).split('\n')
+    self.assertEqual(5, len(lines))
+    self.assertEqual(
+        [profiling.STAGE_READ, profiling.STAGE_DECODE,
+         profiling.STAGE_ANALYSIS, profiling.COUNTER_CHUNKS],
+        [line.split()[0] for line in lines[1:]])
+
+
+class AnalysisInstrumentationTest(unittest.TestCase):
+  """Tests for the instrumentation of the analysis."""
+
+  @classmethod
+  def setUpClass(cls):
+    cls._temp_dir = tempfile.mkdtemp()
+    cls._ref_path = os.path.join(cls._temp_dir, 'ref.wav')
+    cls._act_path = os.path.join(cls._temp_dir, 'act.wav')
+    generator.WriteTestAudio(cls._ref_path, 30, GENERATOR_SETTINGS)
+    generator.WriteTestAudio(
+        cls._act_path, 30, GENERATOR_SETTINGS,
+        [generator.Impairments(dropouts=[(5, 6), (20, 22)])], seed=1)
+
+  @classmethod
+  def tearDownClass(cls):
+    shutil.rmtree(cls._temp_dir)
+
+  def _GetReport(self, jobs):
+    instrumentation = profiling.Instrumentation()
+    audio_sync.AnalyzeAudios(self._ref_path, self._act_path, SETTINGS,
+                             jobs=jobs, instrumentation=instrumentation)
+    return instrumentation.GetReport()
+
+  def testCounters(self):
+    report = self._GetReport(jobs=1)
+    num_samples = 30 * GENERATOR_SETTINGS.samp_rate
+    positions = analyzer._GetChunkPositions(
+        num_samples, GENERATOR_SETTINGS.samp_rate, SETTINGS)
+    samples_per_chunk = analyzer._GetSamplesPerChunk(
+        GENERATOR_SETTINGS.samp_rate, SETTINGS)
+    samples_read = sum(min(samples_per_chunk, num_samples - position)
+                       for position in positions)
+
+    self.assertEqual(len(positions), report['counters'][
+        profiling.COUNTER_CHUNKS])
+    self.assertGreater(report['counters'][profiling.COUNTER_WINDOWS], 0)
+    # One window per period of the dropouts
+    self.assertEqual(30, report['counters'][
+        profiling.COUNTER_INVALID_WINDOWS])
+    self.assertEqual(
+        2 * samples_read * GENERATOR_SETTINGS.sample_width,
+        report['counters'][profiling.COUNTER_BYTES_READ])
+    self.assertEqual(set(profiling.STAGES), set(report['stages']))
+    for stage in (profiling.STAGE_READ, profiling.STAGE_DECODE):
+      self.assertEqual(2 * len(positions), report['stages'][stage]['calls'])
+
+  def testCountersOfProcessesAreMerged(self):
+    report = self._GetReport(jobs=2)
+    self.assertEqual(self._GetReport(jobs=1)['counters'], report['counters'])
+
+
+if __name__ == '__main__':
+  unittest.main()
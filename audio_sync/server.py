@@ -0,0 +1,308 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Long-lived server analyzing pairs of files for local clients.
+
+Starting a CLI process for each short recording costs more than analyzing
+it, as numpy has to be imported and the analysis state rebuilt every time.
+The server instead keeps a pool of worker processes which have done that
+once, and analyzes the pairs sent to it over HTTP on localhost:
+  - POST ANALYZE_PATH with a JSON object with the fields of a batch manifest
+    row (see batch.ReadManifest()), and optionally 'use_mmap'. The response
+    is the record of batch.AnalyzeRow(), with the 'latency_stats' of the
+    latencies (the LATENCY_STATS_FIELDS, see LatencySeries.GetStats()), the
+    'queue_secs' waited for a worker and the 'analysis_secs' spent
+    analyzing, so that the clients don't need numpy. Its status is 200, 400
+    for invalid requests, 500 if the analysis failed, or 503 if the queue is
+    full.
+  - GET STATS_PATH gets the stats of the server, see GetStats().
+
+At most |workers| pairs are analyzed at a time, and at most |max_queue|
+more wait for a worker. Further requests are rejected rather than queued,
+so that a burst of requests can't make the server hold an unbounded number
+of them. See the client module for the other side.
+"""
+from __future__ import division
+
+import collections
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+import numpy
+
+from audio_sync import batch
+from audio_sync import latency_series
+
+try:
+  from http import server as http_server
+  import socketserver
+except ImportError:
+  # Python 2
+  import BaseHTTPServer as http_server
+  import SocketServer as socketserver
+
+
+# The server only listens to local clients.
+LOCALHOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Number of requests which can wait for a worker by default
+DEFAULT_MAX_QUEUE = 16
+ANALYZE_PATH = '/analyze'
+STATS_PATH = '/stats'
+# Number of the last jobs whose durations are used for the percentiles
+MAX_RECENT_JOBS = 1000
+# Percentiles of the durations of the jobs in the stats
+JOB_PERCENTILES = (50, 95, 99)
+# Fields of the latency stats of the responses, in the order of
+# LatencySeries.GetStats()
+LATENCY_STATS_FIELDS = ('max_latency', 'min_latency', 'mean_latency')
+
+HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
+HTTP_NOT_FOUND = 404
+HTTP_INTERNAL_SERVER_ERROR = 500
+HTTP_SERVICE_UNAVAILABLE = 503
+
+
+def _InitWorker():
+  """Leaves the interruptions to the server process.
+
+  The server process stops the workers.
+  """
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _WarmUp(_):
+  """Does nothing, so that the workers import the analysis modules."""
+
+
+def _AnalyzeTimedRow(task):
+  """Analyzes a row like batch.AnalyzeRow(), and times the analysis.
+
+  Returns:
+    A 3-tuple with the time the analysis started and ended, in seconds since
+    the epoch, and the record of the row, with the 'latency_stats'.
+  """
+  start_time = time.time()
+  record = batch.AnalyzeRow(task)
+  if 'latencies' in record:
+    record['latency_stats'] = dict(zip(
+        LATENCY_STATS_FIELDS, latency_series.LatencySeries.FromPairs(
+            record['latencies']).GetStats()))
+  return start_time, time.time(), record
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http_server.HTTPServer):
+  """HTTP server handling each request in a thread."""
+  daemon_threads = True
+
+
+class _RequestHandler(http_server.BaseHTTPRequestHandler):
+  """Handler of the requests to an AnalysisServer."""
+
+  def _SendJson(self, status, obj):
+    body = json.dumps(obj).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    if self.path != STATS_PATH:
+      self._SendJson(HTTP_NOT_FOUND, {'error': 'Unknown path %s.' % self.path})
+      return
+    self._SendJson(HTTP_OK, self.server.analysis_server.GetStats())
+
+  def do_POST(self):  # pylint: disable=invalid-name
+    if self.path != ANALYZE_PATH:
+      self._SendJson(HTTP_NOT_FOUND, {'error': 'Unknown path %s.' % self.path})
+      return
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    try:
+      row = json.loads(body.decode('utf-8'))
+      if not isinstance(row, dict):
+        raise ValueError('The request is not a JSON object.')
+      for field in batch.REQUIRED_FIELDS:
+        if field not in row:
+          raise ValueError('The request has no %s.' % field)
+      for field in batch.NUMERIC_SETTINGS_FIELDS:
+        if field in row:
+          row[field] = float(row[field])
+    except (TypeError, ValueError) as e:
+      self._SendJson(HTTP_BAD_REQUEST, {'error': str(e)})
+      return
+    self._SendJson(*self.server.analysis_server.Analyze(row))
+
+  def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+    logging.debug(format, *args)
+
+
+class AnalysisServer(object):
+  """Serves the analysis of pairs of files with a pool of warm workers."""
+
+  def __init__(self, default_settings, port=DEFAULT_PORT, workers=None,
+               max_queue=DEFAULT_MAX_QUEUE, use_mmap=False,
+               analysis_cache=None):
+    """Starts the workers and listens on |port| of LOCALHOST.
+
+    Args:
+      default_settings: (dict) value of each of batch.SETTINGS_FIELDS for
+        the requests without it.
+      port: (int) port to listen on, or 0 for any free port.
+      workers: (int) number of worker processes, or None to use every CPU.
+      max_queue: (int) number of requests which can wait for a worker.
+      use_mmap: (bool) whether to read the files through memory maps (see
+        wave_reader.MmapWaveReader), unless a request sets 'use_mmap'.
+      analysis_cache: (cache.DirectoryCache) cache shared by the workers,
+        see audio_sync.AnalyzeAudios().
+    """
+    self._default_settings = default_settings
+    self._workers = workers or multiprocessing.cpu_count()
+    self._max_queue = max_queue
+    self._use_mmap = use_mmap
+    self._analysis_cache = analysis_cache
+    self._pool = multiprocessing.Pool(self._workers, _InitWorker)
+    self._pool.map(_WarmUp, range(self._workers))
+
+    self._lock = threading.Lock()
+    self._start_time = time.time()
+    self._num_pending = 0
+    self._max_pending = 0
+    self._num_completed = 0
+    self._num_failed = 0
+    self._num_rejected = 0
+    self._sum_job_secs = 0.0
+    self._sum_queue_secs = 0.0
+    self._max_job_secs = 0.0
+    self._recent_job_secs = collections.deque(maxlen=MAX_RECENT_JOBS)
+
+    self._http_server = _ThreadingHTTPServer((LOCALHOST, port),
+                                             _RequestHandler)
+    self._http_server.analysis_server = self
+
+  @property
+  def address(self):
+    """(string) the 'host:port' the server listens on."""
+    return '%s:%d' % self._http_server.server_address[:2]
+
+  def _Admit(self):
+    """Reserves a place for a job, or returns False if the queue is full."""
+    with self._lock:
+      if self._num_pending >= self._workers + self._max_queue:
+        self._num_rejected += 1
+        return False
+      self._num_pending += 1
+      self._max_pending = max(self._max_pending, self._num_pending)
+      return True
+
+  def Analyze(self, row):
+    """Analyzes the pair of a request in a worker.
+
+    Args:
+      row: (dict) the request, like a row of a batch manifest.
+
+    Returns:
+      A 2-tuple with the HTTP status and the response, see the module doc
+      comment.
+    """
+    if not self._Admit():
+      return HTTP_SERVICE_UNAVAILABLE, {
+          'error': 'The queue of %d jobs is full.' % self._max_queue}
+
+    submit_time = time.time()
+    try:
+      task = (row, self._default_settings,
+              bool(row.get('use_mmap', self._use_mmap)), self._analysis_cache)
+      start_time, end_time, record = self._pool.apply_async(
+          _AnalyzeTimedRow, (task,)).get()
+    except Exception as e:  # pylint: disable=broad-except
+      start_time = end_time = time.time()
+      record = dict(row, error='%s: %s' % (type(e).__name__, e))
+    record['queue_secs'] = max(0.0, start_time - submit_time)
+    record['analysis_secs'] = end_time - start_time
+
+    with self._lock:
+      self._num_pending -= 1
+      if 'error' in record:
+        self._num_failed += 1
+      else:
+        self._num_completed += 1
+      job_secs = time.time() - submit_time
+      self._sum_job_secs += job_secs
+      self._sum_queue_secs += record['queue_secs']
+      self._max_job_secs = max(self._max_job_secs, job_secs)
+      self._recent_job_secs.append(job_secs)
+    if 'error' in record:
+      return HTTP_INTERNAL_SERVER_ERROR, record
+    return HTTP_OK, record
+
+  def GetStats(self):
+    """Gets the stats of the server.
+
+    Returns:
+      (dict) the number of workers, the size of the queue, the number of
+      pending jobs (running or queued) now and at most, the number of
+      completed, failed and rejected jobs, the throughput in jobs per
+      second since the server started, and the mean, max and percentiles
+      (over the last MAX_RECENT_JOBS jobs) of the time from the request to
+      the response of each job, in seconds.
+    """
+    with self._lock:
+      uptime_secs = time.time() - self._start_time
+      num_jobs = self._num_completed + self._num_failed
+      job_secs = {'mean': float('NaN'), 'max': float('NaN')}
+      mean_queue_secs = float('NaN')
+      if num_jobs:
+        job_secs['mean'] = self._sum_job_secs / num_jobs
+        job_secs['max'] = self._max_job_secs
+        mean_queue_secs = self._sum_queue_secs / num_jobs
+        for percentile, value in zip(JOB_PERCENTILES, numpy.percentile(
+            list(self._recent_job_secs), JOB_PERCENTILES).tolist()):
+          job_secs['p%d' % percentile] = value
+      return {
+          'uptime_secs': uptime_secs,
+          'workers': self._workers,
+          'max_queue': self._max_queue,
+          'pending_jobs': self._num_pending,
+          'queued_jobs': max(0, self._num_pending - self._workers),
+          'max_pending_jobs': self._max_pending,
+          'completed_jobs': self._num_completed,
+          'failed_jobs': self._num_failed,
+          'rejected_jobs': self._num_rejected,
+          'jobs_per_sec': num_jobs / uptime_secs if uptime_secs else 0.0,
+          'job_secs': job_secs,
+          'mean_queue_secs': mean_queue_secs,
+      }
+
+  def ServeForever(self):
+    """Handles requests until Shutdown() or an interruption.
+
+    The workers are then stopped.
+    """
+    try:
+      self._http_server.serve_forever()
+    finally:
+      self._http_server.server_close()
+      self._pool.terminate()
+      self._pool.join()
+
+  def Shutdown(self):
+    """Makes ServeForever() return. Must be called from another thread."""
+    self._http_server.shutdown()
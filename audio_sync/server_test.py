@@ -0,0 +1,134 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the server and client modules."""
+
+import os
+import socket
+import threading
+import time
+import unittest
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import client
+from audio_sync import server
+
+TEST_DATA_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'test_data')
+REF_PATH = os.path.join(TEST_DATA_DIR, 'dropout_ref_0.wav')
+ACT_PATH = os.path.join(TEST_DATA_DIR, 'dropout_act_1.wav')
+DEFAULT_SETTINGS = {
+    'period': 0.3,
+    'pulse_length': 0.002,
+    'dropout_threshold': 0.3,
+    'silence_threshold': 0.05,
+    'min_silence_length': 0.005,
+    'pulse_search': analyzer.PULSE_SEARCH_FULL,
+    'latency_threshold': 0.001,
+}
+
+
+class AnalysisServerTest(unittest.TestCase):
+  """Tests for the AnalysisServer class through the client."""
+
+  def setUp(self):
+    self._server = server.AnalysisServer(DEFAULT_SETTINGS, port=0, workers=2,
+                                         max_queue=1)
+    self._thread = threading.Thread(target=self._server.ServeForever)
+    self._thread.start()
+
+  def tearDown(self):
+    self._server.Shutdown()
+    self._thread.join()
+
+  def testAnalyze(self):
+    record = client.Analyze(self._server.address, {
+        'ref_wav_path': REF_PATH, 'act_wav_path': ACT_PATH, 'id': 'pair'})
+    latencies, dropouts = audio_sync.AnalyzeAudios(
+        REF_PATH, ACT_PATH, analyzer.AnalysisSettings(0.3, 0.002, 0.3, 0.05,
+                                                      0.005))
+    # repr() compares the NaN latencies too.
+    self.assertEqual(repr(list(latencies)), repr(
+        [tuple(latency) for latency in record['latencies']]))
+    self.assertEqual(dropouts, [tuple(dropout)
+                                for dropout in record['dropouts']])
+    self.assertEqual('pair', record['id'])
+    self.assertGreaterEqual(record['queue_secs'], 0)
+    self.assertGreater(record['analysis_secs'], 0)
+
+    stats = client.GetStats(self._server.address)
+    self.assertEqual(1, stats['completed_jobs'])
+    self.assertEqual(0, stats['pending_jobs'])
+    self.assertEqual(1, stats['max_pending_jobs'])
+    self.assertGreater(stats['jobs_per_sec'], 0)
+    self.assertEqual(stats['job_secs']['max'], stats['job_secs']['p50'])
+
+  def testErrors(self):
+    with self.assertRaises(client.ServerError):
+      client.Analyze(self._server.address, {'ref_wav_path': REF_PATH})
+    with self.assertRaises(client.ServerError):
+      client.Analyze(self._server.address, {
+          'ref_wav_path': REF_PATH, 'act_wav_path': ACT_PATH,
+          'period': 'long'})
+    with self.assertRaises(client.ServerError):
+      client.Analyze(self._server.address, {
+          'ref_wav_path': REF_PATH, 'act_wav_path': 'missing.wav'})
+    self.assertEqual(1, client.GetStats(self._server.address)['failed_jobs'])
+
+  def testQueueIsBounded(self):
+    # The 2 workers and the place in the queue are taken.
+    for _ in range(3):
+      self.assertTrue(self._server._Admit())
+    with self.assertRaises(client.ServerError):
+      client.Analyze(self._server.address, {
+          'ref_wav_path': REF_PATH, 'act_wav_path': ACT_PATH},
+                     timeout_secs=0.2)
+    stats = client.GetStats(self._server.address)
+    self.assertEqual(1, stats['queued_jobs'])
+    self.assertGreater(stats['rejected_jobs'], 1)
+
+
+class ClientTest(unittest.TestCase):
+  """Tests for the timeouts of the client module."""
+
+  def setUp(self):
+    # A server which accepts connections but never responds.
+    self._socket = socket.socket()
+    self._socket.bind(('localhost', 0))
+    self._socket.listen(1)
+    self._address = 'localhost:%d' % self._socket.getsockname()[1]
+
+  def tearDown(self):
+    self._socket.close()
+
+  def testResultTimeout(self):
+    start = time.time()
+    with self.assertRaises(client.ServerError):
+      client.Analyze(self._address, {
+          'ref_wav_path': REF_PATH, 'act_wav_path': ACT_PATH},
+                     timeout_secs=0, result_timeout_secs=0.2)
+    self.assertLess(time.time() - start, client.DEFAULT_CONNECT_TIMEOUT_SECS)
+
+  def testUnreachableServer(self):
+    address = self._address
+    self._socket.close()
+    with self.assertRaises(client.ServerError):
+      client.Analyze(address, {'ref_wav_path': REF_PATH})
+    with self.assertRaises(client.ServerError):
+      client.GetStats(address)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -13,6 +13,7 @@
 #     limitations under the License.
 
 """Module to read wave files."""
+import mmap
 import os
 import struct
 import wave
@@ -20,6 +21,18 @@ import wave
 import numpy
 
 
+# Format tags of the fmt chunk of a RIFF/WAVE file.
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Widths in bytes of the floating point samples which can be read
+FLOAT_SAMPLE_WIDTHS = (4, 8)
+# Bit to Byte conversion
+BITS_PER_BYTE = 8
+# Value of silence in the unsigned 8-bit samples of WAV files
+U8_SAMPLE_OFFSET = 128
+
+
 class Error(Exception):
   pass
 
@@ -68,6 +81,88 @@ def _GetFormatCharForStructUnpack(int_width):
   return format_char if is_signed else format_char.upper()
 
 
+def _GetSampleDtype(sample_width, is_float=False):
+  """Gets the dtype of the arrays of decoded samples.
+
+  Args:
+    sample_width: (int) width of the samples in the file in bytes.
+    is_float: (bool) whether the samples are IEEE floats instead of PCM.
+
+  Returns:
+    (numpy.dtype) the dtype. 24-bit samples are decoded to 32-bit integers,
+    and unsigned 8-bit ones to signed 16-bit integers.
+
+  Raises:
+    ValueError: if the width is not supported.
+  """
+  if is_float:
+    if sample_width not in FLOAT_SAMPLE_WIDTHS:
+      raise ValueError('Invalid float width %d.' % sample_width)
+    return numpy.dtype('<f%d' % sample_width)
+  if sample_width == 3:
+    return numpy.dtype('<i4')
+  if sample_width == 1:
+    return numpy.dtype('<i2')
+  return numpy.dtype('<%s' % _GetFormatCharForStructUnpack(sample_width))
+
+
+def DecodeSamples(data, sample_width, is_float=False, count=-1, offset=0):
+  """Decodes packed little-endian samples to an array.
+
+  Samples of 2 and 4 bytes and floats are not copied: the array is a view of
+  |data|. 24-bit samples are assembled into 32-bit integers with the same
+  values, without going through Python objects. 8-bit samples, which are
+  unsigned in WAV files, are centered on 0 like the others.
+
+  Args:
+    data: (buffer) the packed samples.
+    sample_width: (int) width of the samples in bytes.
+    is_float: (bool) whether the samples are IEEE floats instead of PCM.
+    count: (int) number of samples to decode, or -1 for all of them.
+    offset: (int) position of the first sample in |data|, in bytes.
+
+  Returns:
+    (numpy.ndarray) the samples, see _GetSampleDtype().
+
+  Raises:
+    ValueError: if the width is not supported.
+  """
+  dtype = _GetSampleDtype(sample_width, is_float)
+  if sample_width == 1 and not is_float:
+    return numpy.frombuffer(data, dtype=numpy.uint8, count=count,
+                            offset=offset).astype(dtype) - U8_SAMPLE_OFFSET
+  if is_float or sample_width != 3:
+    return numpy.frombuffer(data, dtype=dtype, count=count, offset=offset)
+
+  if count >= 0:
+    count *= sample_width
+  packed = numpy.frombuffer(data, dtype=numpy.uint8, count=count,
+                            offset=offset)
+  packed = packed[:len(packed) - len(packed) % sample_width].reshape(
+      -1, sample_width)
+  # Each sample is moved to the 3 most significant bytes of an int32, and
+  # shifted back to extend its sign.
+  samples = numpy.zeros((len(packed), 4), dtype=numpy.uint8)
+  samples[:, 1:] = packed
+  return samples.view(dtype).ravel() >> BITS_PER_BYTE
+
+
+def GetSampleScaler(sample_width, is_float=False):
+  """Gets the upper bound of the values of the samples, see Pcm2Float().
+
+  Args:
+    sample_width: (int) width of the samples in bytes.
+    is_float: (bool) whether the samples are IEEE floats, which are already
+      normalized to [-1, 1].
+
+  Returns:
+    (number) the scaler.
+  """
+  if is_float:
+    return 1
+  return 2 ** (BITS_PER_BYTE * sample_width - 1)
+
+
 def Pcm2Float(sig, scaler=1):
   """Convert Integer PCM signal to floating point array.
 
@@ -78,17 +173,53 @@ def Pcm2Float(sig, scaler=1):
     to assure scaler is actually a valid upper bound!
 
   Returns:
-    (list of float) floating point data.
+    (numpy.ndarray) float64 data.
   """
   # Normalize the values to [-1, 1]
-  return numpy.asarray(sig) / float(scaler)
+  return numpy.true_divide(numpy.asarray(sig), float(scaler),
+                           dtype=numpy.float64)
+
+
+def ParseFmtChunk(fmt_chunk):
+  """Parses the contents of the fmt chunk of a RIFF/WAVE file.
+
+  Args:
+    fmt_chunk: (bytes) the contents of the chunk, after its size.
+
+  Returns:
+    A 4-tuple with the number of channels, the sampling rate in Hz, the
+    width of the samples in bytes and whether they are IEEE floats.
+
+  Raises:
+    Error: if the chunk is not valid or the format is not supported.
+  """
+  if len(fmt_chunk) < 16:
+    raise Error('Invalid fmt chunk of %d bytes.' % len(fmt_chunk))
+  (format_tag, num_channels, samp_rate, _, frame_width,
+   _) = struct.unpack('<HHIIHH', fmt_chunk[:16])
+  if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt_chunk) >= 26:
+    # The actual format is at the start of the SubFormat GUID.
+    format_tag = struct.unpack('<H', fmt_chunk[24:26])[0]
+  if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+    raise Error('Unsupported format tag 0x%04x.' % format_tag)
+  if not num_channels or frame_width % num_channels:
+    raise Error('Invalid frame width %d for %d channels.' % (
+        frame_width, num_channels))
+  is_float = format_tag == WAVE_FORMAT_IEEE_FLOAT
+  sample_width = frame_width // num_channels
+  try:
+    _GetSampleDtype(sample_width, is_float)
+  except ValueError as e:
+    raise Error(str(e))
+  return num_channels, samp_rate, sample_width, is_float
 
 
 class WaveReader(object):
   """Class to read the contents of .wav files.
 
   Differs from the standard wave.wave_read in that the samples are
-  obtained as a list of ints, not as a string.
+  obtained as a list of ints or a numpy array, not as a string. The wave
+  module only reads PCM files, see MmapWaveReader for floating point ones.
   """
 
   def __init__(self, wave_read):
@@ -124,12 +255,35 @@ class WaveReader(object):
     Returns:
       (list of int) The sample list as a list of ints.
     """
+    width = self._wave_reader.getsampwidth()
+    if width in (1, 3):
+      return self.ReadSamplesArray(position_start_reading,
+                                   num_samples).tolist()
     self._wave_reader.setpos(position_start_reading)
     frames_string = self._wave_reader.readframes(num_samples)
-    width = self._wave_reader.getsampwidth()
     format_char = _GetFormatCharForStructUnpack(width)
     return _StringOfPackedNumberToList(frames_string, format_char)
 
+  def ReadSamplesArray(self, position_start_reading=0, num_samples=-1):
+    """Reads a chunk from the wave files as a numpy array.
+
+    Unlike ReadSamples(), the samples are not unpacked: the array shares
+    memory with the frames read from the file.
+
+    Args:
+      position_start_reading: (int) the position in the file from where the
+        chunk starts.
+      num_samples: (int) size of the chunk to be read. Defaults to -1,
+        meaning to read all the remaining samples.
+
+    Returns:
+      (numpy.ndarray) read-only array of samples, typed after the sample
+      width (see _GetSampleDtype()).
+    """
+    self._wave_reader.setpos(position_start_reading)
+    frames_string = self._wave_reader.readframes(num_samples)
+    return DecodeSamples(frames_string, self._wave_reader.getsampwidth())
+
   def GetSamplingRate(self):
     """Gets the sampling rate."""
     return self._wave_reader.getframerate()
@@ -142,6 +296,14 @@ class WaveReader(object):
     """Gets the framewidth in bytes."""
     return self._wave_reader.getsampwidth()
 
+  def GetSampleScaler(self):
+    """Gets the scaler normalizing the samples, see Pcm2Float()."""
+    return GetSampleScaler(self.GetSampleWidth())
+
+  def GetNumberOfChannels(self):
+    """Gets the number of interleaved channels."""
+    return self._wave_reader.getnchannels()
+
   def Rewind(self):
     """Resets the pointer position to the beginning of the file."""
     self._wave_reader.rewind()
@@ -151,14 +313,188 @@ class WaveReader(object):
     self._wave_reader.close()
 
 
-def CreateWaveReader(wave_path):
+class MmapWaveReader(object):
+  """Class to read the contents of .wav files through a memory map.
+
+  Has the same interface as WaveReader, but the RIFF header is parsed by
+  the class and ReadSamplesArray() returns views of the mapped file, so
+  reading any range of samples involves neither copies nor system calls.
+  The views must not be used after calling Close(). 24-bit samples are
+  decoded to new arrays instead.
+
+  Unlike the wave module, IEEE floating point samples (format tag 3) can be
+  read, as well as WAVE_FORMAT_EXTENSIBLE files.
+  """
+
+  def __init__(self, wave_path):
+    """Initializer.
+
+    Args:
+      wave_path: (string) path to the wave file.
+
+    Raises:
+      Error: if the file is not a valid PCM or floating point wave file.
+    """
+    with open(wave_path, 'rb') as wave_file:
+      self._mmap = mmap.mmap(wave_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      self._ParseHeader()
+    except Exception:
+      self._mmap.close()
+      raise
+
+  def _ParseHeader(self):
+    """Reads the format and the location of the samples from the header.
+
+    Raises:
+      Error: if the header is not valid or the format is not supported.
+    """
+    if self._mmap[0:4] != b'RIFF' or self._mmap[8:12] != b'WAVE':
+      raise Error('Not a RIFF/WAVE file.')
+
+    fmt_chunk = None
+    chunk_offset = 12
+    while chunk_offset + 8 <= len(self._mmap):
+      chunk_id = self._mmap[chunk_offset:chunk_offset + 4]
+      chunk_size = struct.unpack(
+          '<I', self._mmap[chunk_offset + 4:chunk_offset + 8])[0]
+      chunk_offset += 8
+      if chunk_id == b'fmt ':
+        fmt_chunk = self._mmap[chunk_offset:chunk_offset + chunk_size]
+      elif chunk_id == b'data':
+        break
+      # Chunks are word aligned.
+      chunk_offset += chunk_size + chunk_size % 2
+    else:
+      raise Error('No data chunk found.')
+
+    if fmt_chunk is None:
+      raise Error('No fmt chunk found before the data chunk.')
+    (self._num_channels, self._sampling_rate, self._sample_width,
+     self._is_float) = ParseFmtChunk(fmt_chunk)
+    self._frame_width = self._num_channels * self._sample_width
+    self._dtype = _GetSampleDtype(self._sample_width, self._is_float)
+
+    # Recordings that were interrupted may have an invalid data size, so
+    # the samples are assumed to extend until the end of the file at most.
+    self._data_offset = chunk_offset
+    data_size = min(chunk_size, len(self._mmap) - chunk_offset)
+    self._num_frames = max(data_size, 0) // self._frame_width
+
+  def __repr__(self):
+    """Return the list of samples as a string."""
+    n = self.GetNumberOfSamples()
+    samples = self.ReadSamples(0, n)
+    rate = self.GetSamplingRate()
+    width = self.GetSampleWidth()
+    return str({'rate': rate, 'width': width, 'samples': samples})
+
+  def ReadSamples(self, position_start_reading=0, num_samples=-1):
+    """Reads a chunk from the wave files.
+
+    Args:
+      position_start_reading: (int) the position in the file from where the
+        chunk starts.
+      num_samples: (int) size of the chunk to be read. Defaults to -1,
+        meaning to read all the remaining samples.
+
+    Returns:
+      (list of int) The sample list as a list of ints.
+    """
+    return self.ReadSamplesArray(position_start_reading, num_samples).tolist()
+
+  def ReadSamplesArray(self, position_start_reading=0, num_samples=-1):
+    """Reads a chunk from the wave files as a numpy array.
+
+    Args:
+      position_start_reading: (int) the position in the file from where the
+        chunk starts.
+      num_samples: (int) size of the chunk to be read. Defaults to -1,
+        meaning to read all the remaining samples.
+
+    Returns:
+      (numpy.ndarray) read-only view of the samples in the mapped file.
+    """
+    position_start_reading = min(max(position_start_reading, 0),
+                                 self._num_frames)
+    num_frames = self._num_frames - position_start_reading
+    if num_samples >= 0:
+      num_frames = min(num_frames, num_samples)
+    if num_frames <= 0:
+      return numpy.zeros(0, dtype=self._dtype)
+    return DecodeSamples(
+        self._mmap, self._sample_width, self._is_float,
+        count=num_frames * self._num_channels,
+        offset=self._data_offset + position_start_reading * self._frame_width)
+
+  def GetSamplingRate(self):
+    """Gets the sampling rate."""
+    return self._sampling_rate
+
+  def GetNumberOfSamples(self):
+    """Gets the number of frames."""
+    return self._num_frames
+
+  def GetSampleWidth(self):
+    """Gets the framewidth in bytes."""
+    return self._sample_width
+
+  def GetSampleScaler(self):
+    """Gets the scaler normalizing the samples, see Pcm2Float()."""
+    return GetSampleScaler(self._sample_width, self._is_float)
+
+  def GetNumberOfChannels(self):
+    """Gets the number of interleaved channels."""
+    return self._num_channels
+
+  def Rewind(self):
+    """Does nothing, as reads don't depend on a pointer position."""
+    pass
+
+  def Close(self):
+    """Unmaps the file."""
+    try:
+      self._mmap.close()
+    except BufferError:
+      # Arrays returned by ReadSamplesArray() still reference the map. It is
+      # unmapped once they are garbage collected.
+      pass
+
+
+def OpenWaveReader(wave_path, use_mmap=False):
+  """Opens a wave reader without checking the file.
+
+  Args:
+    wave_path: (string) path to the wave file.
+    use_mmap: (bool) whether to create a MmapWaveReader instead of a
+      WaveReader.
+
+  Returns:
+    A WaveReader or MmapWaveReader object. A MmapWaveReader is also returned
+    for the files the wave module can't read, like floating point ones.
+
+  Raises:
+    Error: if the file is not a valid wave file.
+    IOError: if the file can't be opened.
+  """
+  if use_mmap:
+    return MmapWaveReader(wave_path)
+  try:
+    return WaveReader(wave.open(wave_path))
+  except wave.Error:
+    return MmapWaveReader(wave_path)
+
+
+def CreateWaveReader(wave_path, use_mmap=False):
   """Creates a wave reader.
 
   Args:
     wave_path: (string) path to the wave file.
+    use_mmap: (bool) whether to create a MmapWaveReader instead of a
+      WaveReader.
 
   Returns:
-    A WaveReader object.
+    A WaveReader or MmapWaveReader object.
 
   Raises:
     Error: if the file doesn't exist or is empty.
@@ -167,7 +503,7 @@ def CreateWaveReader(wave_path):
     raise Error('Wave file %s doesn\'t exist.' % wave_path)
   if os.path.getsize(wave_path) == 0:
     raise Error('Wave file %s is empty.' % wave_path)
-  reader = WaveReader(wave.open(wave_path))
-  if not reader.ReadSamples():
+  reader = OpenWaveReader(wave_path, use_mmap)
+  if not len(reader.ReadSamplesArray(0, 1)):
     raise Error('No samples captured in file %s.' % wave_path)
   return reader
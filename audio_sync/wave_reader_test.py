@@ -0,0 +1,264 @@
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+"""Tests for the wave_reader module."""
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy
+
+import audio_sync
+from audio_sync import analyzer
+from audio_sync import wave_reader
+
+# Absolute path to the folder containing the handcrafted test files
+TEST_DATA_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'test_data')
+
+# 8kHz, signed 32Bit LE
+S32_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_ref_0.wav')
+# 48kHz, signed 16Bit LE
+S16_WAV_PATH = os.path.join(TEST_DATA_DIR, 'latency_ref_1.wav')
+# 24Bit samples and their little-endian encoding
+S24_SAMPLES = [-2 ** 23, -1, 0, 1, 2 ** 23 - 1, 0x123456]
+S24_DATA = (b'\x00\x00\x80' b'\xff\xff\xff' b'\x00\x00\x00' b'\x01\x00\x00'
+            b'\xff\xff\x7f' b'\x56\x34\x12')
+FLOAT_SAMPLES = [-1.0, -0.5, 0.0, 0.25, 1.0, 0.125]
+# Unsigned 8Bit samples, and their values centered on 0
+U8_DATA = b'\x00\x01\x40\x80\xc0\xff'
+U8_SAMPLES = [-128, -127, -64, 0, 64, 127]
+
+
+def _WriteWave(wave_path, data, sample_width, samp_rate=8000, num_channels=1,
+               format_tag=wave_reader.WAVE_FORMAT_PCM, extensible=False):
+  """Writes a wave file with a header built from the arguments.
+
+  The wave module can't write files which aren't PCM.
+  """
+  frame_width = sample_width * num_channels
+  fmt_chunk = struct.pack('<HHIIHH', format_tag, num_channels, samp_rate,
+                          samp_rate * frame_width, frame_width,
+                          wave_reader.BITS_PER_BYTE * sample_width)
+  if extensible:
+    fmt_chunk = struct.pack(
+        '<HHIIHHHHIH14s', wave_reader.WAVE_FORMAT_EXTENSIBLE, num_channels,
+        samp_rate, samp_rate * frame_width, frame_width,
+        wave_reader.BITS_PER_BYTE * sample_width, 22,
+        wave_reader.BITS_PER_BYTE * sample_width, 0, format_tag,
+        b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71')
+  chunks = (b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk +
+            b'data' + struct.pack('<I', len(data)) + data)
+  with open(wave_path, 'wb') as wave_file:
+    wave_file.write(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' +
+                    chunks)
+
+
+class WaveReaderTest(unittest.TestCase):
+  """Tests for the WaveReader class."""
+
+  def _CheckReadSamplesArray(self, wave_path, expected_dtype):
+    reader = wave_reader.CreateWaveReader(wave_path)
+    try:
+      for position, num_samples in ((0, -1), (0, 1000), (1234, 5000)):
+        samples = reader.ReadSamplesArray(position, num_samples)
+        self.assertEqual(expected_dtype, samples.dtype.name)
+        self.assertEqual(reader.ReadSamples(position, num_samples),
+                         samples.tolist())
+    finally:
+      reader.Close()
+
+  def testReadSamplesArray_S32L(self):
+    """Checks 32Bit samples are read as they are by ReadSamples()."""
+    self._CheckReadSamplesArray(S32_WAV_PATH, 'int32')
+
+  def testReadSamplesArray_S16L(self):
+    """Checks 16Bit samples are read as they are by ReadSamples()."""
+    self._CheckReadSamplesArray(S16_WAV_PATH, 'int16')
+
+  def testReadSamplesArrayPastTheEnd(self):
+    """Checks no samples are returned when reading past the end."""
+    reader = wave_reader.CreateWaveReader(S16_WAV_PATH)
+    try:
+      self.assertEqual(0, len(reader.ReadSamplesArray(
+          reader.GetNumberOfSamples(), 100)))
+    finally:
+      reader.Close()
+
+  def testCreateWaveReaderOnMissingFile(self):
+    """Checks an error is raised if the file doesn't exist."""
+    with self.assertRaises(wave_reader.Error):
+      wave_reader.CreateWaveReader(os.path.join(TEST_DATA_DIR, 'missing.wav'))
+
+
+class MmapWaveReaderTest(unittest.TestCase):
+  """Tests for the MmapWaveReader class."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _CheckSameAsWaveReader(self, wave_path, expected_wave_path=None):
+    reader = wave_reader.CreateWaveReader(expected_wave_path or wave_path)
+    mmap_reader = wave_reader.CreateWaveReader(wave_path, use_mmap=True)
+    try:
+      self.assertEqual(reader.GetSamplingRate(),
+                       mmap_reader.GetSamplingRate())
+      self.assertEqual(reader.GetSampleWidth(), mmap_reader.GetSampleWidth())
+      self.assertEqual(reader.GetNumberOfSamples(),
+                       mmap_reader.GetNumberOfSamples())
+      for position, num_samples in ((0, -1), (0, 1000), (1234, 5000),
+                                    (reader.GetNumberOfSamples() - 10, 100)):
+        samples = mmap_reader.ReadSamplesArray(position, num_samples)
+        self.assertEqual(reader.ReadSamplesArray(position, num_samples).dtype,
+                         samples.dtype)
+        self.assertEqual(reader.ReadSamples(position, num_samples),
+                         samples.tolist())
+    finally:
+      mmap_reader.Close()
+      reader.Close()
+
+  def testReadSamplesArray_S32L(self):
+    """Checks 32Bit samples are the same as read by WaveReader."""
+    self._CheckSameAsWaveReader(S32_WAV_PATH)
+
+  def testReadSamplesArray_S16L(self):
+    """Checks 16Bit samples are the same as read by WaveReader."""
+    self._CheckSameAsWaveReader(S16_WAV_PATH)
+
+  def testInvalidDataSize(self):
+    """Checks samples are read until the end of file if the size is invalid.
+
+    This happens, for example, if a recording was interrupted.
+    """
+    with open(S16_WAV_PATH, 'rb') as wave_file:
+      contents = wave_file.read()
+    data_size_offset = contents.index(b'data') + 4
+    wave_path = os.path.join(self._temp_dir, 'interrupted.wav')
+    with open(wave_path, 'wb') as wave_file:
+      wave_file.write(contents[:data_size_offset] +
+                      struct.pack('<I', 0xFFFFFFFF) +
+                      contents[data_size_offset + 4:])
+    self._CheckSameAsWaveReader(wave_path, S16_WAV_PATH)
+
+  def testNotAWaveFile(self):
+    """Checks an error is raised if the file isn't a RIFF/WAVE file."""
+    wave_path = os.path.join(self._temp_dir, 'not_a_wave.wav')
+    with open(wave_path, 'wb') as wave_file:
+      wave_file.write(b'This is not a RIFF/WAVE file.')
+    with self.assertRaises(wave_reader.Error):
+      wave_reader.CreateWaveReader(wave_path, use_mmap=True)
+
+
+class SampleFormatTest(unittest.TestCase):
+  """Tests for the decoding of 24Bit and floating point samples."""
+
+  def setUp(self):
+    self._temp_dir = tempfile.mkdtemp()
+    self._wave_path = os.path.join(self._temp_dir, 'samples.wav')
+
+  def tearDown(self):
+    shutil.rmtree(self._temp_dir)
+
+  def _ReadSamples(self, use_mmap):
+    reader = wave_reader.CreateWaveReader(self._wave_path, use_mmap=use_mmap)
+    try:
+      # The arrays of a MmapWaveReader can't be used once it is closed.
+      return (numpy.array(reader.ReadSamplesArray()), reader.ReadSamples(2, 3),
+              reader.GetSampleWidth(), reader.GetSampleScaler())
+    finally:
+      reader.Close()
+
+  def testS24L(self):
+    _WriteWave(self._wave_path, S24_DATA, 3)
+    for use_mmap in (False, True):
+      samples, some_samples, sample_width, scaler = self._ReadSamples(
+          use_mmap)
+      self.assertEqual('int32', samples.dtype.name)
+      self.assertEqual(S24_SAMPLES, samples.tolist())
+      self.assertEqual(S24_SAMPLES[2:5], some_samples)
+      self.assertEqual(3, sample_width)
+      self.assertEqual(2 ** 23, scaler)
+
+  def testU8(self):
+    _WriteWave(self._wave_path, U8_DATA, 1)
+    for use_mmap in (False, True):
+      samples, some_samples, sample_width, scaler = self._ReadSamples(
+          use_mmap)
+      self.assertEqual('int16', samples.dtype.name)
+      self.assertEqual(U8_SAMPLES, samples.tolist())
+      self.assertEqual(U8_SAMPLES[2:5], some_samples)
+      self.assertEqual(1, sample_width)
+      self.assertEqual(128, scaler)
+
+  def testFloat(self):
+    for sample_width in wave_reader.FLOAT_SAMPLE_WIDTHS:
+      for extensible in (False, True):
+        _WriteWave(self._wave_path,
+                   numpy.array(FLOAT_SAMPLES, '<f%d' % sample_width).tobytes(),
+                   sample_width,
+                   format_tag=wave_reader.WAVE_FORMAT_IEEE_FLOAT,
+                   extensible=extensible)
+        # The wave module can't read them, so both are read through maps.
+        for use_mmap in (False, True):
+          samples, some_samples, _, scaler = self._ReadSamples(use_mmap)
+          self.assertEqual('float%d' % (8 * sample_width), samples.dtype.name)
+          self.assertEqual(FLOAT_SAMPLES, samples.tolist())
+          self.assertEqual(FLOAT_SAMPLES[2:5], some_samples)
+          self.assertEqual(1, scaler)
+          self.assertEqual(FLOAT_SAMPLES, wave_reader.Pcm2Float(
+              samples, scaler).tolist())
+
+  def testInvalidFloatWidth(self):
+    _WriteWave(self._wave_path, b'\x00\x00' * 4, 2,
+               format_tag=wave_reader.WAVE_FORMAT_IEEE_FLOAT)
+    with self.assertRaises(wave_reader.Error):
+      wave_reader.CreateWaveReader(self._wave_path)
+
+  def testAnalysisOfOtherFormats(self):
+    """Checks 24Bit and float files give the results of 16Bit ones."""
+    ref_path = os.path.join(TEST_DATA_DIR, 'dropout_ref_0.wav')
+    act_path = os.path.join(TEST_DATA_DIR, 'dropout_act_1.wav')
+    settings = analyzer.AnalysisSettings(0.3, 0.001, 0.3, 0.05, 0.005)
+    expected = audio_sync.AnalyzeAudios(ref_path, act_path, settings)
+
+    reader = wave_reader.CreateWaveReader(act_path)
+    try:
+      samp_rate = reader.GetSamplingRate()
+      signal = wave_reader.Pcm2Float(reader.ReadSamplesArray(),
+                                     reader.GetSampleScaler())
+    finally:
+      reader.Close()
+    s24_samples = numpy.round(signal * 2 ** 23).astype('<i4')
+    for data, sample_width, format_tag in (
+        (s24_samples.view('u1').reshape(-1, 4)[:, :3].tobytes(), 3,
+         wave_reader.WAVE_FORMAT_PCM),
+        (signal.astype('<f4').tobytes(), 4,
+         wave_reader.WAVE_FORMAT_IEEE_FLOAT)):
+      _WriteWave(self._wave_path, data, sample_width, samp_rate,
+                 format_tag=format_tag)
+      for use_mmap in (False, True):
+        latencies, dropouts = audio_sync.AnalyzeAudios(
+            ref_path, self._wave_path, settings, use_mmap=use_mmap)
+        self.assertEqual(repr(list(expected[0])), repr(list(latencies)))
+        self.assertEqual(expected[1], dropouts)
+
+
+if __name__ == '__main__':
+  unittest.main()